@@ -1,7 +1,10 @@
-import os, sys, traceback, requests
+import os, sys, traceback
 from pathlib import Path
 from datetime import datetime
+from time import perf_counter
 from dotenv import load_dotenv
+
+started = perf_counter()
 load_dotenv()
 
 Path("../logs").mkdir(exist_ok=True)
@@ -31,4 +34,7 @@ except Exception:
     report(exc_type, exc_val, exc_tb)
     raise
 
+# Cold-start budget: `python -m benchmarks.startup` breaks this down per module
+print(f"⏱  App imported in {(perf_counter() - started) * 1000:.0f}ms")
+
 __all__ = ["app"]
\ No newline at end of file
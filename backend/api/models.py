@@ -82,10 +82,36 @@ class BodySocialServicesCreateTravelPost(BaseModel):
   tags: List[str]
   city: Optional[str] = None
   booking_info: Optional[Dict] = None
+  location_coordinates: Optional[Dict] = None
 
 CreateTravelPostOutputSchema = TravelPost
     
 
+# ==================== SEARCH SCHEMAS ====================
+
+class BodySocialServicesSearchPosts(BaseModel):
+  query: str = Field(..., min_length=1, max_length=200)
+  limit: int = Field(20, ge=1, le=50)
+  cursor: Optional[str] = None
+
+SearchPostsOutputSchema = Dict
+
+class BodySocialServicesAutocompleteLocations(BaseModel):
+  prefix: str = Field(..., min_length=1, max_length=100)
+  limit: int = Field(10, ge=1, le=25)
+
+AutocompleteLocationsOutputSchema = List[Dict]
+
+class BodySocialServicesGetNearbyPosts(BaseModel):
+  lat: float = Field(..., ge=-90, le=90)
+  lng: float = Field(..., ge=-180, le=180)
+  radius_km: float = Field(10, gt=0, le=500)
+  limit: int = Field(20, ge=1, le=50)
+  cursor: Optional[str] = None
+
+GetNearbyPostsOutputSchema = Dict
+
+
 # ==================== REVIEWS SCHEMAS ====================
 
 from core.review import Review
@@ -126,3 +152,16 @@ class BodySocialServicesVoteReview(BaseModel):
   is_helpful: bool = Field(..., description="True if helpful, False if not helpful")
 
 VoteReviewOutputSchema = Dict
+
+
+# ==================== USER SERVICES SCHEMAS ====================
+
+class BodyUserServicesGetUserUuids(BaseModel):
+  clerk_user_ids: List[str] = Field(..., max_length=1000, description="Clerk user IDs to resolve")
+
+GetUserUuidsOutputSchema = Dict
+
+
+# ==================== MEDIA SCHEMAS ====================
+
+UploadMediaOutputSchema = Dict
@@ -6,11 +6,12 @@
 
 from fastapi import Depends, FastAPI, HTTPException, Request, status, Body, UploadFile, File, Form
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import HTMLResponse, Response
 
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse, Response
+from fastapi.responses import JSONResponse, FileResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi.security import OAuth2PasswordBearer
 
@@ -23,14 +24,16 @@ import contextvars
 import httpx
 import jwt
 import json
-import requests
+import random
 from pathlib import Path
+from time import perf_counter
 import builtins
 
 from datetime import datetime, date, time, timedelta
 from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, Any, TypeVar, Awaitable, List, Optional, Dict, Union, Literal, Annotated, Tuple, Set
 from functools import partial, wraps
+from contextlib import asynccontextmanager
 from uuid import UUID
 import uuid
 
@@ -38,6 +41,8 @@ import uuid
 # from solar.media import MediaFile
 
 from api.utils import get_swagger_ui_html
+from solar.http import get_async_client, post_with_retries, close_async_client
+from solar.table import close_pools, warm_pools
 from api.models import TokenExchangeRequest, TokenResponse, TokenValidationRequest, LogoutResponse
 
 OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
@@ -50,11 +55,12 @@ REFRESH_TOKEN_COOKIE_NAME = "refresh_token"
 
 
 
-from .models import BodySocialServicesGetSocialFeed, GetSocialFeedOutputSchema, BodySocialServicesLikePost, LikePostOutputSchema, BodySocialServicesSavePostToWishlist, SavePostToWishlistOutputSchema, BodySocialServicesFollowUser, FollowUserOutputSchema, BodySocialServicesGetUserSavedPosts, GetUserSavedPostsOutputSchema, BodySocialServicesGetSavedLocations, GetSavedLocationsOutputSchema, BodySocialServicesCreateTravelPost, CreateTravelPostOutputSchema, BodyAIServicesGenerateTripRecommendations, GenerateTripRecommendationsOutputSchema, BodySocialServicesCreateReview, CreateReviewOutputSchema, BodySocialServicesGetPostReviews, GetPostReviewsOutputSchema, BodySocialServicesUpdateReview, UpdateReviewOutputSchema, BodySocialServicesDeleteReview, DeleteReviewOutputSchema, BodySocialServicesVoteReview, VoteReviewOutputSchema
+from .models import BodySocialServicesGetSocialFeed, GetSocialFeedOutputSchema, BodySocialServicesLikePost, LikePostOutputSchema, BodySocialServicesSavePostToWishlist, SavePostToWishlistOutputSchema, BodySocialServicesFollowUser, FollowUserOutputSchema, BodySocialServicesGetUserSavedPosts, GetUserSavedPostsOutputSchema, BodySocialServicesGetSavedLocations, GetSavedLocationsOutputSchema, BodySocialServicesCreateTravelPost, CreateTravelPostOutputSchema, BodySocialServicesSearchPosts, SearchPostsOutputSchema, BodySocialServicesAutocompleteLocations, AutocompleteLocationsOutputSchema, BodySocialServicesGetNearbyPosts, GetNearbyPostsOutputSchema, BodyAIServicesGenerateTripRecommendations, GenerateTripRecommendationsOutputSchema, BodySocialServicesCreateReview, CreateReviewOutputSchema, BodySocialServicesGetPostReviews, GetPostReviewsOutputSchema, BodySocialServicesUpdateReview, UpdateReviewOutputSchema, BodySocialServicesDeleteReview, DeleteReviewOutputSchema, BodySocialServicesVoteReview, VoteReviewOutputSchema, BodyUserServicesGetUserUuids, GetUserUuidsOutputSchema, UploadMediaOutputSchema
 from core import social_services
 from core import ai_services
 from core import user_services
 from api import webhooks
+from solar import export, media, metrics, partitions, profiling, renditions, replicas, resilience, tracing
 
 
 ###############################################################################
@@ -84,12 +90,48 @@ def format_record(record):
     
     return fmt + "\n"
 
+def format_json(record):
+    """One JSON object per line; contextual fields (request_id, timings, ...) come from `extra`."""
+    payload = {
+        "ts": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+    }
+    payload.update({key: value for key, value in record["extra"].items() if key != "json"})
+    if record["exception"] is not None:
+        exc_type, exc_value, exc_traceback = record["exception"]
+        payload["exception"] = {
+            "type": exc_type.__name__ if exc_type else None,
+            "message": str(exc_value),
+            "traceback": "".join(traceback.format_exception(exc_type, exc_value, exc_traceback)),
+        }
+    record["extra"]["json"] = json.dumps(payload, default=str)
+    return "{extra[json]}\n"
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()  # 'json' or 'text'
+# Fraction of successful, fast requests that get an access log line; errors and slow requests are always logged
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+LOG_SLOW_REQUEST_MS = float(os.environ.get("LOG_SLOW_REQUEST_MS", "1000"))
+# A statement fingerprint repeated more than this many times in one request is logged as a likely N+1
+SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get("SQL_N_PLUS_ONE_THRESHOLD", "10"))
+# Requests still running after this long get their worker threads stack-sampled until they finish (0 disables)
+PROFILE_SLOW_REQUEST_MS = float(os.environ.get("PROFILE_SLOW_REQUEST_MS", str(LOG_SLOW_REQUEST_MS)))
+# X-DB-Query-Count / X-DB-Time-Ms response headers; on by default in the sandbox only
+SQL_TRACE_HEADERS = os.environ.get(
+    "SQL_TRACE_HEADERS", "1" if os.environ.get("ENV", "deployment") == "sandbox" else "0"
+) == "1"
+
+log_formatter = format_json if LOG_FORMAT == "json" else format_record
+
+# enqueue=True: callers only put the formatted line on a queue, a background thread does the I/O
 logger.remove()
 logger.add(
     sys.stderr,
-    level="DEBUG",
-    format=format_record,
-    colorize=True
+    level=LOG_LEVEL,
+    format=log_formatter,
+    colorize=LOG_FORMAT != "json",
+    enqueue=True
 )
 
 Path("../logs").mkdir(exist_ok=True)
@@ -97,8 +139,9 @@ logger.add(
     "../logs/fast_api.log",
     rotation="50 MB",
     retention="10 days",
-    level="DEBUG",
-    format=format_record
+    level=LOG_LEVEL,
+    format=log_formatter,
+    enqueue=True
 )
 
 # need this to capture print statements
@@ -112,6 +155,19 @@ class InterceptHandler:
 
 sys.stdout = InterceptHandler()
 
+# and this to capture the standard logging used by the solar SDK
+class StdlibInterceptHandler(logging.Handler):
+    def emit(self, record: logging.LogRecord):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+        logger.opt(exception=record.exc_info).log(level, record.getMessage())
+
+logging.basicConfig(handlers=[StdlibInterceptHandler()], level=LOG_LEVEL, force=True)
+# httpx logs every outbound request at INFO; our own call sites log what matters
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
 T = TypeVar('T')
 
 
@@ -120,9 +176,31 @@ T = TypeVar('T')
 # General App
 ##############################################################################
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = perf_counter()
+    try:
+        await asyncio.to_thread(warm_pools)
+        logger.info(f"Connection pools warmed in {(perf_counter() - started) * 1000:.0f}ms")
+    except Exception as e:
+        logger.warning(f"Connection pool warm-up failed, pools will connect on first use: {str(e)}")
+    webhooks.start_inbox_consumer()
+    partitions.start_maintenance(social_services.PARTITIONED_TABLES)
+    yield
+    # Uvicorn has stopped accepting connections and drained in-flight requests by now
+    await webhooks.stop_inbox_consumer()
+    await asyncio.to_thread(thread_pool.shutdown, wait=True)
+    await close_async_client()
+    await renditions.drain_pending()
+    renditions.shutdown_process_pool()
+    await asyncio.to_thread(close_pools)
+    metrics.mark_process_dead()
+    await logger.complete()
+
 app = FastAPI(
     title="New app — 8/15 @ 4:56 PM",
-    docs_url=None
+    docs_url=None,
+    lifespan=lifespan
 )
 
 # Include webhooks router
@@ -132,22 +210,137 @@ app.include_router(webhooks.router)
 # Simple Request Logging Middleware
 ###############################################################################
 
+def should_log_request(status_code: int, duration_ms: float) -> bool:
+    if status_code >= 400 or duration_ms >= LOG_SLOW_REQUEST_MS:
+        return True
+    return LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE
+
+def report_query_trace(trace: tracing.QueryTrace, method: str, path: str):
+    """Warn about statements repeated often enough to be an N+1 loop, and log the per-statement breakdown."""
+    for stats in trace.repeated(SQL_N_PLUS_ONE_THRESHOLD):
+        logger.bind(
+            method=method,
+            path=path,
+            table=stats["table"],
+            fingerprint=stats["fingerprint"],
+            count=stats["count"],
+            total_ms=round(stats["total_ms"], 2)
+        ).warning(f"Possible N+1: {method} {path} ran the same {stats['table']} query {stats['count']} times ({stats['total_ms']:.1f}ms)")
+    if trace.query_count:
+        logger.bind(method=method, path=path, queries=trace.fingerprints(), **trace.summary()).debug(
+            f"SQL summary for {method} {path}: {trace.query_count} queries, {trace.total_ms:.1f}ms"
+        )
+
+def route_operation(request: Request) -> str:
+    """Metrics label for the matched route: its operation_id, else its name; 'unmatched' for 404s."""
+    route = request.scope.get("route")
+    if route is None:
+        return "unmatched"
+    return getattr(route, "operation_id", None) or getattr(route, "name", None) or "unknown"
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+def finish_request_profile(request_id: str, method: str, path: str, status_code: int, duration_ms: float):
+    profile = profiling.request_sampler.finish(request_id, status=status_code, duration_ms=round(duration_ms, 2))
+    if profile is not None:
+        logger.bind(method=method, path=path, samples=profile["samples"]).warning(
+            f"Slow request profiled: {method} {path} ({duration_ms / 1000:.3f}s), see /api/admin/profiles/{request_id}"
+        )
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects request bodies over `max_body_size` on upload routes while they are received, before
+    Starlette has spooled the whole multipart body to disk: at once from Content-Length when the
+    client sends one, otherwise as soon as the running byte count passes the limit.
+    """
+
+    def __init__(self, app, paths, max_body_size: int):
+        self.app = app
+        self.paths = set(paths)
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        detail = f"Upload exceeds {self.max_body_size} bytes"
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_body_size:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # Raised while FastAPI reads the form, which lets HTTPException through as is
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+# Added before log_requests so it runs inside it: its HTTPException then reaches the route's
+# body parsing directly instead of surfacing from BaseHTTPMiddleware's task group
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/api/media/upload"], max_body_size=media.MAX_UPLOAD_BODY_SIZE)
+
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     request_id = str(uuid.uuid4())[:8]
+    request_id_var.set(request_id)
     
-    with logger.contextualize(request_id=request_id):
-        start_time = datetime.utcnow()
+    with logger.contextualize(request_id=request_id), tracing.trace_queries(request_id) as trace:
+        start_time = perf_counter()
+        slow_request_timer = None
+        if PROFILE_SLOW_REQUEST_MS > 0:
+            slow_request_timer = asyncio.get_running_loop().call_later(
+                PROFILE_SLOW_REQUEST_MS / 1000,
+                partial(profiling.request_sampler.start, request_id, method=request.method, path=request.url.path)
+            )
         
         try:
             response = await call_next(request)
-            process_time = (datetime.utcnow() - start_time).total_seconds()
-            if "HEAD /docs" not in request.url.path:
-              logger.info(f"{request.method} {request.url.path} ({response.status_code}) - {process_time:.3f}s")
+            duration_ms = (perf_counter() - start_time) * 1000
+            if slow_request_timer is not None:
+                slow_request_timer.cancel()
+                finish_request_profile(request_id, request.method, request.url.path, response.status_code, duration_ms)
+            metrics.HTTP_REQUEST_DURATION.labels(
+                route_operation(request), request.method, str(response.status_code)
+            ).observe(duration_ms / 1000)
+            response.headers["X-Request-ID"] = request_id
+            if SQL_TRACE_HEADERS:
+                response.headers["X-DB-Query-Count"] = str(trace.query_count)
+                response.headers["X-DB-Time-Ms"] = f"{trace.total_ms:.2f}"
+            report_query_trace(trace, request.method, request.url.path)
+            if "HEAD /docs" not in request.url.path and should_log_request(response.status_code, duration_ms):
+              logger.bind(
+                  method=request.method,
+                  path=request.url.path,
+                  status=response.status_code,
+                  duration_ms=round(duration_ms, 2),
+                  **trace.summary()
+              ).info(f"{request.method} {request.url.path} ({response.status_code}) - {duration_ms / 1000:.3f}s")
             return response
         except Exception as e:
-            process_time = (datetime.utcnow() - start_time).total_seconds()
-            logger.exception(f"{request.method} {request.url.path} - Failed after {process_time:.3f}s")
+            duration_ms = (perf_counter() - start_time) * 1000
+            if slow_request_timer is not None:
+                slow_request_timer.cancel()
+                finish_request_profile(request_id, request.method, request.url.path, 500, duration_ms)
+            metrics.HTTP_REQUEST_DURATION.labels(
+                route_operation(request), request.method, "500"
+            ).observe(duration_ms / 1000)
+            logger.bind(
+                method=request.method,
+                path=request.url.path,
+                duration_ms=round(duration_ms, 2),
+                **trace.summary()
+            ).exception(f"{request.method} {request.url.path} - Failed after {duration_ms / 1000:.3f}s")
             raise
             
 ###############################################################################
@@ -188,6 +381,15 @@ async def handle_errors(request: Request, exc: Exception):
         content={"error": "Internal server error", "message": str(exc)}
     )
 
+@app.exception_handler(resilience.CircuitOpenError)
+async def handle_circuit_open(request: Request, exc: resilience.CircuitOpenError):
+    logger.warning(f"{request.method} {request.url.path} - {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Service unavailable", "message": "Database temporarily unavailable, please retry"},
+        headers={"Retry-After": str(int(exc.retry_after + 0.5))},
+    )
+
 @app.exception_handler(RequestValidationError)
 async def handle_validation_errors(request: Request, exc: RequestValidationError):
     logger.warning(f"Validation error: {exc.errors()}")
@@ -267,6 +469,16 @@ async def auth_options_handler(request: Request):
 @app.head("/docs", include_in_schema=False)
 async def health_check():
     return {"status": "healthy"}
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+@app.get("/api/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Prometheus exposition; requires `Authorization: Bearer $METRICS_TOKEN` when METRICS_TOKEN is set"""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
     
 ##############################################################################
 # Synchronous Function Helpers
@@ -274,12 +486,20 @@ async def health_check():
 
 thread_pool = ThreadPoolExecutor(max_workers=4)
 
+def _run_for_request(request_id: Optional[str], func: Callable[..., Any], *args, **kwargs) -> Any:
+    # Registered so the slow-request sampler knows which thread is doing this request's work;
+    # the replica session keeps the acting user's reads on the primary right after their own writes
+    acting_user = kwargs.get("user_id") or kwargs.get("follower_id")
+    with profiling.request_sampler.request_thread(request_id), replicas.session(acting_user):
+        return func(*args, **kwargs)
+
 async def run_sync_in_thread(func: Callable[..., Any], *args, **kwargs) -> Any:
-    """Runs a synchronous function in a thread pool"""
+    """Runs a synchronous function in a thread pool, carrying over the request context (request_id, SQL trace)"""
     loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
     return await loop.run_in_executor(
         thread_pool,
-        partial(func, *args, **kwargs)
+        partial(context.run, _run_for_request, request_id_var.get(), func, *args, **kwargs)
     )
 
 
@@ -323,22 +543,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             raise HTTPException(status_code=401, detail="Malformed token")
         
         token_url = f"{base_url}/innerApp/oauth2/introspect"
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.post(token_url, json={"token": jti, "token_type_hint": "access_token"})
-            if response.status_code != 200:
-                raise HTTPException(status_code=401, detail="Unauthorized")
-            
-            json_response = response.json()
-            if not json_response.get("active", False):
-                raise HTTPException(status_code=401, detail="Unauthorized")
-            
-            user_uuid = json_response.get("userUuid")
-            email = json_response.get("email")
-            if not user_uuid or not email:
-                raise HTTPException(status_code=401, detail="Invalid user data")
-            
-            user = User(id=user_uuid, email=email)
-            return user
+        response = await get_async_client().post(token_url, json={"token": jti, "token_type_hint": "access_token"})
+        if response.status_code != 200:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        
+        json_response = response.json()
+        if not json_response.get("active", False):
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        
+        user_uuid = json_response.get("userUuid")
+        email = json_response.get("email")
+        if not user_uuid or not email:
+            raise HTTPException(status_code=401, detail="Invalid user data")
+        
+        user = User(id=user_uuid, email=email)
+        return user
     except HTTPException:
         raise
     except Exception as e:
@@ -391,13 +610,14 @@ async def exchange_token(request: Request, body: TokenExchangeRequest = Body(...
             except Exception as e:
                 logger.warning("Error extracting JTI from refresh token")
 
-        response = requests.post(
+        # Authorization codes are single-use, so only connection failures are retried
+        response = await post_with_retries(
             SOLAR_APP_TOKEN_URL,
             json=params,
             headers={"Content-Type": "application/json", "Accept": "application/json"}
         )
         
-        if not response.ok:
+        if not response.is_success:
             return JSONResponse(
                     status_code=401,
                     content={
@@ -576,11 +796,40 @@ async def social_services_create_travel_post(body: BodySocialServicesCreateTrave
     """
     Create a new travel post.
     """
-    response = await run_sync_in_thread(social_services.create_travel_post, user_id=body.user_id, caption=body.caption, images=body.images, location_name=body.location_name, country=body.country, post_type=body.post_type, category=body.category, tags=body.tags, city=body.city, booking_info=body.booking_info)
+    response = await run_sync_in_thread(social_services.create_travel_post, user_id=body.user_id, caption=body.caption, images=body.images, location_name=body.location_name, country=body.country, post_type=body.post_type, category=body.category, tags=body.tags, city=body.city, booking_info=body.booking_info, location_coordinates=body.location_coordinates)
     return response
     
     
 
+@app.post('/api/social_services/search_posts', response_model=SearchPostsOutputSchema, operation_id='social_services_search_posts')
+async def social_services_search_posts(body: BodySocialServicesSearchPosts = Body(...)) -> SearchPostsOutputSchema:
+    """
+    Search published posts by caption, location and tags, best matches first. Pass the
+    returned next_cursor to get the following page.
+    """
+    response = await run_sync_in_thread(social_services.search_posts, query=body.query, limit=body.limit, cursor=body.cursor)
+    return response
+
+
+@app.post('/api/social_services/autocomplete_locations', response_model=AutocompleteLocationsOutputSchema, operation_id='social_services_autocomplete_locations')
+async def social_services_autocomplete_locations(body: BodySocialServicesAutocompleteLocations = Body(...)) -> AutocompleteLocationsOutputSchema:
+    """
+    Suggest post locations for a partly typed or misspelled place name.
+    """
+    response = await run_sync_in_thread(social_services.autocomplete_locations, prefix=body.prefix, limit=body.limit)
+    return response
+
+
+@app.post('/api/social_services/get_nearby_posts', response_model=GetNearbyPostsOutputSchema, operation_id='social_services_get_nearby_posts')
+async def social_services_get_nearby_posts(body: BodySocialServicesGetNearbyPosts = Body(...)) -> GetNearbyPostsOutputSchema:
+    """
+    Published posts within radius_km of (lat, lng), closest first, with their distance. Pass
+    the returned next_cursor to get the following page.
+    """
+    response = await run_sync_in_thread(social_services.get_nearby_posts, lat=body.lat, lng=body.lng, radius_km=body.radius_km, limit=body.limit, cursor=body.cursor)
+    return response
+
+
 
 @app.post('/api/ai_services/generate_trip_recommendations', response_model=GenerateTripRecommendationsOutputSchema, operation_id='ai_services_generate_trip_recommendations')
 async def ai_services_generate_trip_recommendations(body: BodyAIServicesGenerateTripRecommendations = Body(...)) -> GenerateTripRecommendationsOutputSchema:
@@ -666,15 +915,166 @@ async def user_services_get_user_uuid(body: Dict = Body(...)) -> Dict:
     return {"user_id": user_uuid, "clerk_user_id": clerk_user_id}
 
 
+@app.post('/api/user_services/get_user_uuids', response_model=GetUserUuidsOutputSchema, operation_id='user_services_get_user_uuids')
+async def user_services_get_user_uuids(body: BodyUserServicesGetUserUuids = Body(...)) -> GetUserUuidsOutputSchema:
+    """
+    Resolve many Clerk user IDs to internal user UUIDs in one call.
+    """
+    user_ids = await run_sync_in_thread(user_services.get_user_uuids_by_clerk_ids, clerk_user_ids=body.clerk_user_ids)
+    return {"user_ids": user_ids}
+
+
+# ==================== MEDIA ENDPOINTS ====================
+
+@app.post('/api/media/upload', response_model=UploadMediaOutputSchema, operation_id='media_upload')
+async def media_upload(file: UploadFile = File(...)) -> UploadMediaOutputSchema:
+    """
+    Upload an image or video. The file is streamed to storage in fixed-size chunks;
+    images also get resized WebP/AVIF renditions for feeds and grids, generated after the
+    response (`renditions` is only set when the same image was uploaded before).
+    """
+    content_type = file.content_type or ""
+    if not media.is_allowed_media_type(content_type):
+        await file.close()
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported media type, expected one of {', '.join(media.ALLOWED_MEDIA_TYPES)}",
+        )
+    
+    try:
+        url = await media.save_upload_to_bucket(file)
+    except media.MediaTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except media.UnsupportedMediaTypeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    finally:
+        await file.close()
+    
+    image_renditions = None
+    if content_type.startswith("image/"):
+        image_renditions = await asyncio.to_thread(renditions.get_renditions, url)
+        if image_renditions is None:
+            renditions.schedule_renditions(url)
+    
+    return {"url": url, "mime_type": content_type, "renditions": image_renditions}
+
+
+@app.get('/media/{filename}', include_in_schema=False)
+async def serve_media(request: Request, filename: str):
+    """
+    Serve stored media straight from disk (sendfile when the server supports it, HTTP Range requests).
+    Media names never change content, so responses are immutable and revalidate by ETag.
+    """
+    etag = media.media_etag(filename)
+    cache_headers = {"ETag": etag, "Cache-Control": media.MEDIA_CACHE_CONTROL, "X-Content-Type-Options": "nosniff"}
+    
+    try:
+        file_path = media.media_file_path(filename)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Media not found")
+    
+    # The ETag is the content-addressed name: revalidation is answered without touching the file
+    if media.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=cache_headers)
+    
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="Media not found")
+    
+    return FileResponse(file_path, media_type=media.served_media_type(file_path), headers=cache_headers)
+
+
+# ==================== PROFILING ENDPOINTS ====================
+
+ADMIN_API_TOKEN = os.environ.get("ADMIN_API_TOKEN")
+MAX_PROFILE_SECONDS = 60
+
+async def require_admin(request: Request):
+    """Admin endpoints need `Authorization: Bearer $ADMIN_API_TOKEN`; without a token configured they do not exist"""
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if request.headers.get("authorization") != f"Bearer {ADMIN_API_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+@app.post('/api/admin/profile', include_in_schema=False, dependencies=[Depends(require_admin)])
+async def admin_profile(seconds: float = 10.0, interval: float = profiling.DEFAULT_INTERVAL):
+    """
+    Sample every thread's stack for `seconds` and return folded stacks
+    (pipe into flamegraph.pl, or open in speedscope).
+    """
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {MAX_PROFILE_SECONDS}]")
+    if not 0.001 <= interval <= 1:
+        raise HTTPException(status_code=400, detail="interval must be between 0.001 and 1 second")
+    profile = await asyncio.to_thread(profiling.profile_for, seconds, interval)
+    return Response(
+        content=profile["folded"],
+        media_type="text/plain",
+        headers={"X-Profile-Samples": str(profile["samples"])}
+    )
+
+@app.get('/api/admin/profiles', include_in_schema=False, dependencies=[Depends(require_admin)])
+async def admin_list_profiles():
+    """Profiles recorded for slow requests, newest first"""
+    return {"threshold_ms": PROFILE_SLOW_REQUEST_MS, "profiles": profiling.list_profiles()}
+
+@app.get('/api/admin/profiles/{request_id}', include_in_schema=False, dependencies=[Depends(require_admin)])
+async def admin_get_profile(request_id: str):
+    """Folded stacks of one slow request, by the request id from its X-Request-ID header / log line"""
+    profile = profiling.request_sampler.get(request_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile for this request")
+    return Response(content=profile["folded"], media_type="text/plain")
+
+@app.get('/api/admin/replicas', include_in_schema=False, dependencies=[Depends(require_admin)])
+async def admin_replicas():
+    """Measured lag of each read replica and whether reads are currently routed to it"""
+    return {"replicas": replicas.replica_status()}
+
+@app.get('/api/admin/export/{table_name}', include_in_schema=False, dependencies=[Depends(require_admin)])
+async def admin_export(table_name: str, format: str = "ndjson", since: Optional[datetime] = None):
+    """
+    Stream a whole table as NDJSON, CSV or Parquet. With `since`, only rows changed after that
+    watermark are exported; pass the X-Export-Watermark of one export as `since` of the next.
+    """
+    table_cls = social_services.EXPORTABLE_TABLES.get(table_name)
+    if table_cls is None:
+        raise HTTPException(status_code=404, detail=f"Unknown table, exportable: {sorted(social_services.EXPORTABLE_TABLES)}")
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format, expected one of {list(export.FORMATS)}")
+    if format == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed")
+    
+    until = datetime.now()
+    chunks = export.export_table(table_cls, format, since=since, until=until)
+    return StreamingResponse(
+        chunks,
+        media_type=export.FORMATS[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{table_name}_{until:%Y%m%dT%H%M%S}.{format}"',
+            "X-Export-Watermark": until.isoformat(),
+        },
+    )
+
+@app.get('/api/admin/circuit_breakers', include_in_schema=False, dependencies=[Depends(require_admin)])
+async def admin_circuit_breakers():
+    """State of each database's circuit breaker in this worker"""
+    return {"circuit_breakers": resilience.breaker_states()}
+
+
 # ==================== DATABASE MIGRATION ENDPOINT ====================
 
-@app.post('/api/admin/migrate_database')
+@app.post('/api/admin/migrate_database', include_in_schema=False, dependencies=[Depends(require_admin)])
 async def admin_migrate_database():
     """
     Run database migrations to fix schema issues and create new tables.
     WARNING: This should only be run once!
     """
     from solar.table import get_pool
+    from core.webhook_inbox import WEBHOOK_EVENTS_DDL
+    from core.user_services import TRAVEL_USERS_CLERK_ID_INDEX_DDL
+    from core.travel_post import TRAVEL_POSTS_GEOHASH_COLUMN_DDL
+    from core.travel_user import TRAVEL_USERS_UPDATED_AT_COLUMN_DDL
+    from core.post_like import POST_LIKES_UPDATED_AT_COLUMN_DDL
     
     try:
         pool = get_pool()
@@ -778,9 +1178,61 @@ async def admin_migrate_database():
                 except Exception as e:
                     results.append(f"⚠️ Error creating review_votes: {str(e)}")
                 
+                # Create webhook inbox table
+                try:
+                    cursor.execute(WEBHOOK_EVENTS_DDL)
+                    results.append("✅ Created webhook_events table")
+                except Exception as e:
+                    results.append(f"⚠️ Error creating webhook_events: {str(e)}")
+                
+                # Index the Clerk id lookup done at every session start
+                try:
+                    cursor.execute(TRAVEL_USERS_CLERK_ID_INDEX_DDL)
+                    results.append("✅ Created travel_users clerk_user_id index")
+                except Exception as e:
+                    results.append(f"⚠️ Error creating clerk_user_id index: {str(e)}")
+                
+                # Geohash of each post's coordinates, for nearby posts
+                try:
+                    cursor.execute(TRAVEL_POSTS_GEOHASH_COLUMN_DDL)
+                    results.append("✅ Added travel_posts geohash column")
+                except Exception as e:
+                    results.append(f"⚠️ Error adding travel_posts geohash column: {str(e)}")
+                
                 # Commit all changes
                 conn.commit()
-                results.append("✅ Migration completed successfully!")
+        
+        # Convert the time-ordered tables to monthly partitions (no-op once partitioned)
+        for table_cls in social_services.PARTITIONED_TABLES:
+            try:
+                results.extend(f"✅ {line}" for line in partitions.partition_existing_table(table_cls))
+            except Exception as e:
+                results.append(f"⚠️ Error partitioning {table_cls.__tablename__}: {str(e)}")
+        
+        # Export watermarks for rows changed in place; after partitioning, which copies rows without them.
+        # post_likes is sharded, so every database is migrated (IF EXISTS skips the ones without the table)
+        for key in pg_keys:
+            try:
+                with pool[key].connection() as conn:
+                    conn.execute(TRAVEL_USERS_UPDATED_AT_COLUMN_DDL)
+                    conn.execute(POST_LIKES_UPDATED_AT_COLUMN_DDL)
+                results.append(f"✅ Added travel_users/post_likes updated_at on {key}")
+            except Exception as e:
+                results.append(f"⚠️ Error adding updated_at on {key}: {str(e)}")
+        
+        # Full-text search column, search and geohash indexes on travel_posts (idempotent)
+        try:
+            social_services.TravelPost.create_table()
+            results.append("✅ travel_posts search_vector column, search and geohash indexes in place")
+        except Exception as e:
+            results.append(f"⚠️ Error adding travel_posts search indexes: {str(e)}")
+        
+        try:
+            backfilled = social_services.backfill_post_geohashes()
+            results.append(f"✅ Backfilled geohash of {backfilled} travel_posts")
+        except Exception as e:
+            results.append(f"⚠️ Error backfilling travel_posts geohash: {str(e)}")
+        results.append("✅ Migration completed successfully!")
         
         return {"success": True, "results": results}
     
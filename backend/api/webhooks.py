@@ -3,14 +3,28 @@ Webhooks API for handling external service events (Clerk, etc.)
 """
 from fastapi import APIRouter, Request, HTTPException, Header
 from typing import Optional
+import asyncio
+import hashlib
 import json
 import os
-from core.travel_user import TravelUser
+import time
+from core import webhook_inbox
+from solar import metrics
 
 router = APIRouter()
 
 CLERK_WEBHOOK_SECRET = os.environ.get("CLERK_WEBHOOK_SECRET", "")
 
+# Inbox consumer tuning
+INBOX_BATCH_SIZE = int(os.environ.get("WEBHOOK_INBOX_BATCH_SIZE", "200"))
+INBOX_POLL_INTERVAL = float(os.environ.get("WEBHOOK_INBOX_POLL_INTERVAL", "5"))  # seconds
+INBOX_COALESCE_WINDOW = float(os.environ.get("WEBHOOK_INBOX_COALESCE_WINDOW", "0.5"))  # seconds
+INBOX_PURGE_INTERVAL = 3600  # seconds
+
+_inbox_wakeup: Optional[asyncio.Event] = None
+_consumer_task: Optional[asyncio.Task] = None
+
+
 @router.post("/api/webhooks/clerk")
 async def clerk_webhook(
     request: Request,
@@ -19,96 +33,120 @@ async def clerk_webhook(
     svix_signature: Optional[str] = Header(None, alias="svix-signature")
 ):
     """
-    Handle Clerk webhook events for user management.
-    
-    Events handled:
+    Record a Clerk webhook delivery in the inbox and acknowledge it.
+
+    Events are applied asynchronously by the inbox consumer:
     - user.created: Create new user in database
     - user.updated: Update existing user
     - user.deleted: Soft delete user
+
+    Redeliveries with an svix-id that was already recorded are acknowledged without
+    being applied again.
     """
     try:
         # Get the request body
         payload = await request.body()
         event_data = json.loads(payload)
-        
-        # Extract event type and data
         event_type = event_data.get("type")
-        data = event_data.get("data", {})
-        
-        print(f"📥 Received Clerk webhook: {event_type}")
-        
-        if event_type == "user.created":
-            # Extract user data
-            user_id = data.get("id")
-            email_addresses = data.get("email_addresses", [])
-            email = email_addresses[0].get("email_address") if email_addresses else None
-            username = data.get("username")
-            first_name = data.get("first_name", "")
-            last_name = data.get("last_name", "")
-            display_name = f"{first_name} {last_name}".strip() or username
-            profile_image_url = data.get("image_url")
-            
-            # Create user in database with generated UUID
-            import uuid
-            new_user_id = str(uuid.uuid4())
-            
-            TravelUser.sql(
-                """INSERT INTO travel_users 
-                   (id, clerk_user_id, email, username, display_name, profile_image_url, created_at)
-                   VALUES (%(id)s, %(clerk_user_id)s, %(email)s, %(username)s, %(display_name)s, %(profile_image_url)s, NOW())
-                   ON CONFLICT (clerk_user_id) DO NOTHING""",
-                {
-                    "id": new_user_id,
-                    "clerk_user_id": user_id,
-                    "email": email,
-                    "username": username,
-                    "display_name": display_name,
-                    "profile_image_url": profile_image_url
-                }
-            )
-            print(f"✅ Created user: {user_id} ({username})")
-        
-        elif event_type == "user.updated":
-            # Extract user data
-            user_id = data.get("id")
-            email_addresses = data.get("email_addresses", [])
-            email = email_addresses[0].get("email_address") if email_addresses else None
-            username = data.get("username")
-            first_name = data.get("first_name", "")
-            last_name = data.get("last_name", "")
-            display_name = f"{first_name} {last_name}".strip() or username
-            profile_image_url = data.get("image_url")
-            
-            # Update user in database
-            TravelUser.sql(
-                """UPDATE travel_users 
-                   SET email = %(email)s, 
-                       username = %(username)s,
-                       display_name = %(display_name)s,
-                       profile_image_url = %(profile_image_url)s,
-                       last_active = NOW()
-                   WHERE clerk_user_id = %(clerk_user_id)s""",
-                {
-                    "clerk_user_id": user_id,
-                    "email": email,
-                    "username": username,
-                    "display_name": display_name,
-                    "profile_image_url": profile_image_url
-                }
-            )
-            print(f"✅ Updated user: {user_id} ({username})")
-        
-        elif event_type == "user.deleted":
-            # Soft delete user
-            user_id = data.get("id")
-            TravelUser.sql(
-                "UPDATE travel_users SET is_private = true, last_active = NOW() WHERE clerk_user_id = %(clerk_user_id)s",
-                {"clerk_user_id": user_id}
-            )
-            print(f"✅ Deleted user: {user_id}")
-        
-        return {"success": True, "event": event_type}
-    
+
+        # Deliveries without an svix-id are deduplicated on their content instead
+        delivery_id = svix_id or f"sha256:{hashlib.sha256(payload).hexdigest()}"
+
+        is_new = await asyncio.to_thread(
+            webhook_inbox.record_event, delivery_id, event_type, event_data
+        )
+
+        metrics.WEBHOOK_DELIVERIES.labels("clerk", "queued" if is_new else "duplicate").inc()
+        if is_new:
+            print(f"📥 Queued Clerk webhook: {event_type} ({delivery_id})")
+            if _inbox_wakeup is not None:
+                _inbox_wakeup.set()
+        else:
+            print(f"🔁 Duplicate Clerk webhook ignored: {event_type} ({delivery_id})")
+
+        return {"success": True, "event": event_type, "duplicate": not is_new}
+
     except Exception as e:
-        print(f"❌ Error processing webhook: {str(e)}")
+        metrics.WEBHOOK_DELIVERIES.labels("clerk", "error").inc()
+        print(f"❌ Error recording webhook: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+##############################################################################
+# Inbox Consumer
+##############################################################################
+
+async def _process_inbox_batch() -> int:
+    events = await asyncio.to_thread(webhook_inbox.claim_pending_events, INBOX_BATCH_SIZE)
+    if not events:
+        return 0
+
+    svix_ids = [event.svix_id for event in events]
+    started = time.perf_counter()
+    try:
+        summary = await asyncio.to_thread(webhook_inbox.apply_clerk_events, events)
+    except Exception as e:
+        print(f"❌ Error applying {len(events)} webhook events, retrying them per user: {str(e)}")
+        # Isolate the bad events so they don't hold back (or burn the attempts of) the rest
+        summary, svix_ids, failed = await asyncio.to_thread(webhook_inbox.apply_clerk_events_per_user, events)
+        for failed_ids, error in failed:
+            metrics.WEBHOOK_EVENTS_APPLIED.labels("clerk", "failed").inc(len(failed_ids))
+            print(f"❌ Error applying webhook events {failed_ids}: {error}")
+            await asyncio.to_thread(webhook_inbox.release_events, failed_ids, error)
+        if not svix_ids:
+            raise  # Nothing applied (the database is likely down): let the consumer back off
+
+    await asyncio.to_thread(webhook_inbox.mark_events_processed, svix_ids)
+    metrics.WEBHOOK_BATCH_DURATION.labels("clerk").observe(time.perf_counter() - started)
+    metrics.WEBHOOK_EVENTS_APPLIED.labels("clerk", "processed").inc(len(svix_ids))
+    print(
+        f"✅ Applied {len(svix_ids)} webhook events: {summary['created']} created, "
+        f"{summary['updated']} updated, {summary['deleted']} deleted"
+    )
+    return len(events)
+
+
+async def _consume_inbox():
+    last_purge = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_purge > INBOX_PURGE_INTERVAL:
+                await asyncio.to_thread(webhook_inbox.purge_processed_events)
+                last_purge = time.monotonic()
+
+            processed = await _process_inbox_batch()
+            if processed >= INBOX_BATCH_SIZE:
+                continue  # Backlog left, keep draining
+
+            try:
+                await asyncio.wait_for(_inbox_wakeup.wait(), timeout=INBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            _inbox_wakeup.clear()
+            # Let a burst of deliveries accumulate so they are applied as one batch
+            await asyncio.sleep(INBOX_COALESCE_WINDOW)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Webhook inbox consumer error: {str(e)}")
+            await asyncio.sleep(INBOX_POLL_INTERVAL)
+
+
+def start_inbox_consumer():
+    global _inbox_wakeup, _consumer_task
+    if _consumer_task is not None and not _consumer_task.done():
+        return
+    _inbox_wakeup = asyncio.Event()
+    _consumer_task = asyncio.create_task(_consume_inbox())
+
+
+async def stop_inbox_consumer():
+    global _consumer_task
+    if _consumer_task is None:
+        return
+    _consumer_task.cancel()
+    try:
+        await _consumer_task
+    except asyncio.CancelledError:
+        pass
+    _consumer_task = None
@@ -0,0 +1,10 @@
+"""
+Benchmark harness for the social API.
+
+    python -m benchmarks.dataset --truncate        # generate and bulk-load the synthetic dataset
+    python -m benchmarks.load --scenario mixed     # drive the running API and record latencies
+    python -m benchmarks.bench_table               # microbenchmarks of the solar Table layer
+    python -m benchmarks.startup                   # import-time breakdown against the cold-start budget
+
+Run them from the backend directory, against a local Postgres (DB_HOST/DB_NAME/... in .env).
+"""
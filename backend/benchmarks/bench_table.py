@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the solar Table layer.
+
+Measures the Python-side cost of the ORM: value preparation, upsert SQL building, sync_many
+at several batch sizes, and decoding database rows into TravelPost models. By default
+Table.sql is replaced with an in-memory stand-in that only records the statement, so the
+numbers isolate the ORM from the database; `--postgres` adds the same upserts and a
+SELECT + decode round trip against the configured database.
+
+    python -m benchmarks.bench_table
+    python -m benchmarks.bench_table --postgres --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import json
+import sys
+import timeit
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.travel_post import TravelPost
+from solar.table import Table
+
+from benchmarks.load import RESULTS_DIR, git_revision
+
+BATCH_SIZES = [1, 10, 100, 1000]
+REPEAT = 5
+
+
+class BenchTravelPost(TravelPost):
+    __tablename__ = "bench_travel_posts"
+
+
+def make_post(i: int = 0) -> TravelPost:
+    return BenchTravelPost(
+        user_id=uuid4(),
+        caption=f"Sunrise yoga session overlooking the rice terraces #{i}",
+        images=[f"https://picsum.photos/seed/{i}-{n}/1080/1080" for n in range(3)],
+        location_name="Tegallalang Rice Terraces",
+        location_coordinates={"lat": -8.4312, "lng": 115.2777},
+        country="Indonesia",
+        city="Ubud",
+        post_type="experience",
+        category="wellness",
+        tags=["yoga", "sunrise", "bali", "mindfulness"],
+        booking_info={"price": "$45", "affiliate_code": f"CODE_{i}"},
+    )
+
+
+def make_row(i: int = 0) -> Dict:
+    """A travel_posts row as psycopg's dict_row returns it."""
+    return make_post(i).model_dump()
+
+
+@contextmanager
+def in_memory_sql() -> Iterator[List]:
+    """Swap Table.sql for a stand-in that records statements instead of running them."""
+    statements = []
+    original = Table.__dict__["sql"]
+
+    def fake_sql(cls, sql_statement, params=None, *args, **kwargs):
+        statements.append((sql_statement, params))
+        return []
+
+    Table.sql = classmethod(fake_sql)
+    try:
+        yield statements
+    finally:
+        Table.sql = original
+
+
+def measure(name: str, func: Callable[[], object], rows_per_call: int = 1, number: Optional[int] = None) -> Dict:
+    """Best-of-REPEAT timing; reports time per call and per row."""
+    timer = timeit.Timer(func)
+    if number is None:
+        number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=REPEAT, number=number)) / number
+    result = {
+        "name": name,
+        "calls": number,
+        "us_per_call": round(best * 1e6, 3),
+        "us_per_row": round(best * 1e6 / rows_per_call, 3),
+        "rows_per_s": round(rows_per_call / best, 1),
+    }
+    print(f"  {name:<40} {result['us_per_call']:>12.2f}µs/call {result['us_per_row']:>10.2f}µs/row {result['rows_per_s']:>12,.0f} rows/s")
+    return result
+
+
+def in_memory_benchmarks() -> List[Dict]:
+    results = []
+    post = make_post()
+    data = post.model_dump()
+
+    results.append(measure("prepare_value (one row, all columns)", lambda: [post._prepare_value(v) for v in data.values()]))
+    results.append(measure("model_dump", post.model_dump))
+
+    with in_memory_sql():
+        results.append(measure("sync (build upsert)", post.sync))
+        for batch_size in BATCH_SIZES:
+            posts = [make_post(i) for i in range(batch_size)]
+            results.append(measure(
+                f"sync_many batch={batch_size}",
+                lambda posts=posts, batch_size=batch_size: BenchTravelPost.sync_many(posts, batch_size=batch_size),
+                rows_per_call=batch_size,
+            ))
+
+    rows = [make_row(i) for i in range(1000)]
+    results.append(measure("decode TravelPost(**row) x1000", lambda: [TravelPost(**row) for row in rows], rows_per_call=len(rows)))
+    results.append(measure("decode model_validate x1000", lambda: [TravelPost.model_validate(row) for row in rows], rows_per_call=len(rows)))
+    return results
+
+
+def postgres_benchmarks() -> List[Dict]:
+    results = []
+    TravelPost.sql("CREATE TABLE IF NOT EXISTS bench_travel_posts (LIKE travel_posts INCLUDING ALL)")
+    try:
+        for batch_size in BATCH_SIZES:
+            posts = [make_post(i) for i in range(batch_size)]
+            # The same rows every call: after the first insert this measures the ON CONFLICT update path
+            results.append(measure(
+                f"postgres sync_many batch={batch_size}",
+                lambda posts=posts, batch_size=batch_size: BenchTravelPost.sync_many(posts, batch_size=batch_size),
+                rows_per_call=batch_size,
+                number=max(1, 2000 // batch_size),
+            ))
+
+        BenchTravelPost.sync_many([make_post(i) for i in range(1000)])
+        results.append(measure(
+            "postgres select+decode x1000",
+            lambda: [TravelPost(**row) for row in TravelPost.sql("SELECT * FROM bench_travel_posts LIMIT 1000")],
+            rows_per_call=1000,
+            number=10,
+        ))
+    finally:
+        TravelPost.sql("DROP TABLE IF EXISTS bench_travel_posts")
+    return results
+
+
+def compare(results: List[Dict], baseline: Dict, threshold: float) -> List[str]:
+    previous = {r["name"]: r for r in baseline.get("results", [])}
+    regressions = []
+    print(f"\n  {'benchmark':<40} {'Δ µs/row':>10}")
+    for result in results:
+        before = previous.get(result["name"])
+        if not before or not before["us_per_row"]:
+            continue
+        delta = (result["us_per_row"] - before["us_per_row"]) / before["us_per_row"]
+        print(f"  {result['name']:<40} {delta:>+10.1%}")
+        if delta > threshold:
+            regressions.append(f"{result['name']}: {before['us_per_row']}µs -> {result['us_per_row']}µs per row")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for solar/table.py")
+    parser.add_argument("--postgres", action="store_true", help="Also run the upsert/decode benchmarks against the configured database")
+    parser.add_argument("--output", type=Path, help="Result file (default: benchmarks/results/<timestamp>-table.json)")
+    parser.add_argument("--compare", type=Path, help="Earlier result file to compare against")
+    parser.add_argument("--fail-threshold", type=float, default=0.15, help="Allowed per-row slowdown")
+    args = parser.parse_args()
+
+    print("⏱  In-memory (Table.sql stubbed)")
+    results = in_memory_benchmarks()
+    if args.postgres:
+        print("\n⏱  Postgres")
+        results += postgres_benchmarks()
+
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-table.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "started_at": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "results": results,
+    }, indent=2))
+    print(f"\n📄 Results written to {output}")
+
+    if args.compare:
+        regressions = compare(results, json.loads(args.compare.read_text()), args.fail_threshold)
+        if regressions:
+            print("\n❌ Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\n✅ No regressions beyond threshold")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Synthetic dataset for the benchmarks: users, posts, a power-law follow graph, likes, saves,
+reviews and review votes, bulk-loaded into Postgres with binary COPY.
+
+Popularity follows a Zipf distribution (a few creators and posts attract most follows, likes
+and saves) and per-user activity is heavy-tailed, so the hot rows and skewed fan-outs of a
+real social graph show up in the benchmarks. Row ids are derived from row indexes (see
+`bench_uuid`), which lets the load driver address any row without reading the database back.
+
+Tables are created from the models and rows are copied to the database (or shard) the app
+would read them from, using the app's configuration (DB_HOST/..., PG_SHARD_n).
+
+    python -m benchmarks.dataset --truncate
+    python -m benchmarks.dataset --users 10000 --posts 100000 --truncate   # quick run
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+from bisect import bisect
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from itertools import accumulate
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import psycopg
+from psycopg.types.json import Jsonb
+from pydantic import BaseModel
+
+from core.follow import Follow
+from core.post_like import PostLike
+from core.review import Review
+from core.review_vote import ReviewVote
+from core.saved_post import SavedPost
+from core.travel_post import TravelPost
+from core.travel_user import TravelUser
+from solar import geo, partitions, sharding
+from solar.config import config
+from solar.table import get_pool
+
+MANIFEST_PATH = Path(__file__).parent / "dataset.json"
+
+# Id namespaces, one per table (first UUID group)
+USER, POST, FOLLOW, LIKE, SAVE, REVIEW, VOTE = range(1, 8)
+
+# Loaded in this order. The schema is each model's create_table(), exactly as the app creates
+# it (partitions, generated columns, indexes), on the databases and shards the app routes to.
+MODELS = [TravelUser, TravelPost, Follow, PostLike, SavedPost, Review, ReviewVote]
+COUNTER_BATCH_SIZE = 10_000
+
+PLACES = [
+    ("Tegallalang Rice Terraces", "Ubud", "Indonesia", -8.4312, 115.2777),
+    ("Shibuya Crossing", "Tokyo", "Japan", 35.6595, 139.7005),
+    ("Thingvellir National Park", "Thingvellir", "Iceland", 64.2559, -21.1299),
+    ("Sagrada Familia", "Barcelona", "Spain", 41.4036, 2.1744),
+    ("Trastevere", "Rome", "Italy", 41.8897, 12.4663),
+    ("Le Marais", "Paris", "France", 48.8590, 2.3625),
+    ("Alfama", "Lisbon", "Portugal", 38.7118, -9.1300),
+    ("Medina of Marrakesh", "Marrakesh", "Morocco", 31.6295, -7.9811),
+    ("Table Mountain", "Cape Town", "South Africa", -33.9628, 18.4098),
+    ("Machu Picchu", "Aguas Calientes", "Peru", -13.1631, -72.5450),
+    ("Palermo Soho", "Buenos Aires", "Argentina", -34.5889, -58.4306),
+    ("Tulum Ruins", "Tulum", "Mexico", 20.2150, -87.4291),
+    ("Banff National Park", "Banff", "Canada", 51.4968, -115.9281),
+    ("Brooklyn Bridge", "New York", "United States", 40.7061, -73.9969),
+    ("Bondi Beach", "Sydney", "Australia", -33.8915, 151.2767),
+    ("Hoi An Ancient Town", "Hoi An", "Vietnam", 15.8801, 108.3380),
+    ("Old Town Square", "Prague", "Czech Republic", 50.0875, 14.4213),
+    ("Santorini Caldera", "Oia", "Greece", 36.4618, 25.3753),
+    ("Cappadocia", "Goreme", "Turkey", 38.6431, 34.8289),
+    ("Queenstown Waterfront", "Queenstown", "New Zealand", -45.0312, 168.6626),
+]
+POST_TYPES = ["experience", "food", "hotel", "activity", "tip"]
+CATEGORIES = ["adventure", "luxury", "budget", "family", "nature", "restaurant", "wellness", "culture"]
+TAGS = [
+    "sunset", "hiking", "romantic", "foodie", "street_food", "beach", "mountains", "museum",
+    "nightlife", "local_favorite", "hidden_gem", "photography", "road_trip", "backpacking",
+    "coffee", "wine", "architecture", "wildlife", "snorkeling", "market",
+]
+WORDS = [
+    "amazing", "views", "tiny", "hidden", "local", "spot", "sunrise", "dinner", "walk", "trail",
+    "old", "town", "best", "ever", "quiet", "morning", "colorful", "streets", "fresh", "market",
+]
+COLLECTIONS = [None, "Bucket list", "Food Goals", "Next summer", "Weekend ideas"]
+
+
+class DatasetSpec(BaseModel):
+    seed: int = 42
+    users: int = 100_000
+    posts: int = 1_000_000
+    # Average per-user activity; actual counts are heavy-tailed around these
+    avg_follows: float = 40.0
+    avg_likes: float = 30.0
+    avg_saves: float = 5.0
+    avg_reviews: float = 3.0
+    avg_votes: float = 6.0
+    # Zipf exponent of user/post popularity
+    skew: float = 1.1
+    days: int = 365
+
+
+class DatasetManifest(BaseModel):
+    spec: DatasetSpec
+    counts: dict
+    load_seconds: dict
+    created_at: datetime
+
+
+def bench_uuid(kind: int, index: int) -> uuid.UUID:
+    """Deterministic id of the `index`-th row of a table namespace."""
+    return uuid.UUID(f"{kind:08x}-0000-4000-8000-{index:012x}")
+
+
+class ZipfSampler:
+    """Draws indexes in [0, n) with P ∝ 1 / rank^s; ranks are shuffled so popularity is not id order."""
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        self.n = n
+        self.cumulative = list(accumulate(1.0 / (rank + 1) ** s for rank in range(n)))
+        self.total = self.cumulative[-1]
+        self.ranked = list(range(n))
+        rng.shuffle(self.ranked)
+        self.rng = rng
+
+    def sample(self) -> int:
+        position = bisect(self.cumulative, self.rng.random() * self.total)
+        return self.ranked[min(position, self.n - 1)]
+
+
+def heavy_tail_count(rng: random.Random, mean: float, cap: int) -> int:
+    # Pareto with alpha=2 has mean 2 * xm
+    return min(int(rng.paretovariate(2.0) * mean / 2), cap)
+
+
+def distinct_samples(sampler: ZipfSampler, count: int, exclude: Optional[int] = None) -> List[int]:
+    """Up to `count` distinct draws; gives up after a bounded number of collisions on hot rows."""
+    chosen = set()
+    for _ in range(count * 3):
+        if len(chosen) >= count:
+            break
+        index = sampler.sample()
+        if index != exclude:
+            chosen.add(index)
+    return list(chosen)
+
+
+class Generator:
+    def __init__(self, spec: DatasetSpec):
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+        self.now = datetime.now().replace(microsecond=0)
+        self.user_popularity = ZipfSampler(spec.users, spec.skew, self.rng)
+        self.post_popularity = ZipfSampler(spec.posts, spec.skew, self.rng)
+        self.review_count = 0
+        # Denormalized counters, tallied while generating (row index -> count)
+        self.followers, self.following, self.user_posts = Counter(), Counter(), Counter()
+        self.post_likes, self.post_saves, self.post_reviews, self.post_ratings = Counter(), Counter(), Counter(), Counter()
+        self.review_helpful = Counter()
+
+    def _timestamp(self) -> datetime:
+        return self.now - timedelta(seconds=self.rng.randrange(self.spec.days * 86400))
+
+    def _sentence(self, words: int) -> str:
+        return " ".join(self.rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+    def users(self) -> Iterator[Tuple]:
+        for i in range(self.spec.users):
+            created_at = self._timestamp()
+            yield (
+                bench_uuid(USER, i), f"bench_user_{i}", f"user{i}@bench.local", f"Bench User {i}",
+                self._sentence(8), f"https://i.pravatar.cc/150?u={i}",
+                0, 0, 0,
+                self.rng.random() < 0.02, self.rng.random() < 0.05,
+                created_at, created_at, created_at, False, True, True,
+            )
+
+    def posts(self) -> Iterator[Tuple]:
+        for i in range(self.spec.posts):
+            # Popular users post more
+            author = self.user_popularity.sample()
+            self.user_posts[author] += 1
+            name, city, country, lat, lng = self.rng.choice(PLACES)
+            lat, lng = lat + self.rng.uniform(-0.05, 0.05), lng + self.rng.uniform(-0.05, 0.05)
+            created_at = self._timestamp()
+            yield (
+                bench_uuid(POST, i), bench_uuid(USER, author), self._sentence(self.rng.randint(8, 30)),
+                [f"https://picsum.photos/seed/{i}-{n}/1080/1080" for n in range(self.rng.randint(1, 4))],
+                name, Jsonb({"lat": lat, "lng": lng}), geo.encode(lat, lng),
+                country, city, self.rng.choice(POST_TYPES), self.rng.choice(CATEGORIES),
+                self.rng.sample(TAGS, self.rng.randint(1, 5)),
+                0, 0, 0, 0,
+                Jsonb({"price": f"${self.rng.randint(20, 300)}", "affiliate_code": f"CODE_{i}"}),
+                None, self.rng.choice(["$", "$$", "$$$", "$$$$"]),
+                created_at, created_at, True, self.rng.random() < 0.01, False,
+            )
+
+    def follows(self) -> Iterator[Tuple]:
+        index = 0
+        for follower in range(self.spec.users):
+            count = heavy_tail_count(self.rng, self.spec.avg_follows, self.spec.users - 1)
+            for following in distinct_samples(self.user_popularity, count, exclude=follower):
+                self.followers[following] += 1
+                self.following[follower] += 1
+                yield (bench_uuid(FOLLOW, index), bench_uuid(USER, follower), bench_uuid(USER, following),
+                       self._timestamp(), True)
+                index += 1
+
+    def likes(self) -> Iterator[Tuple]:
+        index = 0
+        for user in range(self.spec.users):
+            count = heavy_tail_count(self.rng, self.spec.avg_likes, self.spec.posts)
+            for post in distinct_samples(self.post_popularity, count):
+                self.post_likes[post] += 1
+                created_at = self._timestamp()
+                yield (bench_uuid(LIKE, index), bench_uuid(USER, user), bench_uuid(POST, post),
+                       created_at, created_at, True)
+                index += 1
+
+    def saves(self) -> Iterator[Tuple]:
+        index = 0
+        for user in range(self.spec.users):
+            count = heavy_tail_count(self.rng, self.spec.avg_saves, self.spec.posts)
+            for post in distinct_samples(self.post_popularity, count):
+                self.post_saves[post] += 1
+                created_at = self._timestamp()
+                yield (bench_uuid(SAVE, index), bench_uuid(USER, user), bench_uuid(POST, post),
+                       self.rng.choice(COLLECTIONS), created_at, created_at, True)
+                index += 1
+
+    def reviews(self) -> Iterator[Tuple]:
+        index = 0
+        for user in range(self.spec.users):
+            count = heavy_tail_count(self.rng, self.spec.avg_reviews, self.spec.posts)
+            for post in distinct_samples(self.post_popularity, count):
+                created_at = self._timestamp()
+                rating = self.rng.choices([1, 2, 3, 4, 5], weights=[2, 3, 10, 35, 50])[0]
+                self.post_reviews[post] += 1
+                self.post_ratings[post] += rating
+                yield (bench_uuid(REVIEW, index), bench_uuid(POST, post), bench_uuid(USER, user),
+                       rating, self._sentence(self.rng.randint(5, 25)), 0, created_at, created_at, True)
+                index += 1
+        self.review_count = index
+
+    def votes(self) -> Iterator[Tuple]:
+        if not self.review_count:
+            return
+        review_popularity = ZipfSampler(self.review_count, self.spec.skew, self.rng)
+        index = 0
+        for user in range(self.spec.users):
+            count = heavy_tail_count(self.rng, self.spec.avg_votes, self.review_count)
+            for review in distinct_samples(review_popularity, count):
+                is_helpful = self.rng.random() < 0.8
+                self.review_helpful[review] += is_helpful
+                yield (bench_uuid(VOTE, index), bench_uuid(REVIEW, review), bench_uuid(USER, user),
+                       is_helpful, self._timestamp(), True)
+                index += 1
+
+    def counters(self) -> List[Tuple[type, str, str, Dict[uuid.UUID, float]]]:
+        """(model, column, SQL type, {row id: value}) of every denormalized counter, once all rows are generated."""
+        def by_id(kind: int, values: Counter) -> Dict[uuid.UUID, float]:
+            return {bench_uuid(kind, index): value for index, value in values.items()}
+
+        ratings = Counter({post: round(self.post_ratings[post] / n, 1) for post, n in self.post_reviews.items()})
+        return [
+            (TravelUser, "followers_count", "int4", by_id(USER, self.followers)),
+            (TravelUser, "following_count", "int4", by_id(USER, self.following)),
+            (TravelUser, "posts_count", "int4", by_id(USER, self.user_posts)),
+            (TravelPost, "likes_count", "int4", by_id(POST, self.post_likes)),
+            (TravelPost, "saves_count", "int4", by_id(POST, self.post_saves)),
+            (TravelPost, "comments_count", "int4", by_id(POST, self.post_reviews)),
+            (TravelPost, "experience_rating", "float4", by_id(POST, ratings)),
+            (Review, "helpful_count", "int4", by_id(REVIEW, self.review_helpful)),
+        ]
+
+
+# (model, columns, row generator); values are COPY'd as text, so they take each column's type
+def copy_plan(generator: Generator) -> List[Tuple[type, Sequence[str], Callable[[], Iterator[Tuple]]]]:
+    return [
+        (TravelUser,
+         ["id", "username", "email", "display_name", "bio", "profile_image_url",
+          "followers_count", "following_count", "posts_count", "is_verified", "is_creator",
+          "created_at", "last_active", "updated_at", "is_private", "allow_messages", "email_notifications"],
+         generator.users),
+        (TravelPost,
+         ["id", "user_id", "caption", "images", "location_name", "location_coordinates", "geohash", "country", "city",
+          "post_type", "category", "tags", "likes_count", "saves_count", "comments_count", "shares_count",
+          "booking_info", "experience_rating", "price_range", "created_at", "updated_at",
+          "is_published", "is_featured", "is_sponsored"],
+         generator.posts),
+        (Follow, ["id", "follower_id", "following_id", "created_at", "is_active"], generator.follows),
+        (PostLike, ["id", "user_id", "post_id", "created_at", "updated_at", "is_active"], generator.likes),
+        (SavedPost,
+         ["id", "user_id", "post_id", "collection_name", "created_at", "updated_at", "is_active"],
+         generator.saves),
+        (Review,
+         ["id", "post_id", "user_id", "rating", "comment", "helpful_count", "created_at", "updated_at", "is_active"],
+         generator.reviews),
+        (ReviewVote, ["id", "review_id", "user_id", "is_helpful", "created_at", "is_active"], generator.votes),
+    ]
+
+
+def databases(model) -> List[str]:
+    """The pg_keys holding a model's rows: every shard of a sharded table, else its database."""
+    if sharding.is_sharded(model):
+        return sharding.shard_keys()
+    return [config.get_pg_key_for_table(model.__name__)]
+
+
+def create_schema(spec: DatasetSpec, truncate: bool):
+    pools = get_pool()
+    first_month = partitions.month_start(datetime.now() - timedelta(days=spec.days))
+    for model in MODELS:
+        model.create_table()
+        for pg_key in databases(model):
+            with pools[pg_key].connection() as conn:
+                if truncate:
+                    conn.execute(f"TRUNCATE {model.__tablename__}")
+                if getattr(model, "__partition_by__", None) is not None:
+                    # Rows go back spec.days: give each of those months its partition, not the default one
+                    partitions.ensure_partitions(
+                        conn, model.__tablename__, first_month, config.partition_premake_months()
+                    )
+
+
+def copy_rows(model, columns: Sequence[str], rows: Iterator[Tuple]) -> int:
+    """COPY rows into the model's table, each one on the database (shard) the app routes it to."""
+    pools = get_pool()
+    shard_column = columns.index(model.__shard_key__) if sharding.is_sharded(model) else None
+    statement = f"COPY {model.__tablename__} ({', '.join(columns)}) FROM STDIN"
+    count = 0
+    with ExitStack() as stack:
+        copies = {}
+        for row in rows:
+            pg_key = sharding.shard_for(row[shard_column]) if shard_column is not None else databases(model)[0]
+            copy = copies.get(pg_key)
+            if copy is None:
+                conn = stack.enter_context(pools[pg_key].connection())
+                cursor = stack.enter_context(conn.cursor())
+                copy = copies[pg_key] = stack.enter_context(cursor.copy(statement))
+            copy.write_row(row)
+            count += 1
+    return count
+
+
+def write_counters(generator: Generator):
+    pools = get_pool()
+    for model, column, sql_type, values in generator.counters():
+        ids = list(values)
+        # Counters live on unsharded tables
+        with pools[databases(model)[0]].connection() as conn:
+            for start in range(0, len(ids), COUNTER_BATCH_SIZE):
+                batch = ids[start:start + COUNTER_BATCH_SIZE]
+                conn.execute(
+                    f"""UPDATE {model.__tablename__} AS t SET {column} = v.value
+                        FROM unnest(%(ids)s::uuid[], %(values)s::{sql_type}[]) AS v(id, value)
+                        WHERE t.id = v.id""",
+                    {"ids": batch, "values": [values[row_id] for row_id in batch]},
+                )
+
+
+def load(spec: DatasetSpec, truncate: bool = False) -> DatasetManifest:
+    generator = Generator(spec)
+    counts, load_seconds = {}, {}
+
+    create_schema(spec, truncate)
+
+    for model, columns, rows in copy_plan(generator):
+        table = model.__tablename__
+        started = time.perf_counter()
+        counts[table] = copy_rows(model, columns, rows())
+        load_seconds[table] = round(time.perf_counter() - started, 2)
+        print(f"  ✓ {table}: {counts[table]:,} rows in {load_seconds[table]}s")
+
+    started = time.perf_counter()
+    write_counters(generator)
+    load_seconds["counters"] = round(time.perf_counter() - started, 2)
+    print(f"  ✓ counters written in {load_seconds['counters']}s")
+
+    for connection_string in config.get_all_pg_connection_strings().values():
+        with psycopg.connect(connection_string, autocommit=True) as conn:
+            conn.execute("VACUUM ANALYZE")
+
+    return DatasetManifest(spec=spec, counts=counts, load_seconds=load_seconds, created_at=datetime.now())
+
+
+def main():
+    defaults = DatasetSpec()
+    parser = argparse.ArgumentParser(description="Generate and bulk-load the benchmark dataset")
+    parser.add_argument("--truncate", action="store_true", help="Empty the social tables before loading")
+    parser.add_argument("--manifest", type=Path, default=MANIFEST_PATH)
+    for field, value in defaults.model_dump().items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    spec = DatasetSpec(**{field: getattr(args, field) for field in DatasetSpec.model_fields})
+    print(f"🌱 Loading benchmark dataset: {spec.users:,} users, {spec.posts:,} posts (seed {spec.seed})")
+    manifest = load(spec, truncate=args.truncate)
+    args.manifest.write_text(manifest.model_dump_json(indent=2))
+    print(f"✅ Dataset loaded, manifest written to {args.manifest}")
+
+
+if __name__ == "__main__":
+    main()
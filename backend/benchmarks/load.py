@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Load driver for the /api/social_services/* endpoints.
+
+Runs a closed-loop workload (`--concurrency` clients issuing requests back to back) against a
+running API seeded with `benchmarks.dataset`, records every request latency, and writes
+p50/p95/p99 and throughput per operation to a JSON result file. Pass `--compare` with an
+earlier result to print the differences and fail on p95/throughput regressions.
+
+    python -m benchmarks.load --scenario mixed --concurrency 50 --duration 60
+    python -m benchmarks.load --scenario read --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+from benchmarks.dataset import MANIFEST_PATH, POST, REVIEW, USER, DatasetManifest, bench_uuid
+
+RESULTS_DIR = Path(__file__).parent / "results"
+SOCIAL_API = "/api/social_services"
+
+# Operation weights per scenario
+SCENARIOS: Dict[str, Dict[str, int]] = {
+    "read": {
+        "get_social_feed": 60,
+        "get_post_reviews": 20,
+        "get_user_saved_posts": 12,
+        "get_saved_locations": 8,
+    },
+    "write": {
+        "like_post": 45,
+        "save_post_to_wishlist": 20,
+        "follow_user": 15,
+        "vote_review": 12,
+        "create_review": 5,
+        "create_travel_post": 3,
+    },
+    "mixed": {
+        "get_social_feed": 45,
+        "get_post_reviews": 12,
+        "get_user_saved_posts": 8,
+        "get_saved_locations": 5,
+        "like_post": 15,
+        "save_post_to_wishlist": 6,
+        "follow_user": 4,
+        "vote_review": 3,
+        "create_review": 1,
+        "create_travel_post": 1,
+    },
+}
+
+
+class Workload:
+    """Builds request bodies that address rows of the seeded dataset, skewed towards hot rows."""
+
+    def __init__(self, manifest: DatasetManifest, seed: int):
+        self.users = manifest.counts.get("travel_users", manifest.spec.users)
+        self.posts = manifest.counts.get("travel_posts", manifest.spec.posts)
+        self.reviews = manifest.counts.get("reviews", 0)
+        self.rng = random.Random(seed)
+
+    def _skewed(self, n: int) -> int:
+        # Half the picks go to a Pareto-distributed hot set at the low indexes, half are uniform
+        return min(int(self.rng.paretovariate(1.16)) - 1, n - 1) if self.rng.random() < 0.5 else self.rng.randrange(n)
+
+    def user(self) -> str:
+        return str(bench_uuid(USER, self.rng.randrange(self.users)))
+
+    def hot_user(self) -> str:
+        return str(bench_uuid(USER, self._skewed(self.users)))
+
+    def post(self) -> str:
+        return str(bench_uuid(POST, self._skewed(self.posts)))
+
+    def review(self) -> str:
+        return str(bench_uuid(REVIEW, self._skewed(max(self.reviews, 1))))
+
+    def body(self, operation: str) -> Dict:
+        builders: Dict[str, Callable[[], Dict]] = {
+            "get_social_feed": lambda: {"user_id": self.user(), "page": self.rng.choice([0, 0, 0, 1, 2]), "limit": 20},
+            "get_post_reviews": lambda: {"post_id": self.post(), "page": 0, "limit": 20},
+            "get_user_saved_posts": lambda: {"user_id": self.user()},
+            "get_saved_locations": lambda: {"user_id": self.user()},
+            "like_post": lambda: {"user_id": self.user(), "post_id": self.post()},
+            "save_post_to_wishlist": lambda: {"user_id": self.user(), "post_id": self.post(), "collection_name": "Benchmark"},
+            "follow_user": lambda: {"follower_id": self.user(), "following_id": self.hot_user()},
+            "vote_review": lambda: {"user_id": self.user(), "review_id": self.review(), "is_helpful": self.rng.random() < 0.8},
+            "create_review": lambda: {"user_id": self.user(), "post_id": self.post(), "rating": self.rng.randint(1, 5), "comment": "Benchmark review"},
+            "create_travel_post": lambda: {
+                "user_id": self.user(),
+                "caption": "Benchmark post",
+                "images": ["https://picsum.photos/seed/bench/1080/1080"],
+                "location_name": "Shibuya Crossing",
+                "country": "Japan",
+                "city": "Tokyo",
+                "post_type": "experience",
+                "category": "culture",
+                "tags": ["benchmark"],
+            },
+        }
+        return builders[operation]()
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered), 2) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50), 2),
+        "p95_ms": round(percentile(ordered, 0.95), 2),
+        "p99_ms": round(percentile(ordered, 0.99), 2),
+        "max_ms": round(ordered[-1], 2) if ordered else 0.0,
+    }
+
+
+async def run_load(
+    base_url: str,
+    workload: Workload,
+    weights: Dict[str, int],
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    timeout: float,
+) -> Tuple[Dict[str, List[float]], Dict[str, int], float]:
+    operations, operation_weights = list(weights), list(weights.values())
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+
+        async def worker():
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    return
+                operation = workload.rng.choices(operations, weights=operation_weights)[0]
+                body = workload.body(operation)
+                request_start = time.perf_counter()
+                try:
+                    response = await client.post(f"{SOCIAL_API}/{operation}", json=body)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                request_end = time.perf_counter()
+                if request_start < measure_from:
+                    continue  # warmup
+                latencies[operation].append((request_end - request_start) * 1000)
+                if failed:
+                    errors[operation] += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return latencies, errors, time.perf_counter() - measure_from
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Print per-operation deltas; return the regressions beyond `threshold` (a fraction)."""
+    regressions = []
+    print(f"\n{'operation':<24} {'p50 Δ':>9} {'p95 Δ':>9} {'p99 Δ':>9} {'rps Δ':>9}")
+    for operation, stats in current["operations"].items():
+        previous = baseline.get("operations", {}).get(operation)
+        if not previous:
+            continue
+        deltas = {}
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            deltas[key] = (stats[key] - previous[key]) / previous[key] if previous[key] else 0.0
+        print(
+            f"{operation:<24} {deltas['p50_ms']:>+9.1%} {deltas['p95_ms']:>+9.1%} "
+            f"{deltas['p99_ms']:>+9.1%} {deltas['throughput_rps']:>+9.1%}"
+        )
+        if deltas["p95_ms"] > threshold:
+            regressions.append(f"{operation}: p95 {previous['p95_ms']}ms -> {stats['p95_ms']}ms")
+        if deltas["throughput_rps"] < -threshold:
+            regressions.append(f"{operation}: throughput {previous['throughput_rps']} -> {stats['throughput_rps']} rps")
+    return regressions
+
+
+def print_report(result: Dict):
+    print(f"\n{'operation':<24} {'reqs':>8} {'errors':>7} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    rows = list(result["operations"].items()) + [("TOTAL", result["total"])]
+    for operation, stats in rows:
+        print(
+            f"{operation:<24} {stats['requests']:>8} {stats['errors']:>7} {stats['throughput_rps']:>9.1f} "
+            f"{stats['p50_ms']:>8.1f}ms {stats['p95_ms']:>8.1f}ms {stats['p99_ms']:>8.1f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the social API and record latency percentiles")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=60.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=10.0, help="Seconds of load before measuring")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--manifest", type=Path, default=MANIFEST_PATH)
+    parser.add_argument("--output", type=Path, help="Result file (default: benchmarks/results/<timestamp>-<scenario>.json)")
+    parser.add_argument("--compare", type=Path, help="Earlier result file to compare against")
+    parser.add_argument("--fail-threshold", type=float, default=0.10, help="Allowed p95/throughput regression")
+    args = parser.parse_args()
+
+    if not args.manifest.exists():
+        raise SystemExit(f"{args.manifest} not found; load the dataset first with `python -m benchmarks.dataset`")
+    manifest = DatasetManifest.model_validate_json(args.manifest.read_text())
+    workload = Workload(manifest, args.seed)
+    weights = SCENARIOS[args.scenario]
+
+    print(f"🚀 {args.scenario} scenario: {args.concurrency} clients, {args.warmup:.0f}s warmup + {args.duration:.0f}s against {args.base_url}")
+    latencies, errors, elapsed = asyncio.run(run_load(
+        args.base_url, workload, weights, args.concurrency, args.duration, args.warmup, args.timeout
+    ))
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    result = {
+        "scenario": args.scenario,
+        "started_at": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "base_url": args.base_url,
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 2),
+        "warmup_s": args.warmup,
+        "dataset": manifest.model_dump(mode="json"),
+        "operations": {
+            operation: summarize(latencies[operation], errors[operation], elapsed)
+            for operation in weights if latencies[operation]
+        },
+        "total": summarize(all_latencies, sum(errors.values()), elapsed),
+    }
+    print_report(result)
+
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{args.scenario}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"\n📄 Results written to {output}")
+
+    if args.compare:
+        regressions = compare(result, json.loads(args.compare.read_text()), args.fail_threshold)
+        if regressions:
+            print("\n❌ Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\n✅ No regressions beyond threshold")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Cold-start report: how long importing the app takes, and where that time goes.
+
+Runs `python -X importtime -c "import api.bootstrap"` in fresh interpreters (best of
+`--runs`), then prints the total, the time per top-level package (self time summed, so the
+rows add up to the total) and the slowest individual modules. Fails when the total is over
+`--budget-ms`, so it can guard the cold-start budget in CI.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --budget-ms 800 --output benchmarks/results/startup.json
+"""
+import argparse
+import json
+import subprocess
+import sys
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.load import RESULTS_DIR, git_revision
+
+DEFAULT_BUDGET_MS = 1000.0
+
+
+def measure_imports(module: str) -> List[Dict]:
+    """One `-X importtime` run: every imported module with its self and cumulative time."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return modules
+
+
+def by_package(modules: List[Dict]) -> Dict[str, float]:
+    packages = defaultdict(float)
+    for module in modules:
+        packages[module["module"].split(".")[0]] += module["self_ms"]
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time breakdown of the API")
+    parser.add_argument("--module", default="api.bootstrap")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to try; the fastest is reported")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--output", type=Path, help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    runs = [measure_imports(args.module) for _ in range(args.runs)]
+    modules = min(runs, key=lambda run: sum(m["self_ms"] for m in run))
+    total_ms = sum(m["self_ms"] for m in modules)
+    packages = by_package(modules)
+
+    print(f"⏱  import {args.module}: {total_ms:.0f}ms (best of {args.runs}, budget {args.budget_ms:.0f}ms)\n")
+    print(f"  {'package':<32} {'ms':>8} {'share':>7}")
+    for package, ms in list(packages.items())[:args.top]:
+        print(f"  {package:<32} {ms:>8.1f} {ms / total_ms:>7.1%}")
+    print(f"\n  {'slowest modules (self)':<48} {'self ms':>8} {'cum ms':>8}")
+    for module in sorted(modules, key=lambda m: m["self_ms"], reverse=True)[:args.top]:
+        print(f"  {module['module']:<48} {module['self_ms']:>8.1f} {module['cumulative_ms']:>8.1f}")
+
+    if args.output:
+        output = args.output if args.output.is_absolute() else Path.cwd() / args.output
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps({
+            "started_at": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "module": args.module,
+            "total_ms": round(total_ms, 1),
+            "budget_ms": args.budget_ms,
+            "packages": {package: round(ms, 1) for package, ms in packages.items()},
+            "modules": modules,
+        }, indent=2))
+        print(f"\n📄 Results written to {output}")
+
+    if total_ms > args.budget_ms:
+        print(f"\n❌ Import time {total_ms:.0f}ms is over the {args.budget_ms:.0f}ms budget")
+        sys.exit(1)
+    print(f"\n✅ Within the {args.budget_ms:.0f}ms budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,40 @@
 from typing import List, Dict, Optional
-from openai import OpenAI
 import os
 import json
 from uuid import UUID, uuid4
 from core.travel_post import TravelPost
 from core.travel_user import TravelUser
 from solar.access import public
+from solar import metrics
 from datetime import datetime
+import threading
+import time
+
+OPENAI_MODEL = "gpt-4.1-mini" # Usamos un modelo rápido y eficiente
 
 # La clave API de OpenAI se inyectará en el entorno
-# Inicialización opcional: solo si existe la clave
-try:
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if api_key:
-        client = OpenAI(api_key=api_key)
-    else:
-        client = None
-except Exception as e:
-    print(f"Warning: OpenAI client could not be initialized: {e}")
-    client = None
+# El SDK de openai tarda ~0.5s en importarse: el cliente se crea en la primera llamada, no al arrancar
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client():
+    """Cliente de OpenAI compartido, o None si no hay OPENAI_API_KEY."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                api_key = os.environ.get("OPENAI_API_KEY")
+                if not api_key:
+                    return None
+                try:
+                    from openai import OpenAI
+                    _client = OpenAI(api_key=api_key)
+                except Exception as e:
+                    print(f"Warning: OpenAI client could not be initialized: {e}")
+                    return None
+    return _client
+
 
 @public
 def generate_trip_recommendations(
@@ -90,18 +106,26 @@ def generate_trip_recommendations(
 
     try:
         # Verificar si el cliente de OpenAI está disponible
+        client = get_openai_client()
         if client is None:
             print("OpenAI client is not available. Returning empty recommendations.")
             return []
         
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini", # Usamos un modelo rápido y eficiente
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={"type": "json_object", "schema": response_schema}
-        )
+        started = time.perf_counter()
+        try:
+            response = client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                response_format={"type": "json_object", "schema": response_schema}
+            )
+        except Exception:
+            metrics.OPENAI_REQUEST_DURATION.labels(OPENAI_MODEL, "error").observe(time.perf_counter() - started)
+            raise
+        metrics.OPENAI_REQUEST_DURATION.labels(OPENAI_MODEL, "success").observe(time.perf_counter() - started)
+        metrics.observe_openai_usage(OPENAI_MODEL, response.usage)
         
         # El modelo devuelve un string JSON que debe ser parseado
         json_string = response.choices[0].message.content
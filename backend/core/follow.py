@@ -4,6 +4,7 @@ import uuid
 
 class Follow(Table):
     __tablename__ = "follows"
+    __shard_key__ = "follower_id"
     
     id: uuid.UUID = ColumnDetails(default_factory=uuid.uuid4, primary_key=True)
     follower_id: uuid.UUID  # User who follows
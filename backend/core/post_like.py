@@ -2,8 +2,17 @@ from solar import Table, ColumnDetails
 from datetime import datetime
 import uuid
 
+# Adds the export watermark to post_likes tables created before it; existing rows start at their created_at
+POST_LIKES_UPDATED_AT_COLUMN_DDL = """
+    ALTER TABLE IF EXISTS post_likes ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITHOUT TIME ZONE;
+    UPDATE post_likes SET updated_at = created_at WHERE updated_at IS NULL;
+"""
+
 class PostLike(Table):
     __tablename__ = "post_likes"
+    __shard_key__ = "post_id"
+    __partition_by__ = "created_at"  # monthly partitions, see solar.partitions
+    # No unique (user_id, post_id) constraint is possible once partitioned; toggles lock the pair instead
     
     id: uuid.UUID = ColumnDetails(default_factory=uuid.uuid4, primary_key=True)
     user_id: uuid.UUID  # User who liked
@@ -11,6 +20,7 @@ class PostLike(Table):
     
     # Timestamps
     created_at: datetime = ColumnDetails(default_factory=datetime.now)
+    updated_at: datetime = ColumnDetails(default_factory=datetime.now)  # bumped by every toggle
     
     # Status
     is_active: bool = ColumnDetails(default=True)
\ No newline at end of file
@@ -4,6 +4,7 @@ import uuid
 
 class ReviewVote(Table):
     __tablename__ = "review_votes"
+    __shard_key__ = "review_id"
     
     id: uuid.UUID = ColumnDetails(default_factory=uuid.uuid4, primary_key=True)
     review_id: uuid.UUID  # Review being voted on
@@ -5,6 +5,9 @@ import uuid
 
 class SavedPost(Table):
     __tablename__ = "saved_posts"
+    __shard_key__ = "user_id"
+    __partition_by__ = "created_at"  # monthly partitions, see solar.partitions
+    # No unique (user_id, post_id) constraint is possible once partitioned; toggles lock the pair instead
     
     id: uuid.UUID = ColumnDetails(default_factory=uuid.uuid4, primary_key=True)
     user_id: uuid.UUID  # User who saved the post
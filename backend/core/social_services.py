@@ -1,5 +1,7 @@
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from uuid import UUID
+import base64
+import json
 from datetime import datetime, timedelta
 
 from core.travel_user import TravelUser
@@ -7,7 +9,63 @@ from core.travel_post import TravelPost
 from core.follow import Follow
 from core.post_like import PostLike
 from core.saved_post import SavedPost
+from solar import Table, geo
 from solar.access import public
+from solar.renditions import get_renditions_for_images
+from solar.sharding import group_by_shard, scatter_gather
+
+# Range-partitioned by month on created_at; kept supplied with partitions by solar.partitions.
+# Their primary keys become (id, created_at), so the database can't enforce one like/save per
+# (user_id, post_id): like_post and save_post_to_wishlist do, under _lock_toggle
+PARTITIONED_TABLES = [TravelPost, PostLike, SavedPost]
+
+
+def _parse_post_row(post_data: Dict) -> TravelPost:
+    """Build a TravelPost from a travel_posts row, whose list/dict columns may come back as text."""
+    # Parse JSON fields if they are strings
+    if isinstance(post_data.get('images'), str):
+        # PostgreSQL array format: {item1,item2}
+        images_str = post_data['images'].strip('{}')
+        post_data['images'] = [img.strip() for img in images_str.split(',') if img.strip()]
+    if isinstance(post_data.get('tags'), str):
+        # PostgreSQL array format: {item1,item2}
+        tags_str = post_data['tags'].strip('{}')
+        post_data['tags'] = [tag.strip() for tag in tags_str.split(',') if tag.strip()]
+    if isinstance(post_data.get('booking_info'), str):
+        # PostgreSQL JSONB format: proper JSON string
+        post_data['booking_info'] = json.loads(post_data['booking_info'])
+    if isinstance(post_data.get('location_coordinates'), str):
+        post_data['location_coordinates'] = json.loads(post_data['location_coordinates'])
+    return TravelPost(**post_data)
+
+
+def _lock_toggle(table_cls, params: Dict) -> None:
+    """
+    Serialize toggles of one (user, target) pair until the enclosing transaction ends.
+    SELECT ... FOR UPDATE locks nothing while the row does not exist yet, so two first taps
+    would both insert; the advisory lock is taken whether or not the row exists.
+    """
+    lock_key = ":".join([table_cls.__tablename__] + [str(value) for value in params.values()])
+    table_cls.sql(
+        "SELECT pg_advisory_xact_lock(hashtext(%(lock_key)s))",
+        {**params, "lock_key": lock_key},
+        read_only=False
+    )
+
+
+def _coordinates(location_coordinates) -> Optional[Tuple[float, float]]:
+    """(lat, lng) of a location_coordinates value (dict or its JSON text), None if missing or invalid."""
+    if isinstance(location_coordinates, str):
+        try:
+            location_coordinates = json.loads(location_coordinates)
+        except ValueError:
+            return None
+    if not isinstance(location_coordinates, dict):
+        return None
+    lat, lng = location_coordinates.get('lat'), location_coordinates.get('lng')
+    if not geo.valid_coordinates(lat, lng):
+        return None
+    return float(lat), float(lng)
 
 
 @public
@@ -16,8 +74,8 @@ def get_social_feed(user_id: UUID, page: int = 0, limit: int = 20) -> List[Dict]
     
     # Get users that this user follows
     following_results = Follow.sql(
-        "SELECT following_id FROM follows WHERE follower_id = %(user_id)s",
-        {"user_id": user_id}
+        "SELECT following_id FROM follows WHERE follower_id = %(follower_id)s",
+        {"follower_id": user_id}
     )
     
     if not following_results:
@@ -32,55 +90,46 @@ def get_social_feed(user_id: UUID, page: int = 0, limit: int = 20) -> List[Dict]
     else:
         # Get posts from followed users
         following_ids = [row["following_id"] for row in following_results]
-        following_ids_str = "', '".join([str(uid) for uid in following_ids])
         
         posts_results = TravelPost.sql(
-            f"SELECT * FROM travel_posts WHERE user_id IN ('{following_ids_str}') AND is_published = true ORDER BY created_at DESC LIMIT %(limit)s OFFSET %(offset)s",
-            {"limit": limit, "offset": page * limit}
+            "SELECT * FROM travel_posts WHERE user_id = ANY(%(following_ids)s) AND is_published = true ORDER BY created_at DESC LIMIT %(limit)s OFFSET %(offset)s",
+            {"following_ids": following_ids, "limit": limit, "offset": page * limit}
         )
     
+    # Which of this page's posts the viewer liked/saved, one query per shard instead of two per post
+    post_ids = [row["id"] for row in posts_results]
+    liked_post_ids = {
+        row["post_id"] for row in scatter_gather(
+            PostLike,
+            "SELECT post_id FROM post_likes WHERE user_id = %(user_id)s AND post_id = ANY(%(post_ids)s)",
+            shard_params={
+                shard: {"user_id": user_id, "post_ids": shard_post_ids}
+                for shard, shard_post_ids in group_by_shard(PostLike, post_ids).items()
+            },
+        )
+    } if post_ids else set()
+    saved_post_ids = {
+        row["post_id"] for row in SavedPost.sql(
+            "SELECT post_id FROM saved_posts WHERE user_id = %(user_id)s AND post_id = ANY(%(post_ids)s)",
+            {"user_id": user_id, "post_ids": post_ids}
+        )
+    } if post_ids else set()
+
     # Enrich posts with user data and engagement info
+    authors = _authors_by_id([row["user_id"] for row in posts_results])
     enriched_posts = []
     for post_data in posts_results:
-        # Parse JSON fields if they are strings
-        import json
-        if isinstance(post_data.get('images'), str):
-            # PostgreSQL array format: {item1,item2}
-            images_str = post_data['images'].strip('{}')
-            post_data['images'] = [img.strip() for img in images_str.split(',') if img.strip()]
-        if isinstance(post_data.get('tags'), str):
-            # PostgreSQL array format: {item1,item2}
-            tags_str = post_data['tags'].strip('{}')
-            post_data['tags'] = [tag.strip() for tag in tags_str.split(',') if tag.strip()]
-        if isinstance(post_data.get('booking_info'), str):
-            # PostgreSQL JSONB format: proper JSON string
-            post_data['booking_info'] = json.loads(post_data['booking_info'])
+        post = _parse_post_row(post_data)
+        user = authors.get(post.user_id)
         
-        post = TravelPost(**post_data)
-        
-        # Get post author info
-        user_results = TravelUser.sql(
-            "SELECT * FROM travel_users WHERE id = %(user_id)s",
-            {"user_id": post.user_id}
-        )
-        user = TravelUser(**user_results[0]) if user_results else None
-        
-        # Check if current user has liked/saved this post
-        like_results = PostLike.sql(
-            "SELECT id FROM post_likes WHERE user_id = %(user_id)s AND post_id = %(post_id)s",
-            {"user_id": user_id, "post_id": post.id}
-        )
-        
-        saved_results = SavedPost.sql(
-            "SELECT id FROM saved_posts WHERE user_id = %(user_id)s AND post_id = %(post_id)s",
-            {"user_id": user_id, "post_id": post.id}
-        )
+        post_payload = post.model_dump()
+        post_payload["image_renditions"] = get_renditions_for_images(post.images)
         
         enriched_posts.append({
-            "post": post.model_dump(),
+            "post": post_payload,
             "author": user.model_dump() if user else None,
-            "is_liked": bool(like_results),
-            "is_saved": bool(saved_results)
+            "is_liked": post.id in liked_post_ids,
+            "is_saved": post.id in saved_post_ids
         })
         
     return enriched_posts
@@ -90,34 +139,35 @@ def get_social_feed(user_id: UUID, page: int = 0, limit: int = 20) -> List[Dict]
 def like_post(user_id: UUID, post_id: UUID) -> Dict:
     """Like or unlike a post."""
     
-    # Check if already liked
-    existing_like = PostLike.sql(
-        "SELECT * FROM post_likes WHERE user_id = %(user_id)s AND post_id = %(post_id)s",
-        {"user_id": user_id, "post_id": post_id}
-    )
-    
-    if existing_like:
-        # Toggle like status
-        like = PostLike(**existing_like[0])
-        like.is_active = not like.is_active
-        like.sync()
-        action = "liked" if like.is_active else "unliked"
-    else:
-        # Create new like
-        like = PostLike(user_id=user_id, post_id=post_id)
-        like.sync()
-        action = "liked"
-    
-    # Update post likes count
-    likes_count = len(PostLike.sql(
-        "SELECT id FROM post_likes WHERE post_id = %(post_id)s AND is_active = true",
-        {"post_id": post_id}
-    ))
-    
-    TravelPost.sql(
-        "UPDATE travel_posts SET likes_count = %(count)s WHERE id = %(post_id)s",
-        {"count": likes_count, "post_id": post_id}
-    )
+    # One connection and one commit for the whole toggle; the pair lock serializes double taps
+    with Table.transaction():
+        _lock_toggle(PostLike, {"user_id": user_id, "post_id": post_id})
+        
+        # Check if already liked
+        existing_like = PostLike.sql(
+            "SELECT * FROM post_likes WHERE user_id = %(user_id)s AND post_id = %(post_id)s",
+            {"user_id": user_id, "post_id": post_id}
+        )
+        
+        if existing_like:
+            # Toggle like status
+            like = PostLike(**existing_like[0])
+            like.is_active = not like.is_active
+            like.updated_at = datetime.now()
+            like.sync()
+            action = "liked" if like.is_active else "unliked"
+        else:
+            # Create new like
+            like = PostLike(user_id=user_id, post_id=post_id)
+            like.sync()
+            action = "liked"
+        
+        # Update post likes count in place, so concurrent likes by other users are not lost
+        updated = TravelPost.sql(
+            "UPDATE travel_posts SET likes_count = GREATEST(likes_count + %(delta)s, 0), updated_at = %(updated_at)s WHERE id = %(post_id)s RETURNING likes_count",
+            {"delta": 1 if like.is_active else -1, "updated_at": datetime.now(), "post_id": post_id}
+        )
+        likes_count = updated[0]["likes_count"] if updated else 0
     
     return {"action": action, "likes_count": likes_count}
 
@@ -126,41 +176,40 @@ def like_post(user_id: UUID, post_id: UUID) -> Dict:
 def save_post_to_wishlist(user_id: UUID, post_id: UUID, collection_name: Optional[str] = None, notes: Optional[str] = None) -> Dict:
     """Save a post to user's wishlist."""
     
-    # Check if already saved
-    existing_save = SavedPost.sql(
-        "SELECT * FROM saved_posts WHERE user_id = %(user_id)s AND post_id = %(post_id)s",
-        {"user_id": user_id, "post_id": post_id}
-    )
-    
-    if existing_save:
-        # Toggle save status
-        saved = SavedPost(**existing_save[0])
-        saved.is_active = not saved.is_active
-        if saved.is_active and collection_name:
-            saved.collection_name = collection_name
-        saved.updated_at = datetime.now()
-        saved.sync()
-        action = "saved" if saved.is_active else "unsaved"
-    else:
-        # Create new save
-        saved = SavedPost(
-            user_id=user_id,
-            post_id=post_id,
-            collection_name=collection_name
+    with Table.transaction():
+        _lock_toggle(SavedPost, {"user_id": user_id, "post_id": post_id})
+        
+        # Check if already saved
+        existing_save = SavedPost.sql(
+            "SELECT * FROM saved_posts WHERE user_id = %(user_id)s AND post_id = %(post_id)s",
+            {"user_id": user_id, "post_id": post_id}
         )
-        saved.sync()
-        action = "saved"
-    
-    # Update post saves count
-    saves_count = len(SavedPost.sql(
-        "SELECT id FROM saved_posts WHERE post_id = %(post_id)s AND is_active = true",
-        {"post_id": post_id}
-    ))
-    
-    TravelPost.sql(
-        "UPDATE travel_posts SET saves_count = %(count)s WHERE id = %(post_id)s",
-        {"count": saves_count, "post_id": post_id}
-    )
+        
+        if existing_save:
+            # Toggle save status
+            saved = SavedPost(**existing_save[0])
+            saved.is_active = not saved.is_active
+            if saved.is_active and collection_name:
+                saved.collection_name = collection_name
+            saved.updated_at = datetime.now()
+            saved.sync()
+            action = "saved" if saved.is_active else "unsaved"
+        else:
+            # Create new save
+            saved = SavedPost(
+                user_id=user_id,
+                post_id=post_id,
+                collection_name=collection_name
+            )
+            saved.sync()
+            action = "saved"
+        
+        # Update post saves count in place, so concurrent saves by other users are not lost
+        updated = TravelPost.sql(
+            "UPDATE travel_posts SET saves_count = GREATEST(saves_count + %(delta)s, 0), updated_at = %(updated_at)s WHERE id = %(post_id)s RETURNING saves_count",
+            {"delta": 1 if saved.is_active else -1, "updated_at": datetime.now(), "post_id": post_id}
+        )
+        saves_count = updated[0]["saves_count"] if updated else 0
     
     return {"action": action, "saves_count": saves_count}
 
@@ -169,44 +218,41 @@ def save_post_to_wishlist(user_id: UUID, post_id: UUID, collection_name: Optiona
 def follow_user(follower_id: UUID, following_id: UUID) -> Dict:
     """Follow or unfollow a user."""
     
-    # Check if already following
-    existing_follow = Follow.sql(
-        "SELECT * FROM follows WHERE follower_id = %(follower_id)s AND following_id = %(following_id)s",
-        {"follower_id": follower_id, "following_id": following_id}
-    )
-    
-    if existing_follow:
-        # Toggle follow status
-        follow = Follow(**existing_follow[0])
-        follow.is_active = not follow.is_active
-        follow.sync()
-        action = "followed" if follow.is_active else "unfollowed"
-    else:
-        # Create new follow
-        follow = Follow(follower_id=follower_id, following_id=following_id)
-        follow.sync()
-        action = "followed"
-    
-    # Update follower/following counts
-    followers_count = len(Follow.sql(
-        "SELECT id FROM follows WHERE following_id = %(user_id)s AND is_active = true",
-        {"user_id": following_id}
-    ))
-    
-    following_count = len(Follow.sql(
-        "SELECT id FROM follows WHERE follower_id = %(user_id)s AND is_active = true",
-        {"user_id": follower_id}
-    ))
-    
-    TravelUser.sql(
-        "UPDATE travel_users SET followers_count = %(count)s WHERE id = %(user_id)s",
-        {"count": followers_count, "user_id": following_id}
-    )
-    
-    TravelUser.sql(
-        "UPDATE travel_users SET following_count = %(count)s WHERE id = %(user_id)s",
-        {"count": following_count, "user_id": follower_id}
-    )
+    with Table.transaction():
+        _lock_toggle(Follow, {"follower_id": follower_id, "following_id": following_id})
+        
+        # Check if already following
+        existing_follow = Follow.sql(
+            "SELECT * FROM follows WHERE follower_id = %(follower_id)s AND following_id = %(following_id)s",
+            {"follower_id": follower_id, "following_id": following_id}
+        )
+        
+        if existing_follow:
+            # Toggle follow status
+            follow = Follow(**existing_follow[0])
+            follow.is_active = not follow.is_active
+            follow.sync()
+            action = "followed" if follow.is_active else "unfollowed"
+        else:
+            # Create new follow
+            follow = Follow(follower_id=follower_id, following_id=following_id)
+            follow.sync()
+            action = "followed"
+        
+        # Update follower/following counts in place, so concurrent follows are not lost
+        delta, updated_at = (1 if follow.is_active else -1), datetime.now()
+        with Table.pipeline() as pipe:
+            followers_query = pipe.sql(
+                TravelUser,
+                "UPDATE travel_users SET followers_count = GREATEST(followers_count + %(delta)s, 0), updated_at = %(updated_at)s WHERE id = %(user_id)s RETURNING followers_count",
+                {"delta": delta, "updated_at": updated_at, "user_id": following_id}
+            )
+            pipe.sql(
+                TravelUser,
+                "UPDATE travel_users SET following_count = GREATEST(following_count + %(delta)s, 0), updated_at = %(updated_at)s WHERE id = %(user_id)s",
+                {"delta": delta, "updated_at": updated_at, "user_id": follower_id}
+            )
+        followers_count = followers_query.rows[0]["followers_count"] if followers_query.rows else 0
     
     return {"action": action, "followers_count": followers_count}
 
@@ -226,21 +272,27 @@ def get_user_saved_posts(user_id: UUID, location_filter: Optional[str] = None, c
     
     saved_results = SavedPost.sql(query, params)
     
+    # The saved posts themselves, in one query
+    post_ids = list({row["post_id"] for row in saved_results})
+    posts = {
+        row["id"]: row for row in TravelPost.sql(
+            "SELECT * FROM travel_posts WHERE id = ANY(%(post_ids)s)",
+            {"post_ids": post_ids}
+        )
+    } if post_ids else {}
+    
     enriched_saves = []
     for save_data in saved_results:
         saved = SavedPost(**save_data)
+        post_data = posts.get(saved.post_id)
         
-        # Get the actual post
-        post_results = TravelPost.sql(
-            "SELECT * FROM travel_posts WHERE id = %(post_id)s",
-            {"post_id": saved.post_id}
-        )
-        
-        if post_results:
-            post = TravelPost(**post_results[0])
+        if post_data:
+            post = TravelPost(**post_data)
+            post_payload = post.model_dump()
+            post_payload["image_renditions"] = get_renditions_for_images(post.images)
             enriched_saves.append({
                 "saved_post": saved.model_dump(),
-                "post": post.model_dump()
+                "post": post_payload
             })
     
     return enriched_saves
@@ -259,9 +311,15 @@ def get_saved_locations(user_id: UUID) -> List[Dict]:
 
 
 @public
-def create_travel_post(user_id: UUID, caption: str, images: List[str], location_name: str, country: str, post_type: str, category: str, tags: List[str], city: Optional[str] = None, booking_info: Optional[Dict] = None) -> TravelPost:
+def create_travel_post(user_id: UUID, caption: str, images: List[str], location_name: str, country: str, post_type: str, category: str, tags: List[str], city: Optional[str] = None, booking_info: Optional[Dict] = None, location_coordinates: Optional[Dict] = None) -> TravelPost:
     """Create a new travel post."""
     
+    coordinates = None
+    if location_coordinates is not None:
+        coordinates = _coordinates(location_coordinates)
+        if coordinates is None:
+            raise ValueError("location_coordinates must be {\"lat\": -90..90, \"lng\": -180..180}")
+    
     post = TravelPost(
         user_id=user_id,
         caption=caption,
@@ -272,24 +330,224 @@ def create_travel_post(user_id: UUID, caption: str, images: List[str], location_
         post_type=post_type,
         category=category,
         tags=tags,
-        booking_info=booking_info
+        booking_info=booking_info,
+        location_coordinates={"lat": coordinates[0], "lng": coordinates[1]} if coordinates else None,
+        geohash=geo.encode(*coordinates) if coordinates else None
     )
     post.sync()
     
     # Update user's post count
     TravelUser.sql(
-        "UPDATE travel_users SET posts_count = posts_count + 1 WHERE id = %(user_id)s",
-        {"user_id": user_id}
+        "UPDATE travel_users SET posts_count = posts_count + 1, updated_at = %(updated_at)s WHERE id = %(user_id)s",
+        {"updated_at": datetime.now(), "user_id": user_id}
     )
     
     return post
 
 
+# ==================== SEARCH ====================
+
+def _encode_page_cursor(sort_value: float, post_id: UUID) -> str:
+    """Opaque keyset cursor: the (sort value, id) of the last post of a page."""
+    payload = json.dumps({"value": sort_value, "id": str(post_id)}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def _decode_page_cursor(cursor: str) -> Dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return {"value": float(payload["value"]), "id": UUID(payload["id"])}
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid page cursor")
+
+
+def _authors_by_id(user_ids: List[UUID]) -> Dict[UUID, TravelUser]:
+    """The distinct authors of a page of posts, in one query."""
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return {}
+    return {
+        row["id"]: TravelUser(**row) for row in TravelUser.sql(
+            "SELECT * FROM travel_users WHERE id = ANY(%(user_ids)s)",
+            {"user_ids": user_ids}
+        )
+    }
+
+
+def _post_page_results(posts_results: List[Dict], score_column: str, score_name: str) -> List[Dict]:
+    """{post, author, <score_name>} for each row of a page, with the authors fetched in one query."""
+    authors = _authors_by_id([row["user_id"] for row in posts_results])
+
+    results = []
+    for post_data in posts_results:
+        score = post_data[score_column]
+        post = _parse_post_row(post_data)
+        post_payload = post.model_dump()
+        post_payload["image_renditions"] = get_renditions_for_images(post.images)
+        author = authors.get(post.user_id)
+        results.append({
+            "post": post_payload,
+            "author": author.model_dump() if author else None,
+            score_name: score
+        })
+    return results
+
+
+@public
+def search_posts(query: str, limit: int = 20, cursor: Optional[str] = None) -> Dict:
+    """Search published posts by caption, location and tags ("sunset hikes in Kyoto"), best matches first."""
+
+    limit = max(1, min(limit, 50))
+    after = _decode_page_cursor(cursor) if cursor else {"value": None, "id": None}
+
+    # Matches come from the GIN index on search_vector; the page continues after the cursor's
+    # (rank, id), so deep pages cost the same as the first one
+    posts_results = TravelPost.sql(
+        """
+        SELECT * FROM (
+            SELECT p.*, ts_rank(p.search_vector, q.query) AS search_rank
+            FROM travel_posts p, websearch_to_tsquery('english', %(query)s) AS q(query)
+            WHERE p.search_vector @@ q.query AND p.is_published = true
+        ) ranked
+        WHERE %(after_rank)s::real IS NULL OR (search_rank, id) < (%(after_rank)s::real, %(after_id)s::uuid)
+        ORDER BY search_rank DESC, id DESC
+        LIMIT %(limit)s
+        """,
+        {"query": query, "after_rank": after["value"], "after_id": after["id"], "limit": limit + 1}
+    )
+    has_more = len(posts_results) > limit
+    posts_results = posts_results[:limit]
+
+    results = _post_page_results(posts_results, "search_rank", "rank")
+
+    next_cursor = None
+    if has_more and posts_results:
+        last = posts_results[-1]
+        next_cursor = _encode_page_cursor(last["search_rank"], last["id"])
+
+    return {"results": results, "next_cursor": next_cursor}
+
+
+@public
+def autocomplete_locations(prefix: str, limit: int = 10) -> List[Dict]:
+    """Suggest post locations for a partly typed (or misspelled) place name, e.g. "kyot" or "kioto"."""
+
+    prefix = prefix.strip()
+    if not prefix:
+        return []
+    # Escape LIKE wildcards so they match literally
+    like_prefix = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+    # Both the prefix match and the fuzzy word match (<%) use the trigram index on location_name
+    return TravelPost.sql(
+        """
+        SELECT location_name, country, COUNT(*) AS posts_count,
+               MAX(word_similarity(%(prefix)s, location_name)) AS score
+        FROM travel_posts
+        WHERE is_published = true
+          AND (location_name ILIKE %(like_prefix)s OR %(prefix)s <%% location_name)
+        GROUP BY location_name, country
+        ORDER BY score DESC, posts_count DESC
+        LIMIT %(limit)s
+        """,
+        {"prefix": prefix, "like_prefix": like_prefix, "limit": max(1, min(limit, 25))}
+    )
+
+
+# ==================== NEARBY ====================
+
+MAX_NEARBY_RADIUS_KM = 500
+DISTANCE_KM_SQL = f"""
+    {geo.EARTH_RADIUS_KM} * 2 * asin(least(1.0, sqrt(
+        power(sin(radians((p.location_coordinates::jsonb ->> 'lat')::float8 - %(lat)s) / 2), 2) +
+        cos(radians(%(lat)s)) * cos(radians((p.location_coordinates::jsonb ->> 'lat')::float8)) *
+        power(sin(radians((p.location_coordinates::jsonb ->> 'lng')::float8 - %(lng)s) / 2), 2)
+    )))
+"""
+
+
+@public
+def get_nearby_posts(lat: float, lng: float, radius_km: float = 10, limit: int = 20, cursor: Optional[str] = None) -> Dict:
+    """Published posts within radius_km of (lat, lng), closest first."""
+
+    if not geo.valid_coordinates(lat, lng):
+        raise ValueError("lat must be within -90..90 and lng within -180..180")
+    if not 0 < radius_km <= MAX_NEARBY_RADIUS_KM:
+        raise ValueError(f"radius_km must be within 0..{MAX_NEARBY_RADIUS_KM}")
+    limit = max(1, min(limit, 50))
+    after = _decode_page_cursor(cursor) if cursor else {"value": None, "id": None}
+
+    # Candidates are the posts in the geohash cells covering the circle, each cell one range
+    # scan of the geohash index; only those get an exact distance, so the cost follows the
+    # number of posts around the point, not the size of the table
+    lows, highs = geo.prefix_ranges(geo.covering_cells(lat, lng, radius_km))
+    posts_results = TravelPost.sql(
+        f"""
+        SELECT * FROM (
+            SELECT p.*, {DISTANCE_KM_SQL} AS distance_km
+            FROM unnest(%(lows)s::text[], %(highs)s::text[]) AS cell(low, high)
+            JOIN travel_posts p
+              ON p.geohash COLLATE "C" >= cell.low AND p.geohash COLLATE "C" < cell.high
+            WHERE p.is_published = true
+        ) nearby
+        WHERE distance_km <= %(radius_km)s
+          AND (%(after_distance)s::float8 IS NULL OR (distance_km, id) > (%(after_distance)s::float8, %(after_id)s::uuid))
+        ORDER BY distance_km, id
+        LIMIT %(limit)s
+        """,
+        {
+            "lat": lat, "lng": lng, "radius_km": radius_km, "lows": lows, "highs": highs,
+            "after_distance": after["value"], "after_id": after["id"], "limit": limit + 1
+        }
+    )
+    has_more = len(posts_results) > limit
+    posts_results = posts_results[:limit]
+
+    results = _post_page_results(posts_results, "distance_km", "distance_km")
+
+    next_cursor = None
+    if has_more and posts_results:
+        last = posts_results[-1]
+        next_cursor = _encode_page_cursor(last["distance_km"], last["id"])
+
+    return {"results": results, "next_cursor": next_cursor}
+
+
+def backfill_post_geohashes(batch_size: int = 1000) -> int:
+    """Set the geohash of posts that have coordinates but no geohash yet; returns how many were set."""
+    updated = 0
+    for rows in TravelPost.stream(
+        "SELECT id, location_coordinates FROM travel_posts WHERE geohash IS NULL AND location_coordinates IS NOT NULL",
+        batch_size=batch_size,
+        batches=True,
+    ):
+        ids, geohashes = [], []
+        for row in rows:
+            coordinates = _coordinates(row["location_coordinates"])
+            if coordinates is not None:
+                ids.append(row["id"])
+                geohashes.append(geo.encode(*coordinates))
+        if ids:
+            TravelPost.sql(
+                """
+                UPDATE travel_posts AS p SET geohash = v.geohash, updated_at = %(updated_at)s
+                FROM unnest(%(ids)s::uuid[], %(geohashes)s::text[]) AS v(id, geohash)
+                WHERE p.id = v.id
+                """,
+                {"ids": ids, "geohashes": geohashes, "updated_at": datetime.now()}
+            )
+            updated += len(ids)
+    return updated
+
+
 # ==================== REVIEWS SYSTEM ====================
 
 from core.review import Review
 from core.review_vote import ReviewVote
 
+# Tables the admin export (solar.export) can stream, by table name
+EXPORTABLE_TABLES = {table.__tablename__: table for table in (TravelPost, TravelUser, PostLike, SavedPost, Review)}
+
 
 @public
 def create_review(user_id: UUID, post_id: UUID, rating: int, comment: Optional[str] = None) -> Dict:
@@ -333,31 +591,40 @@ def get_post_reviews(post_id: UUID, page: int = 0, limit: int = 20) -> Dict:
     """Get all reviews for a post."""
     
     offset = page * limit
-    
-    reviews_results = Review.sql(
-        """
-        SELECT r.*, u.username, u.display_name, u.profile_image_url, u.is_verified
-        FROM reviews r
-        JOIN travel_users u ON r.user_id = u.id
-        WHERE r.post_id = %(post_id)s AND r.is_active = true
-        ORDER BY r.helpful_count DESC, r.created_at DESC
-        LIMIT %(limit)s OFFSET %(offset)s
-        """,
-        {"post_id": post_id, "limit": limit, "offset": offset}
-    )
+    params = {"post_id": post_id, "limit": limit, "offset": offset}
+    
+    # Page, total and average are independent: one round trip for the three
+    with Table.pipeline() as pipe:
+        page_query = pipe.sql(
+            Review,
+            """
+            SELECT r.*, u.username, u.display_name, u.profile_image_url, u.is_verified
+            FROM reviews r
+            JOIN travel_users u ON r.user_id = u.id
+            WHERE r.post_id = %(post_id)s AND r.is_active = true
+            ORDER BY r.helpful_count DESC, r.created_at DESC
+            LIMIT %(limit)s OFFSET %(offset)s
+            """,
+            params
+        )
+        count_query = pipe.sql(
+            Review,
+            "SELECT COUNT(*) as total FROM reviews WHERE post_id = %(post_id)s AND is_active = true",
+            params
+        )
+        avg_query = pipe.sql(
+            Review,
+            "SELECT AVG(rating) as avg_rating FROM reviews WHERE post_id = %(post_id)s AND is_active = true",
+            params
+        )
+    reviews_results = page_query.rows
     
     # Get total count
-    count_results = Review.sql(
-        "SELECT COUNT(*) as total FROM reviews WHERE post_id = %(post_id)s AND is_active = true",
-        {"post_id": post_id}
-    )
+    count_results = count_query.rows
     total_reviews = count_results[0]["total"] if count_results else 0
     
     # Get average rating
-    avg_results = Review.sql(
-        "SELECT AVG(rating) as avg_rating FROM reviews WHERE post_id = %(post_id)s AND is_active = true",
-        {"post_id": post_id}
-    )
+    avg_results = avg_query.rows
     avg_rating = float(avg_results[0]["avg_rating"]) if avg_results and avg_results[0]["avg_rating"] else 0
     
     return {
@@ -435,42 +702,44 @@ def delete_review(user_id: UUID, review_id: UUID) -> Dict:
 def vote_review(user_id: UUID, review_id: UUID, is_helpful: bool) -> Dict:
     """Vote on whether a review is helpful or not."""
     
-    # Check if user already voted on this review
-    existing_vote = ReviewVote.sql(
-        "SELECT * FROM review_votes WHERE user_id = %(user_id)s AND review_id = %(review_id)s",
-        {"user_id": user_id, "review_id": review_id}
-    )
-    
-    if existing_vote:
-        # Update existing vote
-        vote = ReviewVote(**existing_vote[0])
-        if vote.is_helpful == is_helpful and vote.is_active:
-            # Same vote - toggle off
-            vote.is_active = False
+    with Table.transaction():
+        _lock_toggle(ReviewVote, {"user_id": user_id, "review_id": review_id})
+        
+        # Check if user already voted on this review
+        existing_vote = ReviewVote.sql(
+            "SELECT * FROM review_votes WHERE user_id = %(user_id)s AND review_id = %(review_id)s",
+            {"user_id": user_id, "review_id": review_id}
+        )
+        
+        was_helpful = False
+        if existing_vote:
+            # Update existing vote
+            vote = ReviewVote(**existing_vote[0])
+            was_helpful = vote.is_helpful and vote.is_active
+            if vote.is_helpful == is_helpful and vote.is_active:
+                # Same vote - toggle off
+                vote.is_active = False
+            else:
+                # Different vote or reactivating
+                vote.is_helpful = is_helpful
+                vote.is_active = True
+            vote.sync()
         else:
-            # Different vote or reactivating
-            vote.is_helpful = is_helpful
-            vote.is_active = True
-        vote.sync()
-    else:
-        # Create new vote
-        vote = ReviewVote(
-            user_id=user_id,
-            review_id=review_id,
-            is_helpful=is_helpful
+            # Create new vote
+            vote = ReviewVote(
+                user_id=user_id,
+                review_id=review_id,
+                is_helpful=is_helpful
+            )
+            vote.sync()
+        
+        # Update review's helpful count in place, so concurrent votes by other users are not lost
+        delta = int(vote.is_helpful and vote.is_active) - int(was_helpful)
+        updated = Review.sql(
+            "UPDATE reviews SET helpful_count = GREATEST(helpful_count + %(delta)s, 0), updated_at = %(updated_at)s WHERE id = %(review_id)s RETURNING helpful_count",
+            {"delta": delta, "updated_at": datetime.now(), "review_id": review_id}
         )
-        vote.sync()
-    
-    # Update review's helpful count
-    helpful_count = len(ReviewVote.sql(
-        "SELECT id FROM review_votes WHERE review_id = %(review_id)s AND is_helpful = true AND is_active = true",
-        {"review_id": review_id}
-    ))
-    
-    Review.sql(
-        "UPDATE reviews SET helpful_count = %(count)s WHERE id = %(review_id)s",
-        {"count": helpful_count, "review_id": review_id}
-    )
+        helpful_count = updated[0]["helpful_count"] if updated else 0
     
     return {
         "action": "voted" if vote.is_active else "vote_removed",
@@ -497,6 +766,6 @@ def _update_post_review_stats(post_id: UUID):
     
     # Update post
     TravelPost.sql(
-        "UPDATE travel_posts SET experience_rating = %(rating)s, comments_count = %(count)s WHERE id = %(post_id)s",
-        {"rating": round(avg_rating, 1), "count": review_count, "post_id": post_id}
+        "UPDATE travel_posts SET experience_rating = %(rating)s, comments_count = %(count)s, updated_at = %(updated_at)s WHERE id = %(post_id)s",
+        {"rating": round(avg_rating, 1), "count": review_count, "updated_at": datetime.now(), "post_id": post_id}
     )
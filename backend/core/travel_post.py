@@ -3,8 +3,30 @@ from typing import Optional, List, Dict
 from datetime import datetime
 import uuid
 
+# Adds the column to travel_posts tables created before it; create_table then indexes it
+TRAVEL_POSTS_GEOHASH_COLUMN_DDL = "ALTER TABLE travel_posts ADD COLUMN IF NOT EXISTS geohash TEXT"
+
 class TravelPost(Table):
     __tablename__ = "travel_posts"
+    __partition_by__ = "created_at"  # monthly partitions, see solar.partitions
+    
+    # Full-text search (social_services.search_posts): places and tags outrank caption words.
+    # tags is text ('{hiking,sunset}') or jsonb depending on how the table was created; either way
+    # its text form splits into the tag words.
+    __extensions__ = ["pg_trgm"]
+    __generated_columns__ = {
+        "search_vector": """tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(location_name, '') || ' ' || coalesce(city, '') || ' ' || coalesce(country, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(tags::text, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(caption, '')), 'B')
+        ) STORED""",
+    }
+    __indexes__ = {
+        "travel_posts_search_idx": "USING GIN (search_vector)",
+        "travel_posts_location_trgm_idx": "USING GIN (location_name gin_trgm_ops)",
+        # Nearby posts (social_services.get_nearby_posts): one range scan per covering geohash cell
+        "travel_posts_geohash_idx": '("geohash" COLLATE "C")',
+    }
     
     id: uuid.UUID = ColumnDetails(default_factory=uuid.uuid4, primary_key=True)
     user_id: uuid.UUID  # Reference to TravelUser
@@ -14,6 +36,7 @@ class TravelPost(Table):
     images: List[str]  # URLs to images
     location_name: str
     location_coordinates: Optional[Dict] = None  # {"lat": float, "lng": float}
+    geohash: Optional[str] = None  # of location_coordinates, see solar.geo
     country: str
     city: Optional[str] = None
     
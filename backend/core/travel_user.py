@@ -3,6 +3,12 @@ from typing import Optional, List
 from datetime import datetime
 import uuid
 
+# Adds the export watermark to travel_users tables created before it
+TRAVEL_USERS_UPDATED_AT_COLUMN_DDL = """
+    ALTER TABLE IF EXISTS travel_users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITHOUT TIME ZONE;
+    UPDATE travel_users SET updated_at = COALESCE(last_active, created_at) WHERE updated_at IS NULL;
+"""
+
 class TravelUser(Table):
     __tablename__ = "travel_users"
     
@@ -33,6 +39,7 @@ class TravelUser(Table):
     # Timestamps
     created_at: datetime = ColumnDetails(default_factory=datetime.now)
     last_active: datetime = ColumnDetails(default_factory=datetime.now)
+    updated_at: datetime = ColumnDetails(default_factory=datetime.now)  # profile or counters changed
     
     # Settings
     is_private: bool = ColumnDetails(default=False)
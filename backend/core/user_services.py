@@ -1,10 +1,27 @@
 """
 User services for managing user data and authentication mapping
 """
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from uuid import UUID
+import os
+import uuid
 from core.travel_user import TravelUser
 from solar.access import public
+from solar.cache import LRUCache
+
+# Clerk ids never move to another user, so cached mappings are never stale
+CLERK_UUID_CACHE_SIZE = int(os.environ.get("CLERK_UUID_CACHE_SIZE", "50000"))
+_clerk_uuid_cache = LRUCache(maxsize=CLERK_UUID_CACHE_SIZE, name="clerk_user_uuid")
+
+TRAVEL_USERS_CLERK_ID_INDEX_DDL = """
+    CREATE UNIQUE INDEX IF NOT EXISTS travel_users_clerk_user_id_key
+        ON travel_users (clerk_user_id)
+"""
+
+
+def remember_clerk_user_uuids(mapping: Dict[str, str]):
+    """Seed the mapping cache, e.g. from rows written by the Clerk webhook consumer."""
+    _clerk_uuid_cache.set_many({clerk_id: str(user_id) for clerk_id, user_id in mapping.items()})
 
 
 @public
@@ -13,39 +30,64 @@ def get_user_uuid_by_clerk_id(clerk_user_id: str) -> Optional[str]:
     Get the internal UUID for a user based on their Clerk user ID.
     Returns None if user doesn't exist.
     """
+    cached = _clerk_uuid_cache.get(clerk_user_id)
+    if cached is not None:
+        return cached
+
     results = TravelUser.sql(
         "SELECT id FROM travel_users WHERE clerk_user_id = %(clerk_user_id)s",
         {"clerk_user_id": clerk_user_id}
     )
-    
+
     if results:
-        return str(results[0]["id"])
+        user_uuid = str(results[0]["id"])
+        _clerk_uuid_cache.set(clerk_user_id, user_uuid)
+        return user_uuid
     return None
 
 
+@public
+def get_user_uuids_by_clerk_ids(clerk_user_ids: List[str]) -> Dict[str, str]:
+    """
+    Resolve many Clerk user IDs at once.
+    Unknown ids are left out of the returned mapping.
+    """
+    unique_ids = list(dict.fromkeys(clerk_user_ids))
+    found = _clerk_uuid_cache.get_many(unique_ids)
+    missing = [clerk_user_id for clerk_user_id in unique_ids if clerk_user_id not in found]
+
+    if missing:
+        results = TravelUser.sql(
+            "SELECT clerk_user_id, id FROM travel_users WHERE clerk_user_id = ANY(%(clerk_user_ids)s)",
+            {"clerk_user_ids": missing}
+        )
+        resolved = {row["clerk_user_id"]: str(row["id"]) for row in results}
+        _clerk_uuid_cache.set_many(resolved)
+        found.update(resolved)
+
+    return found
+
+
 @public
 def get_or_create_user_uuid(clerk_user_id: str, username: str, email: str, display_name: str, profile_image_url: Optional[str] = None) -> str:
     """
     Get existing user UUID or create a new user if they don't exist.
     This is useful for ensuring users exist before creating posts.
     """
-    # Try to get existing user
-    user_uuid = get_user_uuid_by_clerk_id(clerk_user_id)
-    
-    if user_uuid:
-        return user_uuid
-    
-    # User doesn't exist, create them
-    import uuid
-    new_user_id = str(uuid.uuid4())
-    
-    TravelUser.sql(
-        """INSERT INTO travel_users 
-           (id, clerk_user_id, email, username, display_name, profile_image_url, created_at)
-           VALUES (%(id)s, %(clerk_user_id)s, %(email)s, %(username)s, %(display_name)s, %(profile_image_url)s, NOW())
-           ON CONFLICT (clerk_user_id) DO NOTHING""",
+    cached = _clerk_uuid_cache.get(clerk_user_id)
+    if cached is not None:
+        return cached
+
+    # One round trip for both cases: the conflict branch touches last_active
+    # (this runs at session start) so RETURNING yields the existing id
+    results = TravelUser.sql(
+        """INSERT INTO travel_users
+           (id, clerk_user_id, email, username, display_name, profile_image_url, created_at, updated_at)
+           VALUES (%(id)s, %(clerk_user_id)s, %(email)s, %(username)s, %(display_name)s, %(profile_image_url)s, NOW(), NOW())
+           ON CONFLICT (clerk_user_id) DO UPDATE SET last_active = NOW()
+           RETURNING id""",
         {
-            "id": new_user_id,
+            "id": str(uuid.uuid4()),
             "clerk_user_id": clerk_user_id,
             "email": email,
             "username": username,
@@ -53,5 +95,7 @@ def get_or_create_user_uuid(clerk_user_id: str, username: str, email: str, displ
             "profile_image_url": profile_image_url
         }
     )
-    
-    return new_user_id
+
+    user_uuid = str(results[0]["id"])
+    _clerk_uuid_cache.set(clerk_user_id, user_uuid)
+    return user_uuid
@@ -0,0 +1,21 @@
+from solar import Table, ColumnDetails
+from typing import Optional, Dict
+from datetime import datetime
+
+class WebhookEvent(Table):
+    __tablename__ = "webhook_events"
+    
+    svix_id: str = ColumnDetails(primary_key=True)  # Delivery id from the svix-id header
+    source: str = ColumnDetails(default="clerk")
+    event_type: str
+    payload: Dict
+    
+    # Processing state: 'pending', 'processing', 'done', 'failed'
+    status: str = ColumnDetails(default="pending")
+    attempts: int = ColumnDetails(default=0)
+    last_error: Optional[str] = None
+    
+    # Timestamps
+    received_at: datetime = ColumnDetails(default_factory=datetime.now)
+    claimed_at: Optional[datetime] = None
+    processed_at: Optional[datetime] = None
@@ -0,0 +1,274 @@
+"""
+Inbox for incoming webhook deliveries.
+
+Deliveries are recorded keyed by their svix-id and acknowledged immediately; a background
+consumer claims pending rows in batches, coalesces them per Clerk user and applies them
+with a handful of set-based statements. Svix retries of an already recorded delivery hit
+the primary key and are dropped. Each worker runs a consumer, but a user's events are only
+ever claimed by one batch at a time, so they are applied in order.
+"""
+from typing import List, Dict, Optional, Tuple
+from uuid import uuid4
+
+from psycopg.types.json import Jsonb
+
+from core.travel_user import TravelUser
+from core.user_services import remember_clerk_user_uuids
+from core.webhook_event import WebhookEvent
+from solar import Table
+
+# Rows claimed by a consumer that died are handed out again after this long
+CLAIM_TIMEOUT_SECONDS = 300
+# Deliveries that keep failing are parked as 'failed' after this many attempts
+MAX_ATTEMPTS = 5
+# Processed rows are kept this long so late Svix retries are still deduplicated
+RETENTION_DAYS = 7
+
+WEBHOOK_EVENTS_DDL = """
+    CREATE TABLE IF NOT EXISTS webhook_events (
+        svix_id TEXT PRIMARY KEY,
+        source TEXT NOT NULL DEFAULT 'clerk',
+        event_type TEXT NOT NULL,
+        payload JSONB NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        received_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        claimed_at TIMESTAMP,
+        processed_at TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS webhook_events_unprocessed_idx
+        ON webhook_events (received_at)
+        WHERE status IN ('pending', 'processing');
+"""
+
+
+def record_event(svix_id: str, event_type: Optional[str], payload: Dict, source: str = "clerk") -> bool:
+    """
+    Store a delivery in the inbox.
+    Returns False if a delivery with the same svix-id was already recorded.
+    """
+    results = WebhookEvent.sql(
+        """INSERT INTO webhook_events (svix_id, source, event_type, payload, status, attempts, received_at)
+           VALUES (%(svix_id)s, %(source)s, %(event_type)s, %(payload)s, 'pending', 0, NOW())
+           ON CONFLICT (svix_id) DO NOTHING
+           RETURNING svix_id""",
+        {
+            "svix_id": svix_id,
+            "source": source,
+            "event_type": event_type or "unknown",
+            "payload": Jsonb(payload),
+        }
+    )
+    return bool(results)
+
+
+def claim_pending_events(limit: int = 100) -> List[WebhookEvent]:
+    """
+    Atomically claim up to `limit` pending deliveries, oldest first.
+
+    Every worker runs a consumer, so a user's events are only claimed while none of that
+    user's events are claimed by another batch: otherwise two workers could apply an older
+    user.updated after a newer one. Claims take a lock so each one sees the previous claims.
+    """
+    with Table.transaction():
+        WebhookEvent.sql("SELECT pg_advisory_xact_lock(hashtext('webhook_events_claim'))", read_only=False)
+        results = WebhookEvent.sql(
+            """UPDATE webhook_events
+               SET status = 'processing', claimed_at = NOW(), attempts = attempts + 1
+               WHERE svix_id IN (
+                   SELECT e.svix_id FROM webhook_events e
+                   WHERE (e.status = 'pending'
+                          OR (e.status = 'processing' AND e.claimed_at < NOW() - make_interval(secs => %(claim_timeout)s)))
+                     AND NOT EXISTS (
+                         SELECT 1 FROM webhook_events claimed
+                         WHERE claimed.status = 'processing'
+                           AND claimed.claimed_at >= NOW() - make_interval(secs => %(claim_timeout)s)
+                           AND claimed.payload->'data'->>'id' = e.payload->'data'->>'id'
+                     )
+                   ORDER BY e.received_at
+                   LIMIT %(limit)s
+                   FOR UPDATE SKIP LOCKED
+               )
+               RETURNING *""",
+            {"limit": limit, "claim_timeout": CLAIM_TIMEOUT_SECONDS}
+        )
+    return [WebhookEvent(**row) for row in results]
+
+
+def mark_events_processed(svix_ids: List[str]):
+    if not svix_ids:
+        return
+    WebhookEvent.sql(
+        "UPDATE webhook_events SET status = 'done', processed_at = NOW(), last_error = NULL WHERE svix_id = ANY(%(svix_ids)s)",
+        {"svix_ids": svix_ids}
+    )
+
+
+def release_events(svix_ids: List[str], error: str):
+    """Hand failed deliveries back to the queue, parking the ones out of attempts."""
+    if not svix_ids:
+        return
+    WebhookEvent.sql(
+        """UPDATE webhook_events
+           SET status = CASE WHEN attempts >= %(max_attempts)s THEN 'failed' ELSE 'pending' END,
+               last_error = %(error)s
+           WHERE svix_id = ANY(%(svix_ids)s)""",
+        {"svix_ids": svix_ids, "error": error[:1000], "max_attempts": MAX_ATTEMPTS}
+    )
+
+
+def purge_processed_events(retention_days: int = RETENTION_DAYS) -> int:
+    results = WebhookEvent.sql(
+        """DELETE FROM webhook_events
+           WHERE status = 'done' AND processed_at < NOW() - make_interval(days => %(days)s)
+           RETURNING svix_id""",
+        {"days": retention_days}
+    )
+    return len(results)
+
+
+def _extract_profile(data: Dict) -> Dict:
+    """Pull the travel_users columns out of a Clerk user payload."""
+    email_addresses = data.get("email_addresses", [])
+    email = email_addresses[0].get("email_address") if email_addresses else None
+    username = data.get("username")
+    first_name = data.get("first_name") or ""
+    last_name = data.get("last_name") or ""
+    return {
+        "clerk_user_id": data.get("id"),
+        "email": email,
+        "username": username,
+        "display_name": f"{first_name} {last_name}".strip() or username,
+        "profile_image_url": data.get("image_url"),
+    }
+
+
+def _event_order(event: WebhookEvent) -> Tuple[int, float]:
+    # Clerk stamps every event with a millisecond timestamp; fall back to arrival order
+    timestamp = event.payload.get("timestamp") if isinstance(event.payload, dict) else None
+    return (timestamp if isinstance(timestamp, int) else 0, event.received_at.timestamp())
+
+
+def coalesce_clerk_events(events: List[WebhookEvent]) -> Dict[str, Dict]:
+    """
+    Fold a batch of Clerk events into one pending change per Clerk user.
+
+    Each entry holds the latest profile seen (if any), whether a user.created was part of
+    the batch, and whether the user ends the batch deleted.
+    """
+    pending: Dict[str, Dict] = {}
+    for event in sorted(events, key=_event_order):
+        data = event.payload.get("data", {}) or {}
+        clerk_user_id = data.get("id")
+        if not clerk_user_id:
+            continue
+        state = pending.setdefault(
+            clerk_user_id, {"profile": None, "created": False, "deleted": False}
+        )
+        if event.event_type in ("user.created", "user.updated"):
+            state["profile"] = _extract_profile(data)
+            state["created"] = state["created"] or event.event_type == "user.created"
+            state["deleted"] = False
+        elif event.event_type == "user.deleted":
+            state["deleted"] = True
+    return pending
+
+
+def _profile_arrays(profiles: List[Dict]) -> Dict[str, List]:
+    return {
+        "clerk_user_ids": [p["clerk_user_id"] for p in profiles],
+        "emails": [p["email"] for p in profiles],
+        "usernames": [p["username"] for p in profiles],
+        "display_names": [p["display_name"] for p in profiles],
+        "profile_image_urls": [p["profile_image_url"] for p in profiles],
+    }
+
+
+def apply_clerk_events(events: List[WebhookEvent]):
+    """Apply a claimed batch of Clerk events with one statement per kind of change."""
+    pending = coalesce_clerk_events(events)
+
+    created = [s["profile"] for s in pending.values() if s["created"] and s["profile"]]
+    updated = [s["profile"] for s in pending.values() if not s["created"] and s["profile"]]
+    deleted = [clerk_user_id for clerk_user_id, s in pending.items() if s["deleted"]]
+
+    if created:
+        params = _profile_arrays(created)
+        params["ids"] = [uuid4() for _ in created]
+        rows = TravelUser.sql(
+            """INSERT INTO travel_users
+               (id, clerk_user_id, email, username, display_name, profile_image_url, created_at, updated_at)
+               SELECT u.id, u.clerk_user_id, u.email, u.username, u.display_name, u.profile_image_url, NOW(), NOW()
+               FROM unnest(%(ids)s::uuid[], %(clerk_user_ids)s::text[], %(emails)s::text[],
+                           %(usernames)s::text[], %(display_names)s::text[], %(profile_image_urls)s::text[])
+                    AS u(id, clerk_user_id, email, username, display_name, profile_image_url)
+               ON CONFLICT (clerk_user_id) DO UPDATE
+               SET email = EXCLUDED.email,
+                   username = EXCLUDED.username,
+                   display_name = EXCLUDED.display_name,
+                   profile_image_url = EXCLUDED.profile_image_url,
+                   last_active = NOW(),
+                   updated_at = NOW()
+               RETURNING clerk_user_id, id""",
+            params
+        )
+        remember_clerk_user_uuids({row["clerk_user_id"]: row["id"] for row in rows})
+
+    if updated:
+        TravelUser.sql(
+            """UPDATE travel_users AS t
+               SET email = u.email,
+                   username = u.username,
+                   display_name = u.display_name,
+                   profile_image_url = u.profile_image_url,
+                   last_active = NOW(),
+                   updated_at = NOW()
+               FROM unnest(%(clerk_user_ids)s::text[], %(emails)s::text[], %(usernames)s::text[],
+                           %(display_names)s::text[], %(profile_image_urls)s::text[])
+                    AS u(clerk_user_id, email, username, display_name, profile_image_url)
+               WHERE t.clerk_user_id = u.clerk_user_id""",
+            _profile_arrays(updated)
+        )
+
+    if deleted:
+        # Soft delete
+        TravelUser.sql(
+            "UPDATE travel_users SET is_private = true, last_active = NOW(), updated_at = NOW() WHERE clerk_user_id = ANY(%(clerk_user_ids)s)",
+            {"clerk_user_ids": deleted}
+        )
+
+    return {"created": len(created), "updated": len(updated), "deleted": len(deleted)}
+
+
+def _clerk_user_id(event: WebhookEvent) -> Optional[str]:
+    data = event.payload.get("data", {}) if isinstance(event.payload, dict) else None
+    return data.get("id") if isinstance(data, dict) else None
+
+
+def apply_clerk_events_per_user(events: List[WebhookEvent]) -> Tuple[Dict[str, int], List[str], List[Tuple[List[str], str]]]:
+    """
+    Apply a batch one Clerk user at a time, for when the batched statements failed: one bad
+    event then only holds back its own user's events.
+
+    Returns the summary of what was applied, the svix ids applied, and (svix ids, error) for
+    every user whose events failed.
+    """
+    by_user: Dict[Optional[str], List[WebhookEvent]] = {}
+    for event in events:
+        by_user.setdefault(_clerk_user_id(event), []).append(event)
+
+    summary = {"created": 0, "updated": 0, "deleted": 0}
+    applied: List[str] = []
+    failed: List[Tuple[List[str], str]] = []
+    for user_events in by_user.values():
+        svix_ids = [event.svix_id for event in user_events]
+        try:
+            user_summary = apply_clerk_events(user_events)
+        except Exception as e:
+            failed.append((svix_ids, str(e)))
+            continue
+        for key in summary:
+            summary[key] += user_summary[key]
+        applied.extend(svix_ids)
+    return summary, applied, failed
@@ -1,12 +1,63 @@
+"""
+Server entry point.
+
+    python main.py           # development: one process, auto-reload
+    python main.py --prod    # production: WEB_CONCURRENCY worker processes (default: one per core)
+
+In production every worker is a separate process with its own event loop, thread pool,
+connection pools, HTTP/S3 clients and caches; nothing is shared between workers except the
+Prometheus multiprocess directory, so /api/metrics reports totals across workers. On SIGTERM
+the workers stop accepting connections and get GRACEFUL_SHUTDOWN_SECONDS to finish in-flight
+requests before the lifespan shutdown closes their pools.
+
+uvicorn starts its workers with the spawn start method: each one imports the app afresh, so
+no module state (pools, threads, locks) is inherited from the supervisor. Forking servers that
+import the app before forking (e.g. gunicorn --preload) are not supported.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+from pathlib import Path
 
 import uvicorn
 
+
+def prepare_prometheus_multiproc_dir():
+    """Point prometheus_client at an empty directory shared by the workers (set before they import it)."""
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        Path(directory).mkdir(parents=True, exist_ok=True)
+    else:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+
 if __name__ == "__main__":
-    uvicorn.run(
-        "api.bootstrap:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        workers=1,
-        log_level="info",
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the API")
+    parser.add_argument("--prod", action="store_true", help="Multi-worker production server without reload")
+    args = parser.parse_args()
+
+    if args.prod:
+        workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+        if workers > 1:
+            prepare_prometheus_multiproc_dir()
+        uvicorn.run(
+            "api.bootstrap:app",
+            host="0.0.0.0",
+            port=int(os.environ.get("PORT", "8000")),
+            workers=workers,
+            log_level="info",
+            proxy_headers=True,
+            forwarded_allow_ips="*",
+            timeout_graceful_shutdown=int(os.environ.get("GRACEFUL_SHUTDOWN_SECONDS", "30")),
+        )
+    else:
+        uvicorn.run(
+            "api.bootstrap:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            workers=1,
+            log_level="info",
+        )
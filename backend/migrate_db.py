@@ -4,6 +4,13 @@ Database migration script to fix schema issues and create new tables.
 import asyncio
 from solar.table import get_pool
 from solar.config import config
+from core.webhook_inbox import WEBHOOK_EVENTS_DDL
+from core.user_services import TRAVEL_USERS_CLERK_ID_INDEX_DDL
+from core.social_services import PARTITIONED_TABLES, backfill_post_geohashes
+from core.travel_post import TravelPost, TRAVEL_POSTS_GEOHASH_COLUMN_DDL
+from core.travel_user import TRAVEL_USERS_UPDATED_AT_COLUMN_DDL
+from core.post_like import POST_LIKES_UPDATED_AT_COLUMN_DDL
+from solar import partitions
 
 async def main():
     print("Starting database migration...")
@@ -83,9 +90,62 @@ async def main():
             except Exception as e:
                 print(f"   ⚠️  Error creating review_votes table: {e}")
             
+            print("\n5. Creating webhook_events table...")
+            try:
+                cursor.execute(WEBHOOK_EVENTS_DDL)
+                print("   ✅ Created webhook_events table")
+            except Exception as e:
+                print(f"   ⚠️  Error creating webhook_events table: {e}")
+            
+            print("\n6. Indexing travel_users.clerk_user_id...")
+            try:
+                cursor.execute(TRAVEL_USERS_CLERK_ID_INDEX_DDL)
+                print("   ✅ Created travel_users_clerk_user_id_key")
+            except Exception as e:
+                print(f"   ⚠️  Error creating clerk_user_id index: {e}")
+            
+            print("\n7. Adding travel_posts.geohash...")
+            try:
+                cursor.execute(TRAVEL_POSTS_GEOHASH_COLUMN_DDL)
+                print("   ✅ Added geohash column")
+            except Exception as e:
+                print(f"   ⚠️  Error adding geohash column: {e}")
+            
             # Commit all changes
             conn.commit()
-            print("\n✅ Migration completed successfully!")
+    
+    print("\n8. Partitioning travel_posts, post_likes and saved_posts by month...")
+    for table_cls in PARTITIONED_TABLES:
+        try:
+            for line in partitions.partition_existing_table(table_cls):
+                print(f"   ✅ {line}")
+        except Exception as e:
+            print(f"   ⚠️  Error partitioning {table_cls.__tablename__}: {e}")
+    
+    print("\n9. Adding travel_users.updated_at and post_likes.updated_at on every database...")
+    for key in pool:
+        try:
+            with pool[key].connection() as conn:
+                conn.execute(TRAVEL_USERS_UPDATED_AT_COLUMN_DDL)
+                conn.execute(POST_LIKES_UPDATED_AT_COLUMN_DDL)
+            print(f"   ✅ {key}")
+        except Exception as e:
+            print(f"   ⚠️  Error adding updated_at on {key}: {e}")
+    
+    print("\n10. Adding full-text search and geohash indexes to travel_posts...")
+    try:
+        TravelPost.create_table()
+        print("   ✅ search_vector column, search and geohash indexes in place")
+    except Exception as e:
+        print(f"   ⚠️  Error adding travel_posts search indexes: {e}")
+    
+    print("\n11. Backfilling travel_posts.geohash...")
+    try:
+        print(f"   ✅ Backfilled {backfill_post_geohashes()} posts")
+    except Exception as e:
+        print(f"   ⚠️  Error backfilling geohash: {e}")
+    
+    print("\n✅ Migration completed successfully!")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -13,8 +13,9 @@
 from pathlib import Path
 import sys
 import os
+import re
 from dotenv import load_dotenv
-from typing import Union, Dict, Optional
+from typing import Union, Dict, List, Optional
 
 ######################################################################################################################
 # Configuration Class
@@ -29,7 +30,21 @@ class Config:
     """Centralized configuration for Solar SDK environment variables."""
 
     def __init__(self):
-        load_dotenv(dotenv_path=Path(sys.argv[0]).parent / ".env")
+        self._env_loaded = False
+
+    def _load_env(self):
+        # Deferred to the first lookup so importing the SDK does no file I/O
+        if not self._env_loaded:
+            load_dotenv(dotenv_path=Path(sys.argv[0]).parent / ".env")
+            self._env_loaded = True
+
+    def _getenv(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        self._load_env()
+        return os.getenv(name, default)
+
+    def _environ(self) -> Dict[str, str]:
+        self._load_env()
+        return dict(os.environ)
 
     def _throw_if_missing(
         self, throw_if_missing: bool, value: Union[str, None], name: str
@@ -39,12 +54,12 @@ class Config:
 
     def s3_client_keys(self, throw_if_missing: bool = True) -> Optional[Dict[str, str]]:
         """Get the keys for the S3 client."""
-        self.aws_region = os.getenv("AWS_REGION")
-        self.aws_bucket_name = os.getenv("AWS_BUCKET_NAME")
-        self.api_key = os.getenv("AWS_S3_KEY")
-        self.api_url = os.getenv("ROUTER_BASE_URL")
-        self.org_id = os.getenv("SOLAR_ORGANIZATION_ID")
-        self.project_id = os.getenv("SOLAR_PROJECT_ID")
+        self.aws_region = self._getenv("AWS_REGION")
+        self.aws_bucket_name = self._getenv("AWS_BUCKET_NAME")
+        self.api_key = self._getenv("AWS_S3_KEY")
+        self.api_url = self._getenv("ROUTER_BASE_URL")
+        self.org_id = self._getenv("SOLAR_ORGANIZATION_ID")
+        self.project_id = self._getenv("SOLAR_PROJECT_ID")
         s3_dict = {
             "aws_region": self.aws_region,
             "aws_bucket_name": self.aws_bucket_name,
@@ -60,7 +75,7 @@ class Config:
 
     def router_base_url(self, throw_if_missing: bool = True) -> Optional[str]:
         """Get the base URL for the Solar back-end service router."""
-        router_base_url_val = os.getenv("ROUTER_BASE_URL")
+        router_base_url_val = self._getenv("ROUTER_BASE_URL")
         self._throw_if_missing(throw_if_missing, router_base_url_val, "ROUTER_BASE_URL")
         return router_base_url_val
 
@@ -70,11 +85,11 @@ class Config:
         """Get the connection string for the Solar back-end service router."""
         
         # Manus: Check if local DB is configured, if so, don't throw error for NEON_CONN_URL
-        db_host = os.getenv("DB_HOST")
+        db_host = self._getenv("DB_HOST")
         if db_host:
             return None # Don't need NEON_CONN_URL if local DB is set
 
-        hosted_postgres_connection_string_val = os.getenv("NEON_CONN_URL")
+        hosted_postgres_connection_string_val = self._getenv("NEON_CONN_URL")
         self._throw_if_missing(
             throw_if_missing, hosted_postgres_connection_string_val, "NEON_CONN_URL"
         )
@@ -82,21 +97,24 @@ class Config:
 
     def get_all_pg_connection_strings(self) -> Dict[str, str]:
         # Manus: Check for local DB config first
-        db_host = os.getenv("DB_HOST")
-        db_port = os.getenv("DB_PORT", "5432")
-        db_name = os.getenv("DB_NAME")
-        db_user = os.getenv("DB_USER")
-        db_password = os.getenv("DB_PASSWORD")
+        db_host = self._getenv("DB_HOST")
+        db_port = self._getenv("DB_PORT", "5432")
+        db_name = self._getenv("DB_NAME")
+        db_user = self._getenv("DB_USER")
+        db_password = self._getenv("DB_PASSWORD")
 
         if db_host and db_name and db_user and db_password:
-            return {"LOCAL_DB": f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"}
+            return {
+                "LOCAL_DB": f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}",
+                **self.get_shard_connection_strings(),
+            }
 
         # End Manus local DB config
         
         """Get all the connection strings for all the tables with PG_CONN prefix."""
         pg_conn_strings = {}
-        for key, value in os.environ.items():
-            if key.startswith("PG_RESOURCE_"):
+        for key, value in self._environ().items():
+            if key.startswith("PG_RESOURCE_") and not key.endswith("_REPLICAS"):
                 pg_conn_strings[key] = value
         
 
@@ -105,8 +123,80 @@ class Config:
         if neon_conn_url is not None:
             pg_conn_strings["NEON_CONN_URL"] = neon_conn_url
 
+        pg_conn_strings.update(self.get_shard_connection_strings())
         return pg_conn_strings
 
+    def get_shard_connection_strings(self) -> Dict[str, str]:
+        """
+        Get the connection strings of the shards of sharded tables (`PG_SHARD_0`, `PG_SHARD_1`, ...),
+        in shard order. Shard numbers must be contiguous from 0, since rows are placed by shard index.
+        """
+        shards = {}
+        for key, value in self._environ().items():
+            match = re.fullmatch(r"PG_SHARD_(\d+)", key)
+            if match:
+                shards[int(match.group(1))] = (key, value)
+        if sorted(shards) != list(range(len(shards))):
+            raise ConfigurationError(f"PG_SHARD_<n> must be numbered 0..{len(shards) - 1}, got {sorted(shards)}")
+        return {key: value for _, (key, value) in sorted(shards.items())}
+
+    def get_replica_connection_strings(self, pg_key: str) -> List[str]:
+        """Get the read-replica connection strings of a primary, from `<pg_key>_REPLICAS` (comma-separated)."""
+        replicas_val = self._getenv(f"{pg_key}_REPLICAS", "")
+        return [conn_string.strip() for conn_string in replicas_val.split(",") if conn_string.strip()]
+
+    def replica_max_lag_seconds(self) -> float:
+        """Replicas lagging further behind than this stop receiving reads."""
+        return float(self._getenv("PG_REPLICA_MAX_LAG_SECONDS", "5"))
+
+    def replica_check_interval_seconds(self) -> float:
+        """How often replica lag is measured."""
+        return float(self._getenv("PG_REPLICA_CHECK_INTERVAL_SECONDS", "5"))
+
+    def read_your_writes_seconds(self) -> float:
+        """How long a session's reads stay on the primary after it writes."""
+        return float(self._getenv("PG_READ_YOUR_WRITES_SECONDS", "10"))
+
+    def recent_writers_refresh_seconds(self) -> float:
+        """How often each process reloads the sessions that wrote recently (on other processes too)."""
+        return float(self._getenv("PG_RECENT_WRITERS_REFRESH_SECONDS", "1"))
+
+    def pool_warmup_timeout_seconds(self) -> float:
+        """How long startup waits for the connection pools to open their first connections."""
+        return float(self._getenv("PG_POOL_WARMUP_TIMEOUT_SECONDS", "10"))
+
+    def pool_health_check_interval_seconds(self) -> float:
+        """How often the background health check pings the idle pooled connections."""
+        return float(self._getenv("PG_POOL_HEALTH_CHECK_INTERVAL_SECONDS", "60"))
+
+    def pool_check_idle_seconds(self) -> float:
+        """Connections idle for longer than this are pinged when checked out; fresher ones are not."""
+        return float(self._getenv("PG_POOL_CHECK_IDLE_SECONDS", "30"))
+
+    def pool_max_idle_seconds(self) -> float:
+        """Idle connections above the pool's min_size are closed after this long."""
+        return float(self._getenv("PG_POOL_MAX_IDLE_SECONDS", "300"))
+
+    def pool_max_lifetime_seconds(self) -> float:
+        """Connections are replaced after this long, whatever their state (with some jitter)."""
+        return float(self._getenv("PG_POOL_MAX_LIFETIME_SECONDS", "1800"))
+
+    def breaker_failure_threshold(self) -> int:
+        """Consecutive connection failures after which a database's circuit breaker opens."""
+        return int(self._getenv("PG_BREAKER_FAILURE_THRESHOLD", "5"))
+
+    def breaker_reset_seconds(self) -> float:
+        """How long an open circuit breaker fails fast before letting a trial statement through."""
+        return float(self._getenv("PG_BREAKER_RESET_SECONDS", "10"))
+
+    def partition_premake_months(self) -> int:
+        """How many months ahead monthly partitions are created."""
+        return int(self._getenv("PG_PARTITION_PREMAKE_MONTHS", "3"))
+
+    def partition_maintenance_interval_seconds(self) -> float:
+        """How often partitions are created/detached by the background maintenance."""
+        return float(self._getenv("PG_PARTITION_MAINTENANCE_INTERVAL_SECONDS", "21600"))
+
     def get_pg_key_for_table(self, table_class_name: str) -> str:
         """Get the connection string for a given table name."""
         table_name_env_key = table_class_name.upper().replace("-", "_")
@@ -114,17 +204,17 @@ class Config:
             return "NEON_CONN_URL"
         
         # Manus: Force local DB for all tables if local config is set
-        db_host = os.getenv("DB_HOST")
+        db_host = self._getenv("DB_HOST")
         if db_host:
             return "LOCAL_DB"
-        connection_string_val = os.getenv(table_name_env_key)
+        connection_string_val = self._getenv(table_name_env_key)
         if connection_string_val is None:
             return "NEON_CONN_URL"
         return connection_string_val
 
     def model_api_key(self, throw_if_missing: bool = True) -> str:
         """Get the OpenRouter API key for model access."""
-        api_key = os.getenv("OPENROUTER_API_KEY")
+        api_key = self._getenv("OPENROUTER_API_KEY")
         self._throw_if_missing(throw_if_missing, api_key, "OPENROUTER_API_KEY")
         return api_key
 
@@ -0,0 +1,206 @@
+"""
+Bulk export of a table as NDJSON, CSV or Parquet, streamed in chunks.
+
+Rows are read with Table.stream (a server-side cursor, on a replica when one is available)
+and encoded one batch at a time, so an export of any size holds a single batch in memory.
+`export_table` yields the encoded bytes, ready for a streaming HTTP response or a file.
+
+Incremental exports pass `since`: only rows whose watermark column (`updated_at`, or
+`created_at` for tables without it) is after `since` and at or before `until` are exported.
+The next export starts from this one's `until`. Every write to an exported table, counter
+updates and like/save toggles included, must bump `updated_at`, or the change is skipped by
+incremental exports. Rows are stamped when written, so a row written by a transaction still
+open at `until` can be missed; leave a little overlap (e.g. a minute) between exports if
+that matters.
+
+Parquet needs pyarrow, which is imported only when a Parquet export runs.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union, get_args, get_origin
+import csv
+import io
+import json
+import types
+import uuid
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_BATCH_SIZE = 5000
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def watermark_column(table_cls) -> str:
+    return "updated_at" if "updated_at" in table_cls.model_fields else "created_at"
+
+
+def export_columns(table_cls) -> List[str]:
+    # The model's columns only: generated/search columns stay out of exports
+    return list(table_cls.model_fields)
+
+
+def export_query(table_cls, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Tuple[str, Dict]:
+    columns = ", ".join(export_columns(table_cls))
+    conditions, params = [], {}
+    if since is not None:
+        conditions.append(f"{watermark_column(table_cls)} > %(since)s")
+        params["since"] = since
+    if until is not None:
+        conditions.append(f"{watermark_column(table_cls)} <= %(until)s")
+        params["until"] = until
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT {columns} FROM {table_cls._get_sql_table_name()}{where}", params
+
+
+def export_table(
+    table_cls,
+    fmt: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """Encoded chunks (about one per `batch_size` rows) of the table's rows in `fmt`."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {list(FORMATS)}")
+    sql_statement, params = export_query(table_cls, since, until)
+    row_batches = table_cls.stream(sql_statement, params, batch_size=batch_size, batches=True)
+    if fmt == "ndjson":
+        return _ndjson_chunks(row_batches)
+    if fmt == "csv":
+        return _csv_chunks(row_batches, export_columns(table_cls))
+    return _parquet_chunks(row_batches, table_cls)
+
+
+def _json_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot export {type(value).__name__} values")
+
+
+def _ndjson_chunks(row_batches: Iterator[List[Dict]]) -> Iterator[bytes]:
+    for rows in row_batches:
+        yield "".join(json.dumps(row, default=_json_default) + "\n" for row in rows).encode()
+
+
+def _csv_value(value: Any):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _csv_chunks(row_batches: Iterator[List[Dict]], columns: List[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in row_batches:
+        for row in rows:
+            writer.writerow([_csv_value(row[column]) for column in columns])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+######################################################################################################################
+# Parquet
+######################################################################################################################
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands its bytes over on `drain`, keeping the absolute position pyarrow relies on."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_type(annotation):
+    import pyarrow as pa
+
+    origin = get_origin(annotation)
+    if origin in (Union, types.UnionType):
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _arrow_type(args[0]) if len(args) == 1 else pa.string()
+    if origin in (list, List):
+        (item,) = get_args(annotation) or (Any,)
+        if item in (str, int, float, bool, uuid.UUID):
+            return pa.list_(_arrow_type(item))
+        return pa.string()  # lists of objects are exported as JSON text
+    return {
+        str: pa.string(),
+        uuid.UUID: pa.string(),
+        int: pa.int64(),
+        float: pa.float64(),
+        bool: pa.bool_(),
+        datetime: pa.timestamp("us"),
+        date: pa.date32(),
+    }.get(annotation, pa.string())
+
+
+def _arrow_value(value: Any, arrow_type):
+    import pyarrow as pa
+
+    if value is None:
+        return None
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if pa.types.is_string(arrow_type) and not isinstance(value, str):
+        return json.dumps(value, default=_json_default)
+    if pa.types.is_list(arrow_type):
+        return [str(item) if isinstance(item, uuid.UUID) else item for item in value]
+    return value
+
+
+def _parquet_chunks(row_batches: Iterator[List[Dict]], table_cls) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [(name, _arrow_type(field.annotation)) for name, field in table_cls.model_fields.items()]
+    )
+    sink = _ChunkSink()
+    # One row group per fetched batch; each is flushed to the client as soon as it is written
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for rows in row_batches:
+            columns = {
+                field.name: [_arrow_value(row[field.name], field.type) for row in rows] for field in schema
+            }
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
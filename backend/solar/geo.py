@@ -0,0 +1,123 @@
+"""
+Geohashes and great-circle distances for "near (lat, lng)" queries on a plain btree index.
+
+A geohash names a lat/lng cell; every extra character splits the cell into 32, and points in
+the same cell share the hash's prefix. With the hashes in a btree-indexed text column (C
+collation, so the order is plain byte order), every row inside a cell is one index range scan:
+`geohash >= prefix AND geohash < prefix || '{'`. `covering_cells` picks the cells that cover a
+circle, few enough to scan each one; rows in them are then filtered and sorted by their exact
+haversine distance.
+
+Nothing here needs a Postgres extension.
+"""
+
+from typing import List, Optional, Tuple
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12  # ~4 cm cells, more than any coordinate we store
+MAX_COVER_CELLS = 16
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# One past the last BASE32 character: the exclusive upper bound of a prefix's range
+PREFIX_RANGE_END = "{"
+
+
+def valid_coordinates(lat, lng) -> bool:
+    return (
+        isinstance(lat, (int, float)) and isinstance(lng, (int, float))
+        and -90 <= lat <= 90 and -180 <= lng <= 180
+    )
+
+
+def encode(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate longitude, latitude, starting with longitude
+        bounds, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(height, width) in degrees of a cell at `precision`."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    d_lat = math.radians(lat2 - lat1)
+    d_lng = math.radians(lng2 - lng1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat: float, lng: float, radius_km: float) -> Tuple[float, float, Optional[Tuple[float, float]]]:
+    """
+    (south, north, (west, east)) in degrees around a circle; (west, east) is None when the
+    circle spans every longitude (it reaches a pole). west > east when it crosses the antimeridian.
+    """
+    d_lat = radius_km / KM_PER_DEGREE
+    south, north = max(-90.0, lat - d_lat), min(90.0, lat + d_lat)
+    if south == -90.0 or north == 90.0:
+        return south, north, None
+    # Widest at the latitude closest to a pole
+    d_lng = radius_km / (KM_PER_DEGREE * math.cos(math.radians(max(abs(south), abs(north)))))
+    if d_lng >= 180:
+        return south, north, None
+    west, east = lng - d_lng, lng + d_lng
+    return south, north, (_wrap_lng(west), _wrap_lng(east))
+
+
+def _wrap_lng(lng: float) -> float:
+    return (lng + 180.0) % 360.0 - 180.0
+
+
+def _steps(start: float, end: float, step: float) -> List[float]:
+    # Cell-aligned points from the cell holding `start` through the one holding `end`
+    first = math.floor(start / step) * step
+    count = math.floor(end / step) - math.floor(start / step) + 1
+    return [first + (i + 0.5) * step for i in range(count)]
+
+
+def covering_cells(lat: float, lng: float, radius_km: float, max_cells: int = MAX_COVER_CELLS) -> List[str]:
+    """
+    Geohash prefixes of the cells covering the circle, at the finest precision that needs at
+    most `max_cells` of them. Every point within `radius_km` has one of these prefixes.
+    """
+    south, north, longitudes = bounding_box(lat, lng, radius_km)
+    cells: List[str] = [""]
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(precision)
+        if longitudes is None:
+            lng_points = _steps(-180.0, 180.0 - width / 2, width)
+        else:
+            west, east = longitudes
+            if west <= east:
+                lng_points = _steps(west, east, width)
+            else:
+                lng_points = _steps(west, 180.0 - width / 2, width) + _steps(-180.0, east, width)
+        lat_points = _steps(south, min(north, 90.0 - height / 2), height)
+        if len(lat_points) * len(lng_points) > max_cells:
+            break
+        cells = sorted({encode(min(y, 90.0), _wrap_lng(x), precision) for y in lat_points for x in lng_points})
+    return cells
+
+
+def prefix_ranges(prefixes: List[str]) -> Tuple[List[str], List[str]]:
+    """[low], [high) bounds of the index range scans matching each prefix; "" matches everything."""
+    return list(prefixes), [prefix + PREFIX_RANGE_END for prefix in prefixes]
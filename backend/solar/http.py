@@ -0,0 +1,105 @@
+"""
+Shared async HTTP client for outbound calls (token exchange, credential refresh, introspection).
+
+Creating an httpx.AsyncClient per call throws away the connection pool and TLS sessions, and
+using the synchronous `requests` library from an async handler blocks the event loop. Every
+outbound call should go through `get_async_client()` or `post_with_retries()` instead.
+"""
+
+import asyncio
+import logging
+import random
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Client configuration constants
+DEFAULT_CONNECT_TIMEOUT = 5.0  # seconds
+DEFAULT_READ_TIMEOUT = 15.0  # seconds
+DEFAULT_POOL_TIMEOUT = 5.0  # seconds to wait for a free connection
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0  # seconds
+DEFAULT_CONNECT_RETRIES = 2  # transport-level retries on connection failures
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 0.2  # seconds
+DEFAULT_BACKOFF_MAX = 2.0  # seconds
+
+# Statuses worth retrying for idempotent calls
+RETRY_STATUS_CODES = {502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Get or create the process-wide async HTTP client"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                DEFAULT_READ_TIMEOUT,
+                connect=DEFAULT_CONNECT_TIMEOUT,
+                pool=DEFAULT_POOL_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=DEFAULT_MAX_CONNECTIONS,
+                max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY,
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=DEFAULT_CONNECT_RETRIES),
+        )
+    return _client
+
+
+async def close_async_client():
+    """Close the shared client; called on application shutdown"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(DEFAULT_BACKOFF_MAX, DEFAULT_BACKOFF_BASE * (2**attempt)))
+
+
+async def post_with_retries(
+    url: str,
+    *,
+    idempotent: bool = False,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    **kwargs,
+) -> httpx.Response:
+    """
+    POST through the shared client, retrying failures that are safe to retry.
+
+    Connection failures are always retried because the request never reached the server.
+    Timeouts after sending and 502/503/504 responses are only retried when the caller marks
+    the call as idempotent (an authorization code, for example, can only be redeemed once).
+    """
+    client = get_async_client()
+    attempt = 0
+    while True:
+        try:
+            response = await client.post(url, **kwargs)
+            if not (idempotent and response.status_code in RETRY_STATUS_CODES):
+                return response
+            if attempt + 1 >= max_retries:
+                return response
+            logger.warning(
+                f"POST {url} returned {response.status_code} (attempt {attempt + 1}/{max_retries})"
+            )
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            if attempt + 1 >= max_retries:
+                raise
+            logger.warning(f"POST {url} could not connect (attempt {attempt + 1}/{max_retries}): {e}")
+        except httpx.TransportError as e:
+            if not idempotent or attempt + 1 >= max_retries:
+                raise
+            logger.warning(f"POST {url} failed (attempt {attempt + 1}/{max_retries}): {e}")
+
+        await asyncio.sleep(_backoff_delay(attempt))
+        attempt += 1
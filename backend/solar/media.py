@@ -1,14 +1,51 @@
-import requests
+import asyncio
 from pydantic import BaseModel
-from typing import Optional
+from typing import AsyncIterator, Optional
 from .config import config
+from .http import post_with_retries
 import datetime
-import boto3
 import uuid
 from fastapi import UploadFile # Importar UploadFile para la simulación
 import os # Importar os para la simulación de archivos locales
+import fcntl
+import hashlib
+import mimetypes
+import re
+from contextlib import contextmanager
 
 MEDIA_DIR = "/home/ubuntu/media" # Directorio local para medios
+MEDIA_URL_PREFIX = "/media/"
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB: la memoria por subida queda acotada a un chunk
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50 MB
+# Límite del cuerpo HTTP de una subida: el archivo más un margen para las cabeceras multipart
+MAX_UPLOAD_BODY_SIZE = MAX_UPLOAD_SIZE + 64 * 1024
+REFS_DIR_NAME = ".refs"  # Contadores de referencias; empieza por punto para no servirse nunca
+# Los nombres no cambian de contenido nunca (SHA-256 o UUID), así que se pueden cachear para siempre
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Únicos tipos aceptados, con la extensión fija con la que se guardan. El MIME lo declara el
+# cliente: nunca se deriva de él una extensión (p. ej. image/html o image/svg+xml se servirían
+# como HTML/SVG desde nuestro dominio). Las extensiones son las que ya tenían los archivos
+# guardados, así el mismo contenido sigue resolviendo al mismo nombre.
+ALLOWED_MEDIA_TYPES = {
+    "image/jpeg": ".jpeg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/avif": ".avif",
+    "image/heic": ".heic",
+    "video/mp4": ".mp4",
+    "video/quicktime": ".quicktime",
+    "video/webm": ".webm",
+}
+_MEDIA_TYPES_BY_EXTENSION = {extension: mime for mime, extension in ALLOWED_MEDIA_TYPES.items()}
+
+
+class MediaTooLargeError(Exception):
+    pass
+
+
+class UnsupportedMediaTypeError(Exception):
+    pass
 
 
 class S3Client:
@@ -22,40 +59,57 @@ class S3Client:
         self.aws_bucket_name = self.s3_client_keys["aws_bucket_name"]
         self.expiration = None
         self.s3_client = None
+        self._refresh_lock = asyncio.Lock()
 
     def get_base_path(self) -> str:
         return f"{self.org_id}/{self.project_id}"
 
-    def refresh_client_if_expired(self):
-        if (
+    def _has_valid_credentials(self) -> bool:
+        return (
             self.s3_client is not None
             and self.expiration is not None
             and self.expiration > datetime.datetime.now(datetime.timezone.utc)
-        ):
-            return
-        response = requests.post(
-            f"{self.api_url}/aws/get-s3-credentials",
-            json={"orgId": self.org_id, "projectId": self.project_id},
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            },
         )
-        if response.status_code != 200:
-            raise Exception("Failed to refresh credentials")
-        credentials = response.json()
-        client = boto3.client(
-            "s3",
-            aws_access_key_id=credentials["accessKeyId"],
-            aws_secret_access_key=credentials["secretAccessKey"],
-            aws_session_token=credentials["sessionToken"],
-            region_name=self.aws_region,
-            config=boto3.session.Config(signature_version="s3v4"),
-        )
-        self.expiration = datetime.datetime.fromisoformat(
-            credentials["expiration"].replace("Z", "+00:00")
-        )
-        self.s3_client = client
+
+    async def refresh_client_if_expired(self):
+        if self._has_valid_credentials():
+            return
+        # Only one refresh in flight; concurrent callers wait for it and reuse the result
+        async with self._refresh_lock:
+            if self._has_valid_credentials():
+                return
+            response = await post_with_retries(
+                f"{self.api_url}/aws/get-s3-credentials",
+                idempotent=True,
+                json={"orgId": self.org_id, "projectId": self.project_id},
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+            )
+            if response.status_code != 200:
+                raise Exception("Failed to refresh credentials")
+            credentials = response.json()
+            # boto3 loads its service models from disk when building a client, keep that off the loop
+            client = await asyncio.to_thread(_build_s3_client, credentials, self.aws_region)
+            self.expiration = datetime.datetime.fromisoformat(
+                credentials["expiration"].replace("Z", "+00:00")
+            )
+            self.s3_client = client
+
+
+def _build_s3_client(credentials: dict, region: str):
+    # boto3 tarda ~0.1s en importarse; solo se carga cuando hace falta un cliente
+    import boto3
+
+    return boto3.client(
+        "s3",
+        aws_access_key_id=credentials["accessKeyId"],
+        aws_secret_access_key=credentials["secretAccessKey"],
+        aws_session_token=credentials["sessionToken"],
+        region_name=region,
+        config=boto3.session.Config(signature_version="s3v4"),
+    )
 
 
 s3_client = None
@@ -74,34 +128,122 @@ def get_client():
     return s3_client
 
 
+def is_allowed_media_type(mime_type: Optional[str]) -> bool:
+    return mime_type in ALLOWED_MEDIA_TYPES
+
+
+def _extension_for(mime_type: str) -> str:
+    if mime_type not in ALLOWED_MEDIA_TYPES:
+        raise UnsupportedMediaTypeError(f"Unsupported media type: {mime_type}")
+    return ALLOWED_MEDIA_TYPES[mime_type]
+
+
+def _content_filename(digest: str, extension: str) -> str:
+    return f"{digest}{extension}"
+
+
+@contextmanager
+def _media_lock(filename: str):
+    """
+    Lock compartido entre procesos para el contador de referencias de un archivo.
+    Se reparte en 256 locks según el nombre; los archivos de lock nunca se borran, así
+    un proceso que espera el lock nunca se queda con un inodo huérfano.
+    """
+    refs_dir = os.path.join(MEDIA_DIR, REFS_DIR_NAME)
+    os.makedirs(refs_dir, exist_ok=True)
+    stripe = hashlib.sha256(filename.encode()).hexdigest()[:2]
+    fd = os.open(os.path.join(refs_dir, f".lock-{stripe}"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _refcount_path(filename: str) -> str:
+    return os.path.join(MEDIA_DIR, REFS_DIR_NAME, filename)
+
+
+def _read_refcount(filename: str) -> Optional[int]:
+    try:
+        with open(_refcount_path(filename)) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return None
+
+
+def _write_refcount(filename: str, count: int):
+    tmp_path = f"{_refcount_path(filename)}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(count))
+    os.replace(tmp_path, _refcount_path(filename))
+
+
+def commit_content_addressed(tmp_path: str, filename: str) -> str:
+    """
+    SIMULACIÓN: Mueve un temporal ya escrito a su nombre por contenido y suma una referencia.
+    Si el contenido ya existía se descarta el temporal: cada contenido se guarda una sola vez.
+    """
+    file_path = os.path.join(MEDIA_DIR, filename)
+    with _media_lock(filename):
+        if os.path.exists(file_path):
+            os.remove(tmp_path)
+            count = _read_refcount(filename)
+            # Archivos anteriores al conteo de referencias cuentan como una referencia
+            count = 1 if count is None else count
+        else:
+            os.replace(tmp_path, file_path)
+            count = 0
+        _write_refcount(filename, count + 1)
+    return f"{MEDIA_URL_PREFIX}{filename}"
+
+
 def save_to_bucket(media_file: MediaFile, file_path: Optional[str] = None):
     """
     SIMULACIÓN: Sube un archivo al sistema de archivos local y devuelve la URL de acceso.
+    El nombre es el SHA-256 del contenido, así las subidas repetidas se guardan una sola vez.
     """
     os.makedirs(MEDIA_DIR, exist_ok=True)
     
-    # Generar un nombre de archivo único
-    file_extension = f".{media_file.mime_type.split('/')[-1]}"
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(MEDIA_DIR, unique_filename)
+    digest = hashlib.sha256(media_file.bytes).hexdigest()
+    filename = _content_filename(digest, _extension_for(media_file.mime_type))
+    tmp_path = os.path.join(MEDIA_DIR, f".{filename}.{uuid.uuid4().hex}.part")
     
     # Guardar el archivo
-    with open(file_path, "wb") as buffer:
+    with open(tmp_path, "wb") as buffer:
         buffer.write(media_file.bytes)
     
     # Devolver la URL de acceso local simulada
-    return f"/media/{unique_filename}"
+    return commit_content_addressed(tmp_path, filename)
 
 
 def delete_from_bucket(path: str):
     """
-    SIMULACIÓN: Elimina un archivo del sistema de archivos local.
+    SIMULACIÓN: Quita una referencia a un archivo del sistema de archivos local.
+    El archivo (y sus versiones redimensionadas) solo se borra al soltar la última referencia.
     """
-    if path.startswith("/media/"):
-        file_path = os.path.join(MEDIA_DIR, path.split("/")[-1])
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    # Ignorar si no es un archivo local simulado o si no existe
+    if not path.startswith(MEDIA_URL_PREFIX):
+        return  # Ignorar si no es un archivo local simulado
+    filename = os.path.basename(path)
+    if not filename or filename.startswith("."):
+        return
+
+    file_path = os.path.join(MEDIA_DIR, filename)
+    with _media_lock(filename):
+        if not os.path.exists(file_path):
+            return  # Ignorar si no existe
+        count = _read_refcount(filename)
+        count = 1 if count is None else count
+        if count > 1:
+            _write_refcount(filename, count - 1)
+            return
+        os.remove(file_path)
+        if os.path.exists(_refcount_path(filename)):
+            os.remove(_refcount_path(filename))
+
+    from .renditions import release_renditions
+    release_renditions(path)
 
 
 def get_from_bucket(path: str) -> MediaFile:
@@ -114,12 +256,122 @@ def get_from_bucket(path: str) -> MediaFile:
             with open(file_path, "rb") as f:
                 return MediaFile(
                     size=os.path.getsize(file_path),
-                    mime_type="image/jpeg", # Asumir un tipo MIME genérico para la simulación
+                    mime_type=guess_mime_type(file_path),
                     bytes=f.read(),
                 )
     raise FileNotFoundError(f"File not found in mock media storage: {path}")
 
 
+async def iter_upload_file(upload: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    Lee un UploadFile en chunks de tamaño fijo sin cargarlo entero en memoria.
+    """
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def save_stream_to_bucket(
+    chunks: AsyncIterator[bytes],
+    mime_type: str,
+    max_size: Optional[int] = MAX_UPLOAD_SIZE,
+) -> str:
+    """
+    SIMULACIÓN: Guarda un flujo de chunks en el sistema de archivos local y devuelve la URL de acceso.
+    El SHA-256 se calcula mientras se escribe un temporal `.part`; al terminar el temporal pasa a
+    `<sha256>.<ext>` (o se descarta si ese contenido ya existía), así nunca se sirve un archivo a
+    medias. Lanza MediaTooLargeError si se supera `max_size` y UnsupportedMediaTypeError si
+    `mime_type` no está en ALLOWED_MEDIA_TYPES (antes de escribir nada).
+    """
+    extension = _extension_for(mime_type)
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+
+    tmp_path = os.path.join(MEDIA_DIR, f".upload-{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+
+    size = 0
+    buffer = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise MediaTooLargeError(f"Upload exceeds {max_size} bytes")
+            hasher.update(chunk)
+            await asyncio.to_thread(buffer.write, chunk)
+        await asyncio.to_thread(buffer.close)
+        filename = _content_filename(hasher.hexdigest(), extension)
+        return await asyncio.to_thread(commit_content_addressed, tmp_path, filename)
+    except BaseException:
+        buffer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+async def save_upload_to_bucket(upload: UploadFile, max_size: Optional[int] = MAX_UPLOAD_SIZE) -> str:
+    """
+    SIMULACIÓN: Guarda un UploadFile chunk a chunk y devuelve la URL de acceso.
+    """
+    mime_type = upload.content_type or "application/octet-stream"
+    return await save_stream_to_bucket(iter_upload_file(upload), mime_type, max_size=max_size)
+
+
+def media_file_path(path: str) -> str:
+    """
+    Ruta local de una URL `/media/<nombre>` (o el nombre solo) sin tocar el disco; rechaza los
+    nombres que nunca se sirven (ocultos o temporales).
+    """
+    filename = os.path.basename(path)
+    if not filename or filename.startswith(".") or filename.endswith(".part"):
+        raise FileNotFoundError(f"File not found in mock media storage: {path}")
+    return os.path.join(MEDIA_DIR, filename)
+
+
+def resolve_media_path(path: str) -> str:
+    """
+    SIMULACIÓN: Traduce una URL `/media/<nombre>` (o el nombre solo) a la ruta del archivo local,
+    para servirlo con FileResponse (sendfile + rangos HTTP) en lugar de leerlo en memoria.
+    """
+    file_path = media_file_path(path)
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f"File not found in mock media storage: {path}")
+    return file_path
+
+
+def guess_mime_type(path: str) -> str:
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def served_media_type(path: str) -> str:
+    """
+    Content-Type con el que se sirve un archivo: solo los de ALLOWED_MEDIA_TYPES; cualquier otra
+    extensión (archivos antiguos) se sirve como binario opaco, nunca como algo que el navegador ejecute.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    return _MEDIA_TYPES_BY_EXTENSION.get(extension, "application/octet-stream")
+
+
+def media_etag(path: str) -> str:
+    """
+    ETag fuerte de un archivo: su nombre ya identifica el contenido (SHA-256, o UUID en
+    archivos antiguos), así que no hace falta leerlo ni hacer stat.
+    """
+    stem = os.path.basename(path).split(".", 1)[0]
+    return f'"{stem}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evalúa un If-None-Match (lista, comodín o ETags débiles) contra un ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(re.sub(r"^W/", "", tag) == etag for tag in candidates)
+
+
 def generate_presigned_url(path: str, expires_in: int = 3600) -> str:
     """
     SIMULACIÓN: Devuelve la URL de acceso local.
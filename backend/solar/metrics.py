@@ -0,0 +1,180 @@
+"""
+Prometheus metrics for the app.
+
+Counters and histograms are updated inline (a lock and a bisect per observation); pool and
+cache statistics are read from their owners only when /api/metrics is scraped.
+
+With several worker processes (`main.py --prod`), PROMETHEUS_MULTIPROC_DIR is set and the
+counters, histograms and gauges are aggregated across workers from that directory; pool and
+cache statistics are those of the worker that answered the scrape.
+"""
+
+from typing import Iterable
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from .cache import named_caches
+
+# Buckets tuned for a web app talking to Postgres: most queries land in the low milliseconds
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+AI_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route operation_id",
+    ["operation", "method", "status"],
+    buckets=HTTP_BUCKETS,
+)
+
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Table.sql statement latency by table class",
+    ["table"],
+    buckets=DB_BUCKETS,
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total",
+    "Table.sql attempts that raised a database error",
+    ["table"],
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting to check a connection out of the pool (one observation per checkout)",
+    ["pg_key"],
+    buckets=DB_BUCKETS,
+)
+DB_QUERY_RETRIES = Counter(
+    "db_query_retries_total",
+    "Table.sql and pipeline statements retried after a transient error",
+    ["table"],
+)
+DB_CIRCUIT_STATE = Gauge(
+    "db_circuit_state",
+    "Circuit breaker state per database (0 closed, 1 half-open, 2 open)",
+    ["pg_key"],
+    multiprocess_mode="max",
+)
+DB_CIRCUIT_TRANSITIONS = Counter(
+    "db_circuit_transitions_total",
+    "Circuit breaker state changes per database, by the state entered",
+    ["pg_key", "state"],
+)
+DB_TRANSACTIONS = Counter(
+    "db_transactions_total",
+    "Table.transaction blocks by outcome (committed, rolled_back)",
+    ["outcome"],
+)
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds",
+    "Last measured replication lag per read replica (+Inf when unreachable)",
+    ["replica"],
+    multiprocess_mode="max",
+)
+
+OPENAI_REQUEST_DURATION = Histogram(
+    "openai_request_duration_seconds",
+    "OpenAI API call latency",
+    ["model", "outcome"],
+    buckets=AI_BUCKETS,
+)
+OPENAI_TOKENS = Counter(
+    "openai_tokens_total",
+    "Tokens reported by the OpenAI API",
+    ["model", "kind"],
+)
+
+WEBHOOK_DELIVERIES = Counter(
+    "webhook_deliveries_total",
+    "Webhook deliveries received",
+    ["source", "outcome"],
+)
+WEBHOOK_EVENTS_APPLIED = Counter(
+    "webhook_events_applied_total",
+    "Webhook events applied by the inbox consumer",
+    ["source", "outcome"],
+)
+WEBHOOK_BATCH_DURATION = Histogram(
+    "webhook_batch_duration_seconds",
+    "Time to apply one claimed inbox batch",
+    ["source"],
+    buckets=DB_BUCKETS,
+)
+
+
+def observe_openai_usage(model: str, usage) -> None:
+    """Count the tokens of an OpenAI response `usage` block (missing usage is ignored)."""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = getattr(usage, kind, None)
+        if value:
+            OPENAI_TOKENS.labels(model, kind.replace("_tokens", "")).inc(value)
+
+
+class PoolStatsCollector:
+    """Exports psycopg_pool's own counters (size, waiting requests, errors, ...) per pool."""
+
+    def describe(self) -> Iterable:
+        # Metric names depend on what exists at scrape time; skip the registration-time collect
+        return []
+
+    def collect(self) -> Iterable:
+        from . import table
+
+        pools = dict(table._pool or {})
+        for pg_key, replica_pools in (table._replica_pools or {}).items():
+            for index, pool in enumerate(replica_pools):
+                pools[f"{pg_key}/replica{index}"] = pool
+        families = {}
+        for pg_key, pool in pools.items():
+            for stat, value in pool.get_stats().items():
+                family = families.get(stat)
+                if family is None:
+                    family = families[stat] = GaugeMetricFamily(
+                        f"db_pool_{stat}", f"psycopg_pool statistic {stat}", labels=["pg_key"]
+                    )
+                family.add_metric([pg_key], value)
+        return families.values()
+
+
+class CacheStatsCollector:
+    """Exports hit/miss/size counters of every named LRUCache."""
+
+    def describe(self) -> Iterable:
+        # Metric names depend on what exists at scrape time; skip the registration-time collect
+        return []
+
+    def collect(self) -> Iterable:
+        hits = CounterMetricFamily("cache_hits", "LRUCache lookups served from the cache", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "LRUCache lookups that missed", labels=["cache"])
+        entries = GaugeMetricFamily("cache_entries", "Entries currently held by the cache", labels=["cache"])
+        for cache in named_caches():
+            hits.add_metric([cache.name], cache.hits)
+            misses.add_metric([cache.name], cache.misses)
+            entries.add_metric([cache.name], len(cache))
+        return [hits, misses, entries]
+
+
+REGISTRY.register(PoolStatsCollector())
+REGISTRY.register(CacheStatsCollector())
+
+
+def render_latest():
+    """Exposition text and its content type, ready for an HTTP response."""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(PoolStatsCollector())
+    registry.register(CacheStatsCollector())
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """Drop this worker's live gauges from the multiprocess directory; called on shutdown."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
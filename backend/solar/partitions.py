@@ -0,0 +1,237 @@
+"""
+Monthly range partitioning for time-ordered tables.
+
+A Table opts in with `__partition_by__ = "<timestamp column>"`. create_table then creates it
+`PARTITION BY RANGE (<column>)`, with the column added to the primary key (Postgres requires
+unique constraints on a partitioned table to include the partition key) and an index on it;
+sync/sync_many upsert on the `<table>_pkey` constraint. Each calendar month is a partition
+named `<table>_pYYYYMM`, and `<table>_default` catches rows outside the created months.
+
+Because every unique constraint must include the partition column, the database no longer
+enforces that the primary key alone is unique (only (primary key, column) is), and no rule
+that leaves the column out, such as one like per (user_id, post_id), can be declared.
+Partition only tables whose keys are generated (uuid4) and whose other uniqueness rules the
+code enforces itself, as core.social_services does for likes and saves with an advisory lock.
+
+`maintain` creates the partitions for the next PG_PARTITION_PREMAKE_MONTHS months and, for
+tables that set `__partition_retention_months__`, detaches partitions that ended before the
+retention window. Detached partitions stay behind as plain tables to archive or drop.
+`start_maintenance` runs it periodically in a background thread, and `partition_existing_table`
+converts a table created before it was partitioned.
+"""
+
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+import logging
+import re
+import threading
+import time
+
+from psycopg import Connection
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+_PARTITION_SUFFIX = re.compile(r"_p(\d{4})(\d{2})$")
+
+_maintenance: Optional[threading.Thread] = None
+_maintenance_lock = threading.Lock()
+
+
+def month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table_name: str, month: date) -> str:
+    return f"{table_name}_p{month:%Y%m}"
+
+
+def _pg_keys(table_cls) -> List[str]:
+    from . import sharding
+
+    if sharding.is_sharded(table_cls):
+        return sharding.shard_keys()
+    return [config.get_pg_key_for_table(table_cls.__name__)]
+
+
+def _lock(conn: Connection, table_name: str):
+    # Serializes partition DDL between workers/instances running maintenance at the same time
+    conn.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"solar.partitions:{table_name}",))
+
+
+def is_partitioned(conn: Connection, table_name: str) -> Optional[bool]:
+    """True/False for an existing table, None if it does not exist."""
+    row = conn.execute(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table_name,)
+    ).fetchone()
+    if row is None:
+        return None
+    return row["relkind"] == "p"
+
+
+def list_partitions(conn: Connection, table_name: str) -> List[Tuple[str, Optional[date]]]:
+    """(name, month) of every attached partition; month is None for the default partition."""
+    rows = conn.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY c.relname
+        """,
+        (table_name,),
+    ).fetchall()
+    partitions = []
+    for row in rows:
+        match = _PARTITION_SUFFIX.search(row["relname"])
+        month = date(int(match.group(1)), int(match.group(2)), 1) if match else None
+        partitions.append((row["relname"], month))
+    return partitions
+
+
+def ensure_partitions(conn: Connection, table_name: str, first_month: date, months_ahead: int) -> List[str]:
+    """Create the monthly partitions from `first_month` through `months_ahead` months from now, and the default one."""
+    existing = {name for name, _ in list_partitions(conn, table_name)}
+    last_month = add_months(month_start(datetime.now()), months_ahead)
+    created = []
+    month = first_month
+    while month <= last_month:
+        name = partition_name(table_name, month)
+        if name not in existing:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table_name} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            )
+            created.append(name)
+        month = add_months(month, 1)
+    default_name = f"{table_name}_default"
+    if default_name not in existing:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {default_name} PARTITION OF {table_name} DEFAULT")
+        created.append(default_name)
+    return created
+
+
+def detach_partitions_before(conn: Connection, table_name: str, cutoff: date) -> List[str]:
+    """Detach the monthly partitions that end on or before `cutoff`."""
+    detached = []
+    for name, month in list_partitions(conn, table_name):
+        if month is not None and add_months(month, 1) <= cutoff:
+            conn.execute(f"ALTER TABLE {table_name} DETACH PARTITION {name}")
+            detached.append(name)
+    return detached
+
+
+def maintain(table_classes, months_ahead: Optional[int] = None) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Create upcoming partitions and detach expired ones for every partitioned table, on
+    every database (shard) holding it. Tables not (yet) partitioned are skipped.
+    """
+    from . import table
+
+    if months_ahead is None:
+        months_ahead = config.partition_premake_months()
+    current_month = month_start(datetime.now())
+    report = {}
+    for table_cls in table_classes:
+        table_name = table_cls._get_sql_table_name()
+        retention = getattr(table_cls, "__partition_retention_months__", None)
+        for pg_key in _pg_keys(table_cls):
+            with table.get_pool()[pg_key].connection() as conn:
+                _lock(conn, table_name)
+                if not is_partitioned(conn, table_name):
+                    continue
+                created = ensure_partitions(conn, table_name, current_month, months_ahead)
+                detached = []
+                if retention:
+                    detached = detach_partitions_before(conn, table_name, add_months(current_month, -retention))
+            if created or detached:
+                logger.info(f"Partitions of {table_name} on {pg_key}: created {created}, detached {detached}")
+            report[f"{pg_key}/{table_name}"] = {"created": created, "detached": detached}
+    return report
+
+
+def _run_maintenance(table_classes):
+    while True:
+        try:
+            maintain(table_classes)
+        except Exception as e:
+            logger.warning(f"Partition maintenance failed: {str(e)}")
+        time.sleep(config.partition_maintenance_interval_seconds())
+
+
+def start_maintenance(table_classes):
+    """Run `maintain` now and then every PG_PARTITION_MAINTENANCE_INTERVAL_SECONDS in a daemon thread."""
+    global _maintenance
+    with _maintenance_lock:
+        if _maintenance is None or not _maintenance.is_alive():
+            _maintenance = threading.Thread(
+                target=_run_maintenance, args=(list(table_classes),), name="partition-maintenance", daemon=True
+            )
+            _maintenance.start()
+
+
+def partition_existing_table(table_cls, months_ahead: Optional[int] = None) -> List[str]:
+    """
+    Convert a plain table into the partitioned layout of its model, in one transaction per
+    database: the table is renamed to `<table>_unpartitioned`, the partitioned table is
+    created, partitions are made from the oldest row's month onwards, and the rows are
+    copied over. The old table is kept for verification; drop it once satisfied.
+    """
+    from . import table
+
+    if months_ahead is None:
+        months_ahead = config.partition_premake_months()
+    table_name = table_cls._get_sql_table_name()
+    partition_by = table_cls.__partition_by__
+    legacy_name = f"{table_name}_unpartitioned"
+    results = []
+    for pg_key in _pg_keys(table_cls):
+        with table.get_pool()[pg_key].connection() as conn:
+            _lock(conn, table_name)
+            state = is_partitioned(conn, table_name)
+            if state is None or state:
+                results.append(f"{pg_key}: {table_name} {'missing' if state is None else 'already partitioned'}")
+                continue
+
+            conn.execute(f"ALTER TABLE {table_name} RENAME TO {legacy_name}")
+            # Constraint names are schema-wide, and upserts target `<table>_pkey`: hand the name to the new table
+            pkey = conn.execute(
+                "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'",
+                (legacy_name,),
+            ).fetchone()
+            if pkey is not None:
+                conn.execute(f"ALTER TABLE {legacy_name} RENAME CONSTRAINT {pkey['conname']} TO {legacy_name}_pkey")
+            # Same for the model's declared indexes, which would otherwise be skipped as already existing
+            legacy_indexes = conn.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+                (legacy_name, f"{legacy_name}_pkey"),
+            ).fetchall()
+            for number, row in enumerate(legacy_indexes):
+                conn.execute(f"ALTER INDEX {row['indexname']} RENAME TO {legacy_name}_idx{number}")
+            for statement in table_cls._create_table_statements():
+                conn.execute(statement)
+
+            oldest = conn.execute(f"SELECT min({partition_by}) AS oldest FROM {legacy_name}").fetchone()["oldest"]
+            ensure_partitions(conn, table_name, month_start(oldest or datetime.now()), months_ahead)
+
+            legacy_columns = {
+                row["column_name"]
+                for row in conn.execute(
+                    "SELECT column_name FROM information_schema.columns WHERE table_name = %s", (legacy_name,)
+                ).fetchall()
+            }
+            columns = [column for column in table_cls.model_fields if column in legacy_columns]
+            select_list = ", ".join(
+                f"COALESCE({column}, NOW())" if column == partition_by else column for column in columns
+            )
+            copied = conn.execute(
+                f"INSERT INTO {table_name} ({', '.join(columns)}) SELECT {select_list} FROM {legacy_name}"
+            ).rowcount
+            results.append(f"{pg_key}: partitioned {table_name} ({copied} rows copied, old table kept as {legacy_name})")
+    return results
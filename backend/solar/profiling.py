@@ -0,0 +1,172 @@
+"""
+Stack-sampling profiler.
+
+A background thread snapshots `sys._current_frames()` at a fixed interval and counts the
+stacks it sees, which costs nothing while it is not running and a few microseconds per
+sampled thread while it is. Profiles are rendered in the folded-stack format
+(`frame;frame;frame count` per line) read by flamegraph.pl, speedscope and inferno.
+
+Two ways to use it:
+- `profile_for(seconds)` samples every thread for a fixed window (on-demand profiling).
+- `RequestSampler` samples only the threads working for given request ids; requests
+  register their worker threads with `request_thread(request_id)`, and `log_requests`
+  starts sampling a request once it runs past the slow-request threshold.
+"""
+
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set
+import os
+import sys
+import threading
+import time
+
+DEFAULT_INTERVAL = 0.005  # seconds between samples
+MAX_STACK_DEPTH = 128
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_name}"
+
+
+def _folded_stack(frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def render_folded(stacks: Counter) -> str:
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + ("\n" if stacks else "")
+
+
+def profile_for(seconds: float, interval: float = DEFAULT_INTERVAL, thread_ids: Optional[Set[int]] = None) -> Dict:
+    """
+    Sample the given threads (default: all but the caller) for `seconds` and return the
+    folded stacks. Blocks the calling thread for the whole window.
+    """
+    own_id = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks: Counter = Counter()
+    samples = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (thread_ids is not None and thread_id not in thread_ids):
+                continue
+            stacks[f"{names.get(thread_id, thread_id)};{_folded_stack(frame)}"] += 1
+        samples += 1
+        time.sleep(interval)
+    return {"samples": samples, "interval": interval, "seconds": seconds, "folded": render_folded(stacks)}
+
+
+class RequestSampler:
+    """
+    Samples the worker threads of individual requests and keeps the last `keep` profiles.
+
+    Threads announce which request they are working for with `request_thread`; sampling of a
+    request starts with `start(request_id)` and ends with `finish(request_id)`, which files
+    the profile if any samples were taken. One sampler thread serves all requests and
+    sleeps while none is being sampled.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, keep: int = 50):
+        self.interval = interval
+        self.profiles: deque = deque(maxlen=keep)
+        self._threads: Dict[str, Set[int]] = {}
+        self._active: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @contextmanager
+    def request_thread(self, request_id: Optional[str]) -> Iterator[None]:
+        """Mark the current thread as working for `request_id` for the duration of the block."""
+        if request_id is None:
+            yield
+            return
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._threads.setdefault(request_id, set()).add(thread_id)
+        try:
+            yield
+        finally:
+            with self._lock:
+                threads = self._threads.get(request_id)
+                if threads is not None:
+                    threads.discard(thread_id)
+                    if not threads and request_id not in self._active:
+                        del self._threads[request_id]
+
+    def start(self, request_id: str, **tags):
+        with self._lock:
+            self._active[request_id] = {
+                "request_id": request_id,
+                "started_at": datetime.now().isoformat(),
+                "stacks": Counter(),
+                "samples": 0,
+                **tags,
+            }
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def finish(self, request_id: str, **tags) -> Optional[Dict]:
+        """Stop sampling a request; returns (and keeps) its profile if anything was sampled."""
+        with self._lock:
+            self._threads.pop(request_id, None)
+            profile = self._active.pop(request_id, None)
+        if profile is None or not profile["samples"]:
+            return None
+        stacks = profile.pop("stacks")
+        profile.update(tags)
+        profile["interval"] = self.interval
+        profile["folded"] = render_folded(stacks)
+        self.profiles.append(profile)
+        return profile
+
+    def get(self, request_id: str) -> Optional[Dict]:
+        for profile in reversed(self.profiles):
+            if profile["request_id"] == request_id:
+                return profile
+        return None
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                if not self._active:
+                    self._wakeup.clear()
+                    continue
+                watched = {
+                    thread_id: request_id
+                    for request_id in self._active
+                    for thread_id in self._threads.get(request_id, ())
+                }
+            if watched:
+                frames = sys._current_frames()
+                with self._lock:
+                    for thread_id, request_id in watched.items():
+                        frame = frames.get(thread_id)
+                        profile = self._active.get(request_id)
+                        if frame is None or profile is None:
+                            continue
+                        profile["stacks"][_folded_stack(frame)] += 1
+                        profile["samples"] += 1
+            time.sleep(self.interval)
+
+
+request_sampler = RequestSampler()
+
+
+def list_profiles() -> List[Dict]:
+    """Summaries of the kept slow-request profiles, newest first (without the stacks)."""
+    return [
+        {key: value for key, value in profile.items() if key != "folded"}
+        for profile in reversed(request_sampler.profiles)
+    ]
@@ -0,0 +1,329 @@
+"""
+Resized WebP/AVIF renditions of uploaded images.
+
+Renditions are encoded in a process pool (Pillow holds the GIL while resizing), stored in the
+media directory under the SHA-256 of their bytes, and described by a small JSON manifest per
+original so feeds can hand clients thumbnails instead of full-resolution uploads. Each manifest
+holds one media reference per rendition, released when the original's last reference goes.
+Uploads schedule the work in the background (`schedule_renditions`); until the manifest is
+written, feeds serve the original.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Sequence, Tuple
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+
+from . import media
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Rendition configuration constants
+DEFAULT_WIDTHS = (320, 640, 1080)
+DEFAULT_FORMATS = ("webp", "avif")
+DEFAULT_QUALITY = {"webp": 80, "avif": 60}
+DEFAULT_MAX_WORKERS = 2
+MANIFEST_DIR_NAME = ".renditions"  # dot-prefixed so resolve_media_path never serves it
+# Feeds look up every image, so "no manifest" is remembered. Any worker writing a manifest changes
+# the manifest directory's mtime, which is re-checked at most this often and forgets the misses
+MANIFEST_DIR_CHECK_SECONDS = 1.0
+# Upper bound on a remembered miss, for filesystems with coarse mtimes
+MISSING_MANIFEST_TTL_SECONDS = 30
+# At shutdown, scheduled renditions get this long to finish before they're abandoned
+DRAIN_TIMEOUT_SECONDS = 20
+
+RENDITION_WIDTHS = tuple(
+    int(w) for w in os.environ.get("MEDIA_RENDITION_WIDTHS", "").split(",") if w.strip()
+) or DEFAULT_WIDTHS
+RENDITION_FORMATS = tuple(
+    f.strip().lower() for f in os.environ.get("MEDIA_RENDITION_FORMATS", "").split(",") if f.strip()
+) or DEFAULT_FORMATS
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_manifest_cache = LRUCache(maxsize=20000, name="media_renditions")
+_pending: Dict[str, asyncio.Task] = {}  # url -> generate_renditions task of this process
+_manifest_dir_checked: Tuple[float, Optional[int]] = (float("-inf"), None)  # (checked at, mtime_ns)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Get or create the rendition worker pool"""
+    global _process_pool
+    if _process_pool is None:
+        max_workers = int(os.environ.get("MEDIA_RENDITION_WORKERS", DEFAULT_MAX_WORKERS))
+        # spawn: forking a process that runs an event loop and DB pool threads is unsafe
+        _process_pool = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+class _MissingManifest:
+    """Negative _manifest_cache entry, valid while the manifest directory is unchanged and until `expires_at` (monotonic)."""
+
+    def __init__(self, dir_version: Optional[int]):
+        self.dir_version = dir_version
+        self.expires_at = time.monotonic() + MISSING_MANIFEST_TTL_SECONDS
+
+
+def _manifest_dir_version() -> Optional[int]:
+    """mtime of the manifest directory (None before it exists), stat'ed at most every MANIFEST_DIR_CHECK_SECONDS."""
+    global _manifest_dir_checked
+    checked_at, version = _manifest_dir_checked
+    now = time.monotonic()
+    if now - checked_at >= MANIFEST_DIR_CHECK_SECONDS:
+        try:
+            version = os.stat(os.path.join(media.MEDIA_DIR, MANIFEST_DIR_NAME)).st_mtime_ns
+        except FileNotFoundError:
+            version = None
+        _manifest_dir_checked = (now, version)
+    return version
+
+
+def _discard_temp_files(entries: List[Dict]):
+    for entry in entries:
+        try:
+            os.remove(entry["tmp_path"])
+        except FileNotFoundError:
+            pass  # already committed (moved) or never written
+
+
+def _write_temp(media_dir: str, data: bytes, extension: str) -> Dict:
+    """Write encoded bytes to a temp file; the parent commits it under its content address."""
+    filename = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+    tmp_path = os.path.join(media_dir, f".{filename}.{os.getpid()}.part")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    return {"tmp_path": tmp_path, "filename": filename}
+
+
+def _render_image(
+    source_path: str,
+    media_dir: str,
+    widths: Sequence[int],
+    formats: Sequence[str],
+) -> Dict:
+    """Worker entry point: decode once, resize largest to smallest, encode every format."""
+    from PIL import Image, ImageOps, features
+
+    with Image.open(source_path) as original:
+        # Let the JPEG decoder downscale while decoding when the target is much smaller
+        original.draft("RGB", (max(widths), max(widths)))
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        source_width, source_height = image.size
+        target_widths = sorted({min(w, source_width) for w in widths}, reverse=True)
+
+        renditions = []
+        current = image
+        try:
+            for width in target_widths:
+                height = max(1, round(source_height * width / source_width))
+                if current.size != (width, height):
+                    current = current.resize((width, height), Image.LANCZOS)
+                for fmt in formats:
+                    if not features.check(fmt):
+                        continue
+                    buffer = io.BytesIO()
+                    current.save(buffer, format=fmt.upper(), quality=DEFAULT_QUALITY.get(fmt, 75))
+                    data = buffer.getvalue()
+                    renditions.append({
+                        **_write_temp(media_dir, data, fmt),
+                        "format": fmt,
+                        "width": width,
+                        "height": height,
+                        "size": len(data),
+                    })
+        except BaseException:
+            _discard_temp_files(renditions)
+            raise
+
+    return {"width": source_width, "height": source_height, "renditions": renditions}
+
+
+def _manifest_path(url: str) -> Optional[str]:
+    if not url or not url.startswith(media.MEDIA_URL_PREFIX):
+        return None
+    return os.path.join(media.MEDIA_DIR, MANIFEST_DIR_NAME, f"{os.path.basename(url)}.json")
+
+
+def get_renditions(url: str) -> Optional[Dict]:
+    """Return the rendition manifest of a stored image, or None if it has none."""
+    cached = _manifest_cache.get(url)
+    dir_version = _manifest_dir_version()
+    if isinstance(cached, _MissingManifest):
+        if cached.dir_version == dir_version and cached.expires_at > time.monotonic():
+            return None
+    elif cached is not None:
+        return cached
+
+    manifest_path = _manifest_path(url)
+    if manifest_path is None or not os.path.exists(manifest_path):
+        _manifest_cache.set(url, _MissingManifest(dir_version))
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    _manifest_cache.set(url, manifest)
+    return manifest
+
+
+def _commit_renditions(manifest: Dict) -> Dict:
+    """
+    Move worker temp files into content-addressed storage, taking one reference each. If a
+    commit fails, the references already taken are released; temp files never outlive this call.
+    """
+    committed = []
+    try:
+        for entry in manifest["renditions"]:
+            url = media.commit_content_addressed(entry["tmp_path"], entry["filename"])
+            committed.append({
+                **{key: value for key, value in entry.items() if key not in ("tmp_path", "filename")},
+                "url": url,
+            })
+    except BaseException:
+        _release_entries(committed)
+        raise
+    finally:
+        _discard_temp_files(manifest["renditions"])
+    manifest["renditions"] = committed
+    return manifest
+
+
+def _release_entries(entries: List[Dict]):
+    for entry in entries:
+        media.delete_from_bucket(entry["url"])
+
+
+def _write_manifest(url: str, manifest: Dict) -> Dict:
+    """
+    Publish a manifest unless another worker process got there first, in which case
+    our rendition references are handed back and the published manifest wins.
+    """
+    manifest_path = _manifest_path(url)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    # Written aside and linked into place: the link fails if a manifest exists, and a write that
+    # fails partway never leaves a truncated manifest behind
+    tmp_path = f"{manifest_path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.link(tmp_path, manifest_path)
+        return manifest
+    except FileExistsError:
+        _release_entries(manifest["renditions"])
+        with open(manifest_path) as f:
+            return json.load(f)
+    except BaseException:
+        _release_entries(manifest["renditions"])
+        raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def release_renditions(url: str):
+    """Drop the renditions of an original whose last reference was deleted."""
+    manifest_path = _manifest_path(url)
+    _manifest_cache.delete(url)
+    if manifest_path is None or not os.path.exists(manifest_path):
+        return
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    os.remove(manifest_path)
+    for entry in manifest.get("renditions", []):
+        media.delete_from_bucket(entry["url"])
+
+
+def get_renditions_for_images(urls: List[str]) -> List[Optional[Dict]]:
+    """Manifests aligned with a post's `images` list."""
+    return [get_renditions(url) for url in urls or []]
+
+
+def schedule_renditions(url: str):
+    """
+    Generate an uploaded image's renditions in a background task of the running event loop,
+    at most once at a time per URL. Feeds serve the original until the manifest is written.
+    """
+    if url in _pending:
+        return
+    task = asyncio.get_running_loop().create_task(generate_renditions(url))
+    _pending[url] = task
+    task.add_done_callback(lambda _: _pending.pop(url, None))
+
+
+async def drain_pending(timeout: float = DRAIN_TIMEOUT_SECONDS):
+    """At shutdown: let scheduled renditions finish for up to `timeout` seconds, then cancel the rest."""
+    if not _pending:
+        return
+    _, unfinished = await asyncio.wait(list(_pending.values()), timeout=timeout)
+    for url, task in list(_pending.items()):
+        if task in unfinished:
+            logger.warning(f"Renditions of {url} still generating at shutdown, abandoned")
+            task.cancel()
+
+
+async def generate_renditions(url: str) -> Optional[Dict]:
+    """
+    Generate (or reuse) the renditions of an uploaded image.
+    Returns None when the image cannot be processed; the original stays usable either way.
+    """
+    _manifest_cache.delete(url)  # a remembered miss must not hide a manifest written since
+    existing = get_renditions(url)
+    if existing is not None:
+        return existing
+
+    manifest_path = _manifest_path(url)
+    if manifest_path is None:
+        return None
+
+    try:
+        import PIL  # noqa: F401  (optional dependency)
+    except ImportError:
+        logger.warning("Pillow is not installed, skipping media renditions")
+        return None
+
+    try:
+        source_path = media.resolve_media_path(url)
+        loop = asyncio.get_running_loop()
+        manifest = await loop.run_in_executor(
+            get_process_pool(),
+            _render_image,
+            source_path,
+            media.MEDIA_DIR,
+            RENDITION_WIDTHS,
+            RENDITION_FORMATS,
+        )
+    except BrokenProcessPool as e:
+        # A worker died (e.g. OOM on a huge image); start a fresh pool for the next upload
+        logger.error(f"Rendition worker crashed on {url}: {str(e)}")
+        shutdown_process_pool()
+        return None
+    except Exception as e:
+        logger.error(f"Failed to generate renditions for {url}: {str(e)}")
+        return None
+
+    try:
+        manifest = await asyncio.to_thread(_commit_renditions, manifest)
+        manifest = await asyncio.to_thread(_write_manifest, url, manifest)
+    except Exception as e:
+        logger.error(f"Failed to store renditions for {url}: {str(e)}")
+        return None
+    _manifest_cache.set(url, manifest)
+    return manifest
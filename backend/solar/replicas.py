@@ -0,0 +1,288 @@
+"""
+Read-replica routing for Table.sql.
+
+Each primary (pg_key) may have read replicas, configured with `<pg_key>_REPLICAS`. Read-only
+statements go to a replica whose measured lag is within PG_REPLICA_MAX_LAG_SECONDS; everything
+else, and every read of a session that has just written, goes to the primary:
+
+- Within one session (one API call, see `session`), any write pins the rest of the session's
+  statements to the primary.
+- Across sessions, a session key (the acting user) that wrote in the last
+  PG_READ_YOUR_WRITES_SECONDS keeps reading from the primary, so users see their own
+  likes, saves and follows immediately. The deadline is kept on the primary itself (an
+  unlogged `solar_recent_writers` table), not in process memory, so it holds whichever worker
+  process or instance serves the user's next request. Each process reads the whole table at
+  most every PG_RECENT_WRITERS_REFRESH_SECONDS rather than asking once per session, so a
+  write made through another process is seen within that interval (immediately on the
+  process that made it).
+
+Lag is measured by a background thread; a replica is unused until its first successful check,
+and a replica that errors is skipped until the next check succeeds.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from itertools import count
+from typing import Dict, Iterator, List, Optional
+import logging
+import re
+import threading
+import time
+
+from psycopg_pool import ConnectionPool
+
+from . import metrics, resilience
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+# Replayed everything received while still streaming: caught up, however long the primary has
+# been idle. Otherwise (including a disconnected WAL receiver, whose received and replayed
+# positions stay equal) the lag is the age of the last replayed transaction, NULL before any.
+# Seeing pg_stat_wal_receiver's status takes pg_read_all_stats (e.g. via pg_monitor); without
+# it idle replicas read as lagging and reads stay on the primary.
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+             AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END AS lag
+"""
+REPLICA_CHECK_TIMEOUT = 2  # seconds
+
+_COMMENTS_AND_LITERALS = re.compile(r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"", re.S)
+_READ_STATEMENT = re.compile(r"^\s*\(?\s*(SELECT|WITH|VALUES|TABLE|SHOW)\b", re.I)
+# Reads that still write or lock: data-modifying CTEs, SELECT INTO, row locks, sequences, advisory locks
+_WRITING_READ = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|INTO|nextval|setval|pg_advisory\w*)\b|\bFOR\s+(NO\s+KEY\s+UPDATE|UPDATE|SHARE|KEY\s+SHARE)\b",
+    re.I,
+)
+
+
+@lru_cache(maxsize=4096)
+def is_read_only_statement(sql_statement: str) -> bool:
+    """True if a statement can safely run on a replica."""
+    stripped = _COMMENTS_AND_LITERALS.sub(" ", sql_statement)
+    return bool(_READ_STATEMENT.match(stripped)) and not _WRITING_READ.search(stripped)
+
+
+######################################################################################################################
+# Sessions (read-your-writes)
+######################################################################################################################
+
+
+class ReplicaSession:
+    def __init__(self, key: Optional[str]):
+        self.key = key
+        self.wrote = False
+        self.recent_writer: Dict[str, bool] = {}  # pg_key -> wrote within PG_READ_YOUR_WRITES_SECONDS
+
+
+_session: ContextVar[Optional[ReplicaSession]] = ContextVar("solar_replica_session", default=None)
+
+RECENT_WRITERS_DDL = """
+    CREATE UNLOGGED TABLE IF NOT EXISTS solar_recent_writers (
+        session_key TEXT PRIMARY KEY,
+        primary_until TIMESTAMPTZ NOT NULL
+    )
+"""
+RECENT_WRITERS_PRUNE_SECONDS = 60
+_recent_writers_ready: Dict[str, bool] = {}
+_recent_writers_pruned_at = 0.0
+# pg_key -> {session key: time.monotonic() until which its reads stay on the primary}
+_recent_writers: Dict[str, Dict[str, float]] = {}
+_recent_writers_loaded_at: Dict[str, float] = {}
+_recent_writers_lock = threading.Lock()
+
+
+@contextmanager
+def session(key=None) -> Iterator[ReplicaSession]:
+    """Scope a unit of work (an API call) for read-your-writes; `key` identifies the acting user."""
+    replica_session = ReplicaSession(str(key) if key is not None else None)
+    token = _session.set(replica_session)
+    try:
+        yield replica_session
+    finally:
+        _session.reset(token)
+        if replica_session.wrote and replica_session.key is not None:
+            # Before the response goes out, so the user's next request already sees it
+            _remember_writer(replica_session.key)
+
+
+def note_write():
+    replica_session = _session.get()
+    if replica_session is not None:
+        replica_session.wrote = True
+
+
+def pinned_to_primary(pg_key: Optional[str] = None) -> bool:
+    replica_session = _session.get()
+    if replica_session is None:
+        return False
+    if replica_session.wrote:
+        return True
+    if replica_session.key is None or pg_key is None:
+        return False
+    # Asked once per session and primary; the answer holds for the rest of the (short) session
+    if pg_key not in replica_session.recent_writer:
+        replica_session.recent_writer[pg_key] = _is_recent_writer(pg_key, replica_session.key)
+    return replica_session.recent_writer[pg_key]
+
+
+@contextmanager
+def _primary_connection(pg_key: str):
+    from . import table
+
+    with table.get_pool()[pg_key].connection(timeout=REPLICA_CHECK_TIMEOUT) as conn:
+        if not _recent_writers_ready.get(pg_key):
+            conn.execute(RECENT_WRITERS_DDL)
+            _recent_writers_ready[pg_key] = True
+        yield conn
+
+
+def _remember_writer(key: str):
+    """Keep `key`'s reads on every replicated primary for PG_READ_YOUR_WRITES_SECONDS."""
+    until = time.monotonic() + config.read_your_writes_seconds()
+    for pg_key in list(_replicas):
+        with _recent_writers_lock:
+            _recent_writers.setdefault(pg_key, {})[key] = until
+        try:
+            with _primary_connection(pg_key) as conn:
+                conn.execute(
+                    """
+                    INSERT INTO solar_recent_writers (session_key, primary_until)
+                    VALUES (%(key)s, now() + make_interval(secs => %(seconds)s))
+                    ON CONFLICT (session_key) DO UPDATE SET primary_until = EXCLUDED.primary_until
+                    """,
+                    {"key": key, "seconds": config.read_your_writes_seconds()},
+                )
+        except Exception as e:
+            logger.warning(f"Could not record recent write of {key} on {pg_key}: {str(e)}")
+
+
+def _is_recent_writer(pg_key: str, key: str) -> bool:
+    with _recent_writers_lock:
+        loaded_at = _recent_writers_loaded_at.get(pg_key)
+        if loaded_at is None or time.monotonic() - loaded_at >= config.recent_writers_refresh_seconds():
+            _load_recent_writers(pg_key)
+        until = _recent_writers.get(pg_key, {}).get(key)
+    return until is not None and until > time.monotonic()
+
+
+def _load_recent_writers(pg_key: str):
+    # Called with _recent_writers_lock held
+    _recent_writers_loaded_at[pg_key] = time.monotonic()
+    if resilience.breaker_for(pg_key).state != resilience.CLOSED:
+        return  # the primary is failing: keep reads on the replicas rather than wait on it
+    try:
+        with _primary_connection(pg_key) as conn:
+            rows = conn.execute(
+                """
+                SELECT session_key, EXTRACT(EPOCH FROM primary_until - now()) AS remaining
+                FROM solar_recent_writers WHERE primary_until > now()
+                """
+            ).fetchall()
+    except Exception as e:
+        # Keep the last snapshot: without it reads go to a replica, as they would for any other user
+        logger.warning(f"Could not load recent writers on {pg_key}: {str(e)}")
+        return
+    now = time.monotonic()
+    # Deadlines only ever run out: keep this process's own, which may not have been committed yet
+    snapshot = {key: until for key, until in _recent_writers.get(pg_key, {}).items() if until > now}
+    for row in rows:
+        snapshot[row["session_key"]] = max(snapshot.get(row["session_key"], 0.0), now + float(row["remaining"]))
+    _recent_writers[pg_key] = snapshot
+
+
+def _prune_recent_writers():
+    global _recent_writers_pruned_at
+    if time.monotonic() - _recent_writers_pruned_at < RECENT_WRITERS_PRUNE_SECONDS:
+        return
+    _recent_writers_pruned_at = time.monotonic()
+    for pg_key in list(_replicas):
+        try:
+            with _primary_connection(pg_key) as conn:
+                conn.execute("DELETE FROM solar_recent_writers WHERE primary_until < now()")
+        except Exception as e:
+            logger.warning(f"Could not prune recent writers on {pg_key}: {str(e)}")
+
+
+######################################################################################################################
+# Replica health
+######################################################################################################################
+
+
+class ReplicaState:
+    def __init__(self, pg_key: str, index: int, pool: ConnectionPool):
+        self.pg_key = pg_key
+        self.index = index
+        self.pool = pool
+        self.label = f"{pg_key}/replica{index}"
+        self.lag: Optional[float] = None  # None until measured, or after a failure
+
+    @property
+    def usable(self) -> bool:
+        return self.lag is not None and self.lag <= config.replica_max_lag_seconds()
+
+
+_replicas: Dict[str, List[ReplicaState]] = {}
+_round_robin = count()
+_monitor: Optional[threading.Thread] = None
+_monitor_lock = threading.Lock()
+
+
+def configure(replica_pools: Dict[str, List[ConnectionPool]]):
+    """Register the replica pools of every primary and start measuring their lag."""
+    global _replicas, _monitor
+    _replicas = {
+        pg_key: [ReplicaState(pg_key, index, pool) for index, pool in enumerate(pools)]
+        for pg_key, pools in replica_pools.items()
+    }
+    with _monitor_lock:
+        if _replicas and (_monitor is None or not _monitor.is_alive()):
+            _monitor = threading.Thread(target=_monitor_replicas, name="replica-lag-monitor", daemon=True)
+            _monitor.start()
+
+
+def choose_replica(pg_key: str) -> Optional[ReplicaState]:
+    """A replica of `pg_key` within the lag budget (round-robin), or None to use the primary."""
+    usable = [replica for replica in _replicas.get(pg_key, ()) if replica.usable]
+    if not usable:
+        return None
+    return usable[next(_round_robin) % len(usable)]
+
+
+def mark_replica_failed(replica: ReplicaState, error: Exception):
+    logger.warning(f"Replica {replica.label} failed, routing reads to the primary until it recovers: {str(error)}")
+    replica.lag = None
+
+
+def check_replicas():
+    for replicas in list(_replicas.values()):
+        for replica in replicas:
+            try:
+                with replica.pool.connection(timeout=REPLICA_CHECK_TIMEOUT) as conn:
+                    row = conn.execute(REPLICA_LAG_SQL).fetchone()
+                replica.lag = float(row["lag"]) if row["lag"] is not None else None
+            except Exception as e:
+                if replica.lag is not None:
+                    logger.warning(f"Replica {replica.label} lag check failed: {str(e)}")
+                replica.lag = None
+            metrics.DB_REPLICA_LAG.labels(replica.label).set(replica.lag if replica.lag is not None else float("inf"))
+
+
+def _monitor_replicas():
+    while True:
+        check_replicas()
+        _prune_recent_writers()
+        time.sleep(config.replica_check_interval_seconds())
+
+
+def replica_status() -> List[Dict]:
+    return [
+        {"replica": replica.label, "lag_seconds": replica.lag, "usable": replica.usable}
+        for replicas in _replicas.values()
+        for replica in replicas
+    ]
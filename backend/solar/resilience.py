@@ -0,0 +1,177 @@
+"""
+Error classification, retry backoff and per-database circuit breakers for Table.sql.
+
+Errors are either transient (the connection dropped, the server is restarting or refusing
+connections, a serialization failure or deadlock) or permanent (constraint violations, syntax
+errors, bad parameters...). Only transient errors are worth retrying, after a jittered
+backoff; permanent ones are raised straight away. A write that fails once it has been sent
+may still have committed (the connection can drop while the commit is in flight), so it is
+only retried when the server says it rolled it back: see `may_retry`.
+
+Each database (pg_key) has a CircuitBreaker fed by its connection errors. After
+PG_BREAKER_FAILURE_THRESHOLD consecutive failures it opens and statements fail fast with
+CircuitOpenError instead of waiting on a dead server; after PG_BREAKER_RESET_SECONDS one
+trial statement is let through (half-open) and its outcome closes or re-opens the breaker.
+"""
+
+from typing import Dict
+import logging
+import random
+import threading
+import time
+
+from psycopg import Error as PsycopgError, OperationalError
+from psycopg_pool import PoolTimeout
+
+from . import metrics
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_DELAY = 0.05  # seconds
+RETRY_MAX_DELAY = 1.0  # seconds
+
+# SQLSTATEs worth retrying: the statement may well succeed on a second attempt
+_TRANSIENT_SQLSTATES = {
+    "40001",  # serialization_failure
+    "40P01",  # deadlock_detected
+    "53300",  # too_many_connections
+    "57P01",  # admin_shutdown
+    "57P02",  # crash_shutdown
+    "57P03",  # cannot_connect_now
+}
+
+
+# Serialization failures and deadlocks: the server has rolled the transaction back
+_ROLLED_BACK_SQLSTATES = {"40001", "40P01"}
+
+
+def _is_connection_error(error: BaseException) -> bool:
+    if not isinstance(error, OperationalError) or isinstance(error, (PoolTimeout, CircuitOpenError)):
+        return False
+    sqlstate = error.sqlstate
+    # No SQLSTATE: raised client-side because the connection was lost or never made
+    return sqlstate is None or sqlstate.startswith("08") or sqlstate in {"53300", "57P01", "57P02", "57P03"}
+
+
+def is_transient(error: BaseException) -> bool:
+    """True if retrying the statement (on a fresh connection) may succeed."""
+    if not isinstance(error, PsycopgError) or isinstance(error, (PoolTimeout, CircuitOpenError)):
+        # A pool timeout has already waited out the checkout timeout; retrying just waits again
+        return False
+    return _is_connection_error(error) or error.sqlstate in _TRANSIENT_SQLSTATES
+
+
+def may_retry(error: BaseException, read_only: bool, sent: bool) -> bool:
+    """
+    True if the statement can be run again without risking applying it twice: a transient
+    error on a read, before a write was sent, or one the server rolled the write back for.
+    """
+    if not is_transient(error):
+        return False
+    return read_only or not sent or error.sqlstate in _ROLLED_BACK_SQLSTATES
+
+
+def is_outage(error: BaseException) -> bool:
+    """True if the error says the database itself is unreachable; these trip the circuit breaker."""
+    return isinstance(error, PoolTimeout) or _is_connection_error(error)
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (1-based)."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+######################################################################################################################
+# Circuit breakers
+######################################################################################################################
+
+
+class CircuitOpenError(OperationalError):
+    """Raised instead of running a statement while its database's circuit breaker is open."""
+
+    def __init__(self, pg_key: str, retry_after: float):
+        super().__init__(f"Database {pg_key} is unavailable (circuit open), retry in {retry_after:.0f}s")
+        self.pg_key = pg_key
+        self.retry_after = retry_after
+
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(self, pg_key: str, failure_threshold: int, reset_seconds: float):
+        self.pg_key = pg_key
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        metrics.DB_CIRCUIT_STATE.labels(pg_key).set(_STATE_VALUES[CLOSED])
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a statement may run now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                # The trial statement; everyone else keeps failing fast until it reports back
+                self._probing = True
+                return
+            raise CircuitOpenError(self.pg_key, max(remaining, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self, error: BaseException):
+        """Count an error; only outages move the breaker, anything else ends a trial like a success."""
+        if not is_outage(error):
+            self.record_success()
+            return
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def _transition(self, state: str):
+        logger.warning(f"Circuit breaker for {self.pg_key}: {self.state} -> {state}")
+        self.state = state
+        metrics.DB_CIRCUIT_STATE.labels(self.pg_key).set(_STATE_VALUES[state])
+        metrics.DB_CIRCUIT_TRANSITIONS.labels(self.pg_key, state).inc()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(pg_key: str) -> CircuitBreaker:
+    breaker = _breakers.get(pg_key)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(pg_key)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    pg_key, config.breaker_failure_threshold(), config.breaker_reset_seconds()
+                )
+                _breakers[pg_key] = breaker
+    return breaker
+
+
+def breaker_states() -> Dict[str, Dict]:
+    return {pg_key: breaker.snapshot() for pg_key, breaker in list(_breakers.items())}
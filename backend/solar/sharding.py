@@ -0,0 +1,111 @@
+"""
+Hash sharding for high-volume tables.
+
+A Table opts in with `__shard_key__ = "<column>"`; when shards are configured
+(`PG_SHARD_0`, `PG_SHARD_1`, ... in the environment) each row lives on the shard its
+shard-key value hashes to, otherwise the table stays on its usual database.
+
+Values hash into SHARD_BUCKETS fixed buckets, and buckets are split into contiguous
+ranges, one per shard. Going from N to 2N shards therefore splits every shard's range
+in two instead of reshuffling all rows.
+
+Table.sql routes a statement by the shard-key value in its params (or an explicit
+`shard=`); reads that span shards go through `scatter_gather`, which queries the
+shards in parallel and concatenates the rows.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from hashlib import blake2b
+from typing import Any, Dict, Iterable, List, Optional
+import threading
+import uuid
+
+from .config import config
+
+SHARD_BUCKETS = 4096
+SCATTER_WORKERS = 16
+
+_shard_keys: Optional[List[str]] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def shard_keys() -> List[str]:
+    """The pg_keys of the configured shards, in shard order (empty when sharding is off)."""
+    global _shard_keys
+    if _shard_keys is None:
+        _shard_keys = list(config.get_shard_connection_strings())
+    return _shard_keys
+
+
+def is_sharded(table_cls) -> bool:
+    return getattr(table_cls, "__shard_key__", None) is not None and bool(shard_keys())
+
+
+def bucket_for(value: Any) -> int:
+    if isinstance(value, str):
+        try:
+            value = uuid.UUID(value)
+        except ValueError:
+            pass
+    data = value.bytes if isinstance(value, uuid.UUID) else str(value).encode()
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), "big") % SHARD_BUCKETS
+
+
+def shard_for(value: Any) -> str:
+    """The shard (pg_key) holding rows whose shard-key column equals `value`."""
+    keys = shard_keys()
+    return keys[bucket_for(value) * len(keys) // SHARD_BUCKETS]
+
+
+def group_by_shard(table_cls, values: Iterable[Any]) -> Dict[Optional[str], List[Any]]:
+    """Split shard-key values by shard; a single None group when the table is not sharded."""
+    values = list(values)
+    if not is_sharded(table_cls):
+        return {None: values} if values else {}
+    groups: Dict[Optional[str], List[Any]] = {}
+    for value in values:
+        groups.setdefault(shard_for(value), []).append(value)
+    return groups
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=SCATTER_WORKERS, thread_name_prefix="shard-scatter")
+    return _executor
+
+
+def scatter_gather(
+    table_cls,
+    sql_statement: str,
+    params: Optional[Dict[str, Any]] = None,
+    shard_params: Optional[Dict[Optional[str], Dict[str, Any]]] = None,
+    **sql_kwargs,
+) -> List[Dict]:
+    """
+    Run a statement on several shards in parallel and return all rows, in shard order.
+
+    By default `sql_statement` runs with `params` on every shard. Pass `shard_params`
+    ({shard: params}, usually built from `group_by_shard`) to query only some shards,
+    each with its own parameters. Aggregates come back per shard; combine them in
+    Python (e.g. sum the COUNT(*) rows). On an unsharded table this is plain Table.sql.
+    """
+    if shard_params is None:
+        shard_params = {shard: params for shard in shard_keys()} if is_sharded(table_cls) else {None: params}
+    if not is_sharded(table_cls):
+        return [row for p in shard_params.values() for row in table_cls.sql(sql_statement, p, **sql_kwargs)]
+    if len(shard_params) == 1:
+        shard, p = next(iter(shard_params.items()))
+        return table_cls.sql(sql_statement, p, shard=shard, **sql_kwargs)
+
+    # Each task runs in a copy of the caller's context so query tracing and replica sessions follow it
+    executor = _get_executor()
+    futures = [
+        executor.submit(copy_context().run, table_cls.sql, sql_statement, p, shard=shard, **sql_kwargs)
+        for shard, p in shard_params.items()
+    ]
+    return [row for future in futures for row in future.result()]
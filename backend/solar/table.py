@@ -1,16 +1,21 @@
-from typing import Dict, Any, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from pydantic import BaseModel, Field
 import uuid
 from datetime import datetime
 
+import psycopg
 from psycopg.rows import dict_row
-from psycopg_pool import ConnectionPool
-from psycopg import Connection, Error as PsycopgError
+from psycopg_pool import ConnectionPool, PoolTimeout
+from psycopg import Connection, Error as PsycopgError, IsolationLevel
 from psycopg.types.json import Jsonb
 
 from .config import config
+from . import metrics, partitions, replicas, resilience, sharding, tracing
 
 import logging
+import threading
 import time
 
 logger = logging.getLogger(__name__)
@@ -22,10 +27,14 @@ DEFAULT_TIMEOUT = 30  # seconds
 DEFAULT_KEEPALIVE = 60  # seconds
 DEFAULT_RECONNECT_TIMEOUT = 5  # seconds
 DEFAULT_MAX_RETRIES = 3
+DEFAULT_STREAM_BATCH_SIZE = 2000  # rows per server-side cursor fetch
 
 _pool = None
-_last_pool_check = 0
-_pool_check_interval = 300  # Check pool health every 5 minutes
+_pool_lock = threading.Lock()
+_replica_pools = None
+_replica_pools_lock = threading.Lock()
+_health_checker: Optional[threading.Thread] = None
+_health_checker_lock = threading.Lock()
 
 
 class SchemaConnection(Connection):
@@ -33,77 +42,459 @@ class SchemaConnection(Connection):
         super().__init__(*args, **kwargs)
         with self.cursor() as cur:
             cur.execute("set search_path to auth, public")
+        self.returned_at = time.monotonic()
 
 
-def is_connection_alive(conn):
-    """Test if a database connection is still alive and usable"""
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT 1")
-            return True
-    except Exception as e:
-        logger.warning(f"Connection health check failed: {str(e)}")
-        return False
+def _mark_returned(conn: SchemaConnection):
+    # Pool `reset` callback: runs each time a connection goes back into the pool
+    conn.returned_at = time.monotonic()
 
 
-def validate_pool(pool: ConnectionPool, pg_key: str) -> bool:
-    """Validate the entire pool's health and attempt to fix issues"""
-    try:
-        # Test a connection from the pool
-        with pool.getconn() as conn:
-            if not is_connection_alive(conn):
-                logger.warning(f"Pool {pg_key} failed health check")
-                return False
-        return True
-    except Exception as e:
-        logger.error(f"Pool {pg_key} validation failed: {str(e)}")
-        return False
+def _check_if_idle(conn: SchemaConnection):
+    """
+    Pool `check` callback, run on checkout: ping only connections that sat idle for more than
+    PG_POOL_CHECK_IDLE_SECONDS, since recently used ones are almost certainly alive. Raising
+    makes the pool discard the connection and hand out another.
+    """
+    if time.monotonic() - conn.returned_at > config.pool_check_idle_seconds():
+        ConnectionPool.check_connection(conn)
 
 
 def get_pool(reset: bool = False) -> Dict[str, ConnectionPool]:
-    """Get or create the connection pool with enhanced health checks"""
-    global _pool, _last_pool_check
+    """
+    Get or create the connection pools of every database (pg_key). Their health is checked
+    in the background (see `start_health_checks`), never on the request path.
+    """
+    global _pool
 
-    current_time = time.time()
+    if _pool is None or reset:
+        with _pool_lock:
+            if _pool is None or reset:
+                pools = {}
+                for pg_key, pg_conn_string in config.get_all_pg_connection_strings().items():
+                    try:
+                        pools[pg_key] = _create_pool(pg_conn_string)
+                        logger.info(f"Created new connection pool for {pg_key}")
+                    except Exception as e:
+                        logger.error(f"Failed to create pool for {pg_key}: {str(e)}")
+                        raise
+                _pool = pools
+        start_health_checks()
 
-    # Check if we need to validate existing pools
-    if (
-        _pool is not None
-        and not reset
-        and (current_time - _last_pool_check) > _pool_check_interval
-    ):
-        logger.debug("Performing periodic pool health check")
-        for pg_key, pool in _pool.items():
-            if not validate_pool(pool, pg_key):
-                logger.warning(f"Pool {pg_key} failed health check, will be recreated")
-                reset = True
-        _last_pool_check = current_time
+    return _pool
 
-    if _pool is None or reset:
-        _pool = {}
-        for pg_key, pg_conn_string in config.get_all_pg_connection_strings().items():
+
+def _create_pool(pg_conn_string: str) -> ConnectionPool:
+    return ConnectionPool(
+        pg_conn_string,
+        min_size=DEFAULT_MIN_SIZE,
+        max_size=DEFAULT_MAX_SIZE,
+        timeout=DEFAULT_TIMEOUT,
+        max_idle=config.pool_max_idle_seconds(),
+        max_lifetime=config.pool_max_lifetime_seconds(),
+        kwargs={
+            "row_factory": dict_row,
+            "keepalives": 1,
+            "keepalives_idle": DEFAULT_KEEPALIVE,
+            "keepalives_interval": DEFAULT_KEEPALIVE,
+            "keepalives_count": 3,
+        },
+        connection_class=SchemaConnection,
+        check=_check_if_idle,
+        reset=_mark_returned,
+    )
+
+
+def check_pools():
+    """
+    Ping the idle connections of every pool (primaries, shards, replicas), replacing broken
+    ones and those past PG_POOL_MAX_LIFETIME_SECONDS. Connections checked out by requests
+    are left alone.
+    """
+    pools = dict(_pool or {})
+    for pg_key, replica_pools in (_replica_pools or {}).items():
+        for index, pool in enumerate(replica_pools):
+            pools[f"{pg_key}/replica{index}"] = pool
+    for pg_key, pool in pools.items():
+        lost_before = pool.get_stats().get("connections_lost", 0)
+        try:
+            pool.check()
+        except Exception as e:
+            logger.warning(f"Health check of pool {pg_key} failed: {str(e)}")
+            continue
+        lost = pool.get_stats().get("connections_lost", 0) - lost_before
+        if lost:
+            logger.warning(f"Health check replaced {lost} broken connection(s) in pool {pg_key}")
+
+
+def _run_health_checks():
+    while True:
+        time.sleep(config.pool_health_check_interval_seconds())
+        check_pools()
+
+
+def start_health_checks():
+    """Run `check_pools` every PG_POOL_HEALTH_CHECK_INTERVAL_SECONDS in a daemon thread."""
+    global _health_checker
+    with _health_checker_lock:
+        if _health_checker is None or not _health_checker.is_alive():
+            _health_checker = threading.Thread(target=_run_health_checks, name="pool-health-check", daemon=True)
+            _health_checker.start()
+
+
+def get_replica_pools() -> Dict[str, List[ConnectionPool]]:
+    """
+    Get or create the read-replica pools of every primary (`<pg_key>_REPLICAS`).
+    Replica failures are handled by routing around them, so these are never reset.
+    """
+    global _replica_pools
+    if _replica_pools is None:
+        with _replica_pools_lock:
+            if _replica_pools is None:
+                replica_pools = {}
+                for pg_key in config.get_all_pg_connection_strings():
+                    conn_strings = config.get_replica_connection_strings(pg_key)
+                    if conn_strings:
+                        replica_pools[pg_key] = [_create_pool(conn_string) for conn_string in conn_strings]
+                        logger.info(f"Created {len(conn_strings)} replica pool(s) for {pg_key}")
+                replicas.configure(replica_pools)
+                _replica_pools = replica_pools
+    return _replica_pools
+
+
+def warm_pools() -> Dict[str, bool]:
+    """
+    Create every pool (primaries, shards, replicas) and wait, up to
+    PG_POOL_WARMUP_TIMEOUT_SECONDS in total, for each to open its min_size connections, so
+    the first requests after a cold start don't pay for the connection handshakes.
+    Returns which pools became ready; a pool that didn't keeps connecting in the background.
+    """
+    pools = dict(get_pool())
+    for pg_key, replica_pools in get_replica_pools().items():
+        for index, pool in enumerate(replica_pools):
+            pools[f"{pg_key}/replica{index}"] = pool
+
+    deadline = time.monotonic() + config.pool_warmup_timeout_seconds()
+    ready = {}
+    for pg_key, pool in pools.items():
+        try:
+            pool.wait(timeout=max(deadline - time.monotonic(), 0.1))
+            ready[pg_key] = True
+        except PoolTimeout:
+            logger.warning(f"Pool {pg_key} not ready after warm-up, continuing without it")
+            ready[pg_key] = False
+    return ready
+
+
+def close_pools():
+    """Close every pool of this process; called on shutdown once in-flight requests have drained."""
+    global _pool, _replica_pools
+    pools = list((_pool or {}).values())
+    for replica_pools in (_replica_pools or {}).values():
+        pools.extend(replica_pools)
+    for pool in pools:
+        try:
+            pool.close()
+        except Exception as e:
+            logger.warning(f"Failed to close pool: {str(e)}")
+    _pool = None
+    _replica_pools = None
+
+
+######################################################################################################################
+# Transactions
+######################################################################################################################
+
+ISOLATION_LEVELS = {
+    "read committed": IsolationLevel.READ_COMMITTED,
+    "repeatable read": IsolationLevel.REPEATABLE_READ,
+    "serializable": IsolationLevel.SERIALIZABLE,
+}
+
+
+class Transaction:
+    """
+    A unit of work opened by Table.transaction. The first statement for a database checks out
+    one connection, which stays pinned until the block ends; every later sql/sync/sync_many
+    call on that database reuses it, and the block commits (or rolls back) once.
+
+    A block spanning several databases (tables on different resources, or several shards)
+    holds one connection per database and commits them one after the other: each database
+    is atomic on its own, but the block as a whole is not.
+    """
+
+    def __init__(self, isolation_level: Optional[IsolationLevel], read_only: bool):
+        self.isolation_level = isolation_level
+        self.read_only = read_only
+        self.depth = 0
+        # pg_key -> (pool, connection, savepoint depth when it was opened)
+        self._connections: Dict[str, Tuple[ConnectionPool, Connection, int]] = {}
+        self._lock = threading.Lock()  # scatter_gather threads share the transaction
+
+    def connection(self, pg_key: str) -> Tuple[Connection, float]:
+        """The pinned connection for `pg_key` and the ms spent checking it out (0 when reused)."""
+        with self._lock:
+            if pg_key in self._connections:
+                return self._connections[pg_key][1], 0.0
+            breaker = resilience.breaker_for(pg_key)
+            breaker.before_call()
+            pool = get_pool()
+            if pg_key not in pool:
+                pool = get_pool(reset=True)
+            wait_start = time.perf_counter()
             try:
-                _pool[pg_key] = ConnectionPool(
-                    pg_conn_string,
-                    min_size=DEFAULT_MIN_SIZE,
-                    max_size=DEFAULT_MAX_SIZE,
-                    timeout=DEFAULT_TIMEOUT,
-                    kwargs={
-                        "row_factory": dict_row,
-                        "keepalives": 1,
-                        "keepalives_idle": DEFAULT_KEEPALIVE,
-                        "keepalives_interval": DEFAULT_KEEPALIVE,
-                        "keepalives_count": 3,
-                    },
-                    connection_class=SchemaConnection,
-                    check=is_connection_alive,
-                )
-                logger.info(f"Created new connection pool for {pg_key}")
+                conn = pool[pg_key].getconn()
             except Exception as e:
-                logger.error(f"Failed to create pool for {pg_key}: {str(e)}")
+                breaker.record_failure(e)
+                raise
+            breaker.record_success()
+            wait_ms = (time.perf_counter() - wait_start) * 1000
+            metrics.DB_POOL_WAIT.labels(pg_key).observe(wait_ms / 1000)
+            try:
+                conn.isolation_level = self.isolation_level
+                conn.read_only = self.read_only or None
+            except Exception:
+                pool[pg_key].putconn(conn)
                 raise
+            self._connections[pg_key] = (pool[pg_key], conn, self.depth)
+            return conn, wait_ms
 
-    return _pool
+    @contextmanager
+    def savepoint(self):
+        """A nested block: rolled back on its own when it raises, released into the outer block otherwise."""
+        self.depth += 1
+        name = f"solar_sp{self.depth}"
+        with self._lock:
+            opened_before = [conn for _, conn, _ in self._connections.values()]
+        for conn in opened_before:
+            conn.execute(f"SAVEPOINT {name}")
+        try:
+            yield self
+        except BaseException:
+            with self._lock:
+                for pg_key, (pool, conn, depth) in list(self._connections.items()):
+                    if depth >= self.depth:
+                        # Opened inside this block, so it holds nothing of the outer one
+                        del self._connections[pg_key]
+                        self._release(pool, conn, commit=False)
+                    else:
+                        conn.execute(f"ROLLBACK TO SAVEPOINT {name}")
+            raise
+        else:
+            with self._lock:
+                for conn in opened_before:
+                    conn.execute(f"RELEASE SAVEPOINT {name}")
+                # Connections opened inside the block now belong to the enclosing one: a later
+                # sibling savepoint that fails must roll back to its savepoint on them, not discard them
+                for pg_key, (pool, conn, depth) in list(self._connections.items()):
+                    if depth >= self.depth:
+                        self._connections[pg_key] = (pool, conn, self.depth - 1)
+        finally:
+            self.depth -= 1
+
+    def finish(self, commit: bool):
+        """Commit or roll back every pinned connection and return them to their pools."""
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        error = None
+        for pool, conn, _ in connections:
+            try:
+                self._release(pool, conn, commit=commit and error is None)
+            except Exception as e:
+                error = error or e
+        metrics.DB_TRANSACTIONS.labels("committed" if commit and error is None else "rolled_back").inc()
+        if error is not None:
+            raise error
+
+    @staticmethod
+    def _release(pool: ConnectionPool, conn: Connection, commit: bool):
+        try:
+            if commit:
+                conn.commit()
+            else:
+                conn.rollback()
+            conn.isolation_level = None
+            conn.read_only = None
+        finally:
+            pool.putconn(conn)
+
+
+_transaction: ContextVar[Optional[Transaction]] = ContextVar("solar_transaction", default=None)
+
+
+######################################################################################################################
+# Pipelines
+######################################################################################################################
+
+
+class PipelineResult:
+    """The rows of a statement queued on a Pipeline; available once the pipeline has run."""
+
+    def __init__(self, parts: int = 1):
+        self._parts: List[Optional[List[Dict]]] = [None] * parts
+
+    @property
+    def rows(self) -> List[Dict]:
+        if any(part is None for part in self._parts):
+            raise RuntimeError("Pipeline results are only available once the `with Table.pipeline()` block has ended")
+        return [row for part in self._parts for row in part]
+
+
+class _QueuedStatement:
+    def __init__(self, table_cls, sql_statement: str, params, result: PipelineResult, part: int):
+        self.table_cls = table_cls
+        self.sql_statement = sql_statement
+        self.params = params
+        self.read_only = replicas.is_read_only_statement(sql_statement)
+        self.result = result
+        self.part = part
+
+
+class Pipeline:
+    """
+    Statements queued by a Table.pipeline block. When the block ends, each database's
+    statements are sent in one batch with psycopg pipeline mode and their results read back
+    after a single flush, instead of one round trip per statement.
+
+    Statements on one database run in order, in one transaction (the enclosing
+    Table.transaction's when there is one). A group of read-only statements may go to a
+    read replica, like Table.sql. The statements of a pipeline can't depend on each other's
+    results; use a second pipeline for the statements that do.
+    """
+
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES):
+        self.max_retries = max_retries
+        self._queue: Dict[str, List[_QueuedStatement]] = {}
+
+    def sql(self, table_cls, sql_statement: str, params=None, shard: Optional[str] = None) -> PipelineResult:
+        """Queue a statement, routed like `table_cls.sql(sql_statement, params, shard=shard)`."""
+        result = PipelineResult()
+        self._enqueue(table_cls._get_pg_key(params, shard), table_cls, sql_statement, params, result, 0)
+        return result
+
+    def scatter(self, table_cls, sql_statement: str, params=None) -> PipelineResult:
+        """Queue a statement on every shard of `table_cls` (see sharding.scatter_gather); rows come back in shard order."""
+        if not sharding.is_sharded(table_cls):
+            return self.sql(table_cls, sql_statement, params)
+        shards = sharding.shard_keys()
+        result = PipelineResult(len(shards))
+        for part, shard in enumerate(shards):
+            self._enqueue(shard, table_cls, sql_statement, params, result, part)
+        return result
+
+    def _enqueue(self, pg_key, table_cls, sql_statement, params, result, part):
+        self._queue.setdefault(pg_key, []).append(_QueuedStatement(table_cls, sql_statement, params, result, part))
+
+    def execute(self):
+        """Send everything queued so far (one batch per database, databases in parallel)."""
+        queue, self._queue = self._queue, {}
+        if len(queue) <= 1:
+            for pg_key, statements in queue.items():
+                self._run(pg_key, statements)
+            return
+        executor = sharding._get_executor()
+        futures = [
+            executor.submit(copy_context().run, self._run, pg_key, statements)
+            for pg_key, statements in queue.items()
+        ]
+        for future in futures:
+            future.result()
+
+    def _run(self, pg_key: str, statements: List[_QueuedStatement]):
+        transaction = _transaction.get()
+        if transaction is not None:
+            conn, wait_ms = transaction.connection(pg_key)
+            self._send(conn, statements, wait_ms)
+            return
+
+        read_only = all(statement.read_only for statement in statements)
+        use_replica = read_only and bool(get_replica_pools().get(pg_key)) and not replicas.pinned_to_primary(pg_key)
+        breaker = resilience.breaker_for(pg_key)
+        attempt = 0
+        while True:
+            attempt += 1
+            conn = None
+            sent = False
+            replica = replicas.choose_replica(pg_key) if use_replica else None
+            if replica is not None:
+                pool = replica.pool
+            else:
+                breaker.before_call()
+                pools = get_pool()
+                pool = pools[pg_key] if pg_key in pools else get_pool(reset=True)[pg_key]
+            try:
+                wait_start = time.perf_counter()
+                conn = pool.getconn()
+                wait_ms = (time.perf_counter() - wait_start) * 1000
+                metrics.DB_POOL_WAIT.labels(replica.label if replica is not None else pg_key).observe(wait_ms / 1000)
+                sent = True
+                self._send(conn, statements, wait_ms)
+                conn.commit()
+                if replica is None:
+                    breaker.record_success()
+                return
+            except Exception as e:
+                if replica is None:
+                    breaker.record_failure(e)
+                if not isinstance(e, PsycopgError):
+                    raise
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                    except PsycopgError:
+                        pass
+                if replica is not None and (resilience.is_transient(e) or resilience.is_outage(e)):
+                    replicas.mark_replica_failed(replica, e)
+                    use_replica = False
+                    continue
+                if not resilience.may_retry(e, read_only, sent) or attempt >= self.max_retries:
+                    raise
+                delay = resilience.backoff_seconds(attempt)
+                for statement in statements:
+                    metrics.DB_QUERY_RETRIES.labels(statement.table_cls.__name__).inc()
+                logger.warning(
+                    f"Transient error in pipeline on {pg_key} (attempt {attempt}/{self.max_retries}), "
+                    f"retrying in {delay * 1000:.0f}ms: {str(e)}"
+                )
+                time.sleep(delay)
+            finally:
+                if conn is not None:
+                    pool.putconn(conn)
+
+    @staticmethod
+    def _send(conn: Connection, statements: List[_QueuedStatement], wait_ms: float):
+        start = time.perf_counter()
+        try:
+            cursors = [conn.cursor() for _ in statements]
+            if psycopg.Pipeline.is_supported():
+                with conn.pipeline():
+                    for cursor, statement in zip(cursors, statements):
+                        cursor.execute(statement.sql_statement, statement.params)
+            else:
+                # libpq older than 14: same connection and transaction, one round trip each
+                for cursor, statement in zip(cursors, statements):
+                    cursor.execute(statement.sql_statement, statement.params)
+            results = [cursor.fetchall() if cursor.description is not None else [] for cursor in cursors]
+        except PsycopgError:
+            for statement in statements:
+                metrics.DB_QUERY_ERRORS.labels(statement.table_cls.__name__).inc()
+            raise
+        # One flush serves every statement, so each is credited an equal share of it
+        query_seconds = (time.perf_counter() - start) / len(statements)
+        for cursor, statement, rows in zip(cursors, statements, results):
+            statement.result._parts[statement.part] = rows
+            if not statement.read_only:
+                replicas.note_write()
+            metrics.DB_QUERY_DURATION.labels(statement.table_cls.__name__).observe(query_seconds)
+            tracing.record_query(
+                statement.table_cls.__name__,
+                statement.sql_statement,
+                query_seconds * 1000,
+                len(rows) if cursor.description is not None else cursor.rowcount,
+                wait_ms if statement is statements[0] else 0.0,
+            )
+            cursor.close()
 
 
 ######################################################################################################################
@@ -122,11 +513,22 @@ def ColumnDetails(*args, primary_key: bool = False, **kwargs):
 class Table(BaseModel):
     
     @classmethod
-    def create_table(cls):
-        """Creates the table in the database based on the Pydantic model fields."""
-        table_name = cls.__table_name__
+    def _create_table_statements(cls) -> List[str]:
+        """
+        DDL for the table, every statement idempotent. Besides the model's fields, a Table can
+        declare:
+
+            __extensions__ = ["pg_trgm"]                             # CREATE EXTENSION IF NOT EXISTS
+            __generated_columns__ = {"column": "<type> GENERATED ALWAYS AS (...) STORED"}
+            __indexes__ = {"index_name": "USING GIN (column)"}       # CREATE INDEX ... ON <table> <definition>
+
+        Generated columns are not model fields: the database fills them in and sync() never
+        writes them. Partitioned tables also get an index on the partition column.
+        """
+        table_name = getattr(cls, "__tablename__", None) or getattr(cls, "__table_name__", None)
         if table_name is None:
-            raise ValueError("Cannot create table without a __table_name__ defined")
+            raise ValueError("Cannot create table without a __tablename__ defined")
+        partition_by = getattr(cls, "__partition_by__", None)
 
         columns = []
         primary_key = None
@@ -153,7 +555,9 @@ class Table(BaseModel):
             column_def = f'"{field_name}" {sql_type}'
             
             if field_info.json_schema_extra and field_info.json_schema_extra.get("primary_key", False):
-                column_def += " PRIMARY KEY"
+                # A partitioned table's primary key must include the partition column
+                if partition_by is None:
+                    column_def += " PRIMARY KEY"
                 primary_key = field_name
             
             columns.append(column_def)
@@ -161,22 +565,56 @@ class Table(BaseModel):
         if not primary_key:
             raise ValueError(f"Table {table_name} must have a primary key defined.")
 
+        if partition_by is not None:
+            columns.append(f'PRIMARY KEY ("{primary_key}", "{partition_by}")')
+
         columns_sql = ", ".join(columns)
         
         sql_statement = f"""
             CREATE TABLE IF NOT EXISTS {table_name} (
                 {columns_sql}
-            );
+            )
         """
+        if partition_by is not None:
+            sql_statement += f" PARTITION BY RANGE ({partition_by})"
+
+        statements = [f"CREATE EXTENSION IF NOT EXISTS {extension}" for extension in getattr(cls, "__extensions__", ())]
+        statements.append(sql_statement)
+        # Added separately so tables created before the column was declared get it too
+        for column, definition in getattr(cls, "__generated_columns__", {}).items():
+            statements.append(f'ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS "{column}" {definition}')
+        if partition_by is not None:
+            statements.append(
+                f"CREATE INDEX IF NOT EXISTS {table_name}_{partition_by}_idx ON {table_name} ({partition_by} DESC)"
+            )
+        for index_name, definition in getattr(cls, "__indexes__", {}).items():
+            statements.append(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} {definition}")
+        return statements
+
+    @classmethod
+    def create_table(cls):
+        """Creates the table in the database based on the Pydantic model fields."""
+        statements = cls._create_table_statements()
+        table_name = getattr(cls, "__tablename__", None) or getattr(cls, "__table_name__", None)
         
-        # Use a synchronous connection for DDL operations
-        pg_key = config.get_pg_key_for_table(cls.__name__)
+        # Use a synchronous connection for DDL operations; sharded tables exist on every shard
+        if sharding.is_sharded(cls):
+            pg_keys = sharding.shard_keys()
+        else:
+            pg_keys = [config.get_pg_key_for_table(cls.__name__)]
         pool = get_pool()
         
-        with pool[pg_key].getconn() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(sql_statement)
-            conn.commit()
+        for pg_key in pg_keys:
+            with pool[pg_key].connection() as conn:
+                for statement in statements:
+                    conn.execute(statement)
+                if getattr(cls, "__partition_by__", None) is not None:
+                    partitions.ensure_partitions(
+                        conn,
+                        table_name,
+                        partitions.month_start(datetime.now()),
+                        config.partition_premake_months(),
+                    )
         
         print(f"Table '{table_name}' created successfully.")
 
@@ -185,6 +623,40 @@ class Table(BaseModel):
     class Config:
         extra = "ignore"
 
+    @classmethod
+    def _get_pg_key(cls, params=None, shard: Optional[str] = None) -> str:
+        """
+        The database a statement runs on. Sharded tables (`__shard_key__`) are routed by an
+        explicit `shard`, or by the shard-key value in dict params.
+        """
+        shard_key = getattr(cls, "__shard_key__", None)
+        if shard_key is None or not sharding.shard_keys():
+            return config.get_pg_key_for_table(cls.__name__)
+        if shard is not None:
+            return shard
+        if isinstance(params, dict) and params.get(shard_key) is not None:
+            return sharding.shard_for(params[shard_key])
+        raise ValueError(
+            f"{cls.__name__} is sharded by {shard_key}: pass %({shard_key})s in params, "
+            f"or use sharding.scatter_gather for cross-shard statements"
+        )
+
+    @classmethod
+    def _get_conflict_target(cls, primary_key: str) -> str:
+        """
+        Upsert conflict target. Partitioned tables name their primary key constraint, which is
+        (primary key, partition column) once partitioned and the plain primary key before the
+        table is migrated, so the same statement works on both.
+        """
+        if getattr(cls, "__partition_by__", None) is None:
+            return f"({primary_key})"
+        return f"ON CONSTRAINT {cls._get_sql_table_name()}_pkey"
+
+    def _get_shard(self) -> Optional[str]:
+        if not sharding.is_sharded(self.__class__):
+            return None
+        return sharding.shard_for(getattr(self, self.__class__.__shard_key__))
+
     @classmethod
     def _get_sql_table_name(cls, schema_name=None) -> Optional[str]:
         tablename = cls.__tablename__
@@ -194,6 +666,67 @@ class Table(BaseModel):
             return tablename
         return f"{schema_name}.{tablename}"
 
+    @classmethod
+    @contextmanager
+    def transaction(cls, isolation_level: Optional[str] = None, read_only: bool = False):
+        """
+        Run a block as one transaction: every sql/sync/sync_many call inside it (on any
+        Table, in this thread or context) shares one connection per database and the block
+        commits once at the end, or rolls back if it raises.
+
+            with Table.transaction():
+                like = PostLike.sql("SELECT ... FOR UPDATE", params)
+                like.sync()
+
+        `isolation_level` is "read committed", "repeatable read" or "serializable" (default:
+        the server's). A nested block becomes a savepoint: if it raises, only its own
+        statements are rolled back and the outer block can carry on.
+        """
+        level = None
+        if isolation_level is not None:
+            if isolation_level.lower() not in ISOLATION_LEVELS:
+                raise ValueError(f"Unknown isolation level {isolation_level!r}, expected one of {list(ISOLATION_LEVELS)}")
+            level = ISOLATION_LEVELS[isolation_level.lower()]
+
+        current = _transaction.get()
+        if current is not None:
+            if level is not None and level != current.isolation_level:
+                raise ValueError("A nested transaction cannot change the isolation level")
+            if read_only and not current.read_only:
+                raise ValueError("A nested transaction cannot be read-only inside a read-write one")
+            with current.savepoint():
+                yield current
+            return
+
+        transaction = Transaction(level, read_only)
+        token = _transaction.set(transaction)
+        try:
+            yield transaction
+        except BaseException:
+            _transaction.reset(token)
+            transaction.finish(commit=False)
+            raise
+        _transaction.reset(token)
+        transaction.finish(commit=True)
+
+    @classmethod
+    @contextmanager
+    def pipeline(cls, max_retries: int = DEFAULT_MAX_RETRIES):
+        """
+        Queue independent statements and send them together when the block ends, one
+        network flush per database instead of one round trip per statement:
+
+            with Table.pipeline() as pipe:
+                page = pipe.sql(Review, "SELECT ...", params)
+                total = pipe.sql(Review, "SELECT COUNT(*) ...", params)
+            reviews, count = page.rows, total.rows[0]["total"]
+
+        Nothing is sent if the block raises.
+        """
+        pipe = Pipeline(max_retries)
+        yield pipe
+        pipe.execute()
+
     @classmethod
     def sql(
         cls,
@@ -201,79 +734,252 @@ class Table(BaseModel):
         params: Optional[Dict[str, Any]] = None,
         schema_name: str = "public",
         max_retries: int = 3,
+        read_only: Optional[bool] = None,
+        shard: Optional[str] = None,
     ):
-        pg_key = config.get_pg_key_for_table(cls.__name__)
+        """
+        Run a statement and return its rows (or [] for statements without a result).
+
+        Read-only statements (detected from the SQL unless `read_only` is given) go to a
+        read replica when one is configured, healthy, and the current session has not
+        just written; everything else goes to the primary.
+
+        Statements on sharded tables run on the shard of the shard-key value found in
+        `params`, or on `shard` when given (see solar.sharding).
+
+        Inside a `Table.transaction()` block the statement runs on the block's connection.
+        """
+        pg_key = cls._get_pg_key(params, shard)
+        if read_only is None:
+            read_only = replicas.is_read_only_statement(sql_statement)
+
+        transaction = _transaction.get()
+        if transaction is not None:
+            # Inside Table.transaction: the pinned primary connection, no retries (the
+            # transaction is aborted by a failed statement; callers may retry the whole block
+            # when resilience.is_transient says so) and no replicas
+            conn, wait_ms = transaction.connection(pg_key)
+            try:
+                return cls._execute(conn, sql_statement, params, schema_name, read_only, wait_ms)
+            except PsycopgError as e:
+                metrics.DB_QUERY_ERRORS.labels(cls.__name__).inc()
+                if resilience.is_outage(e):
+                    resilience.breaker_for(pg_key).record_failure(e)
+                raise
+
         pool = get_pool()
-        retry_count = 0
+        use_replica = read_only and bool(get_replica_pools().get(pg_key)) and not replicas.pinned_to_primary(pg_key)
+        breaker = resilience.breaker_for(pg_key)
+        attempt = 0
 
-        while retry_count < max_retries:
+        while True:
+            attempt += 1
             current_pool = None
             conn = None
+            sent = False
+            replica = replicas.choose_replica(pg_key) if use_replica else None
 
             try:
-                if pg_key in pool:
-                    current_pool = pool[pg_key]
-                    conn = current_pool.getconn()
+                if replica is not None:
+                    current_pool = replica.pool
                 else:
-                    pool = get_pool(reset=True)
+                    breaker.before_call()
+                    if pg_key not in pool:
+                        pool = get_pool(reset=True)
                     current_pool = pool[pg_key]
-                    conn = current_pool.getconn()
-
-                with conn:
-                    with conn.cursor() as cursor:
-                        try:
-                            if schema_name != "public" and schema_name != "auth":
-                                cursor.execute(f"SET search_path TO {schema_name}")
-                            cursor.execute(sql_statement, params)
-                            if cursor.description is not None:
-                                return cursor.fetchall()
-                            else:
-                                return []
-                        finally:
-                            if schema_name != "public" and schema_name != "auth":
-                                cursor.execute("SET search_path TO public, auth")
-                return  # Success, exit the retry loop
+                wait_start = time.perf_counter()
+                conn = current_pool.getconn()
+                wait_ms = (time.perf_counter() - wait_start) * 1000
+                metrics.DB_POOL_WAIT.labels(replica.label if replica is not None else pg_key).observe(wait_ms / 1000)
 
-            except PsycopgError as e:
-                retry_count += 1
-                logger.warning(
-                    f"Database operation failed (attempt {retry_count}/{max_retries}): {str(e)}"
-                )
+                sent = True
+                results = cls._execute(conn, sql_statement, params, schema_name, read_only, wait_ms)
+                conn.commit()
+                if replica is None:
+                    breaker.record_success()
+                return results
+
+            except resilience.CircuitOpenError:
+                raise
 
+            except Exception as e:
+                if replica is None:
+                    breaker.record_failure(e)
+                if not isinstance(e, PsycopgError):
+                    raise
+                metrics.DB_QUERY_ERRORS.labels(cls.__name__).inc()
                 if conn is not None:
                     try:
-                        if current_pool is not None:
-                            current_pool.putconn(conn)
-                        else:
-                            conn.close()
-                    except Exception:
-                        try:
-                            conn.close()
-                        except Exception:
-                            pass
-
-                if retry_count < max_retries:
-                    # Refresh the pool before retrying
-                    pool = get_pool(reset=True)
+                        conn.rollback()
+                    except PsycopgError:
+                        pass  # Connection is gone; the pool discards it
+
+                if replica is not None and (resilience.is_transient(e) or resilience.is_outage(e) or e.sqlstate == "25006"):
+                    # Retry on the primary right away; a failing replica is skipped until its next
+                    # lag check (25006 is a write misrouted to the replica, not the replica's fault)
+                    if e.sqlstate != "25006":
+                        replicas.mark_replica_failed(replica, e)
+                    use_replica = False
                     continue
-                else:
-                    logger.error(
-                        f"Database operation failed after {max_retries} attempts"
-                    )
+                if not resilience.may_retry(e, read_only, sent):
+                    # Permanent, or a write that may have committed before the connection dropped
+                    raise
+                if attempt >= max_retries:
+                    logger.error(f"Database operation failed after {max_retries} attempts: {str(e)}")
                     raise
+                delay = resilience.backoff_seconds(attempt)
+                metrics.DB_QUERY_RETRIES.labels(cls.__name__).inc()
+                logger.warning(
+                    f"Transient database error on {pg_key} (attempt {attempt}/{max_retries}), "
+                    f"retrying in {delay * 1000:.0f}ms: {str(e)}"
+                )
+                time.sleep(delay)
 
             finally:
                 if conn is not None:
-                    try:
-                        if current_pool is not None:
-                            current_pool.putconn(conn)
-                        else:
-                            conn.close()
-                    except Exception:
-                        try:
-                            conn.close()
-                        except Exception:
-                            pass
+                    current_pool.putconn(conn)
+
+    @classmethod
+    def stream(
+        cls,
+        sql_statement: str,
+        params: Optional[Dict[str, Any]] = None,
+        batch_size: int = DEFAULT_STREAM_BATCH_SIZE,
+        as_model: bool = False,
+        batches: bool = False,
+        shard: Optional[str] = None,
+    ) -> Iterator:
+        """
+        Iterate over the rows of a query without loading them all: a named (server-side)
+        cursor fetches `batch_size` rows at a time, so memory stays flat however many rows
+        the query returns. Yields dicts, or model instances with `as_model`; with `batches`
+        it yields each fetched chunk as a list instead.
+
+            for post in TravelPost.stream("SELECT * FROM travel_posts", as_model=True):
+                ...
+
+        The connection is held until the generator is exhausted or closed (break out of the
+        loop, or `close()` it), so consume streams promptly. Read-only streams may run on a
+        replica. A sharded table without a shard key in `params` (or `shard`) is streamed
+        shard after shard. Inside Table.transaction the block's connection is used.
+        """
+        shard_key = getattr(cls, "__shard_key__", None)
+        if (
+            shard is None
+            and sharding.is_sharded(cls)
+            and not (isinstance(params, dict) and params.get(shard_key) is not None)
+        ):
+            for shard_pg_key in sharding.shard_keys():
+                yield from cls.stream(sql_statement, params, batch_size, as_model, batches, shard=shard_pg_key)
+            return
+
+        pg_key = cls._get_pg_key(params, shard)
+        read_only = replicas.is_read_only_statement(sql_statement)
+
+        transaction = _transaction.get()
+        if transaction is not None:
+            conn, _ = transaction.connection(pg_key)
+            yield from cls._fetch_batches(conn, sql_statement, params, batch_size, as_model, batches)
+            return
+
+        use_replica = read_only and bool(get_replica_pools().get(pg_key)) and not replicas.pinned_to_primary(pg_key)
+        replica = replicas.choose_replica(pg_key) if use_replica else None
+        if replica is not None:
+            pool = replica.pool
+        else:
+            resilience.breaker_for(pg_key).before_call()
+            pool = get_pool()[pg_key]
+        wait_start = time.perf_counter()
+        try:
+            conn = pool.getconn()
+        except Exception as e:
+            if replica is None:
+                resilience.breaker_for(pg_key).record_failure(e)
+            raise
+        metrics.DB_POOL_WAIT.labels(replica.label if replica is not None else pg_key).observe(
+            time.perf_counter() - wait_start
+        )
+        if replica is None:
+            # Hands back the half-open trial slot, if this stream took it
+            resilience.breaker_for(pg_key).record_success()
+        try:
+            yield from cls._fetch_batches(conn, sql_statement, params, batch_size, as_model, batches)
+            conn.commit()
+        except BaseException as e:
+            # Includes GeneratorExit when the caller stops early
+            if replica is None and isinstance(e, psycopg.OperationalError):
+                resilience.breaker_for(pg_key).record_failure(e)
+            try:
+                conn.rollback()
+            except PsycopgError:
+                pass
+            raise
+        finally:
+            pool.putconn(conn)
+        if not read_only:
+            replicas.note_write()
+
+    @classmethod
+    def _fetch_batches(cls, conn: Connection, sql_statement: str, params, batch_size: int, as_model: bool, batches: bool):
+        fetch_seconds = 0.0
+        row_count = 0
+        with conn.cursor(name=f"solar_stream_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = batch_size
+            fetch_start = time.perf_counter()
+            cursor.execute(sql_statement, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                fetch_seconds += time.perf_counter() - fetch_start
+                if not rows:
+                    break
+                row_count += len(rows)
+                if as_model:
+                    rows = [cls(**row) for row in rows]
+                if batches:
+                    yield rows
+                else:
+                    yield from rows
+                fetch_start = time.perf_counter()
+        # Time spent in the database only, not in the caller's loop body
+        tracing.record_query(cls.__name__, sql_statement, fetch_seconds * 1000, row_count, 0.0)
+
+    @classmethod
+    def _execute(
+        cls,
+        conn: Connection,
+        sql_statement: str,
+        params,
+        schema_name: str,
+        read_only: bool,
+        wait_ms: float,
+    ):
+        with conn.cursor() as cursor:
+            try:
+                if schema_name != "public" and schema_name != "auth":
+                    cursor.execute(f"SET search_path TO {schema_name}")
+                query_start = time.perf_counter()
+                cursor.execute(sql_statement, params)
+                if cursor.description is not None:
+                    results = cursor.fetchall()
+                    row_count = len(results)
+                else:
+                    results = []
+                    row_count = cursor.rowcount
+                query_seconds = time.perf_counter() - query_start
+                if not read_only:
+                    replicas.note_write()
+                metrics.DB_QUERY_DURATION.labels(cls.__name__).observe(query_seconds)
+                tracing.record_query(
+                    cls.__name__,
+                    sql_statement,
+                    query_seconds * 1000,
+                    row_count,
+                    wait_ms,
+                )
+                return results
+            finally:
+                if schema_name != "public" and schema_name != "auth":
+                    cursor.execute("SET search_path TO public, auth")
 
     def _prepare_value(self, value):
         """Helper to recursively prepare values for database insertion"""
@@ -320,10 +1026,10 @@ class Table(BaseModel):
         sql_statement = f"""
             INSERT INTO {table_name} ({columns_str})
             VALUES ({placeholders})
-            ON CONFLICT ({primary_key}) DO UPDATE
+            ON CONFLICT {self.__class__._get_conflict_target(primary_key)} DO UPDATE
             SET {set_clause}
         """
-        self.__class__.sql(sql_statement, values)
+        self.__class__.sql(sql_statement, values, shard=self._get_shard())
 
     @classmethod
     def sync_many(cls, objects, batch_size=1000):
@@ -363,7 +1069,18 @@ class Table(BaseModel):
         if not primary_key:
             raise ValueError("Cannot sync without a primary key defined")
 
+        # Sharded tables are batched per shard
+        objects_by_shard = {}
+        for obj in objects:
+            shard = obj._get_shard() if isinstance(obj, cls) else None
+            objects_by_shard.setdefault(shard, []).append(obj)
+
         # Process in batches
+        for shard, shard_objects in objects_by_shard.items():
+            cls._sync_batches(shard_objects, batch_size, table_name, primary_key, shard)
+
+    @classmethod
+    def _sync_batches(cls, objects, batch_size, table_name, primary_key, shard):
         for i in range(0, len(objects), batch_size):
             upper_idx = min(i + batch_size, len(objects))
             batch = objects[i:upper_idx]
@@ -395,8 +1112,8 @@ class Table(BaseModel):
             sql_statement = f"""
                 INSERT INTO {table_name} ({columns_str})
                 VALUES {values_placeholders}
-                ON CONFLICT ({primary_key}) DO UPDATE
+                ON CONFLICT {cls._get_conflict_target(primary_key)} DO UPDATE
                 SET {set_clause}
             """
 
-            cls.sql(sql_statement, all_values)
+            cls.sql(sql_statement, all_values, shard=shard)
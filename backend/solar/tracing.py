@@ -0,0 +1,118 @@
+"""
+Per-request SQL tracing.
+
+A QueryTrace is installed in a context variable for the duration of a request; Table.sql
+records every statement it runs into whichever trace is current (if any). Statements are
+grouped by fingerprint (literals, placeholders and value lists collapsed) so a loop issuing
+the same query once per row shows up as a single fingerprint with a high count.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional
+import re
+import threading
+
+_FINGERPRINT_RULES = [
+    (re.compile(r"--[^\n]*"), " "),
+    (re.compile(r"/\*.*?\*/", re.S), " "),
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"%\(\w+\)s|%s|\$\d+"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    # IN (?, ?, ?) / VALUES (?, ?), (?, ?) of any length collapse to one shape
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*"), "(...)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql_statement: str) -> str:
+    """Normalize a statement so executions differing only in their values compare equal."""
+    normalized = sql_statement
+    for pattern, replacement in _FINGERPRINT_RULES:
+        normalized = pattern.sub(replacement, normalized)
+    return normalized.strip()
+
+
+class QueryTrace:
+    """Statements executed during one request, aggregated per fingerprint."""
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id
+        self.query_count = 0
+        self.total_ms = 0.0
+        self.wait_ms = 0.0
+        self.rows = 0
+        self._by_fingerprint: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, table: str, sql_statement: str, duration_ms: float, rows: int, wait_ms: float):
+        key = fingerprint(sql_statement)
+        with self._lock:
+            self.query_count += 1
+            self.total_ms += duration_ms
+            self.wait_ms += wait_ms
+            self.rows += max(rows, 0)
+            stats = self._by_fingerprint.get(key)
+            if stats is None:
+                stats = self._by_fingerprint[key] = {
+                    "fingerprint": key,
+                    "table": table,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "wait_ms": 0.0,
+                    "rows": 0,
+                }
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["wait_ms"] += wait_ms
+            stats["rows"] += max(rows, 0)
+
+    def fingerprints(self) -> List[Dict]:
+        """Per-fingerprint stats, most expensive first."""
+        with self._lock:
+            stats = [dict(s) for s in self._by_fingerprint.values()]
+        return sorted(stats, key=lambda s: s["total_ms"], reverse=True)
+
+    def repeated(self, threshold: int) -> List[Dict]:
+        """Fingerprints executed more than `threshold` times, the usual sign of an N+1 loop."""
+        return [s for s in self.fingerprints() if s["count"] > threshold]
+
+    def summary(self) -> Dict:
+        return {
+            "db_queries": self.query_count,
+            "db_time_ms": round(self.total_ms, 2),
+            "db_wait_ms": round(self.wait_ms, 2),
+            "db_rows": self.rows,
+        }
+
+
+_current_trace: ContextVar[Optional[QueryTrace]] = ContextVar("solar_query_trace", default=None)
+
+
+def current_trace() -> Optional[QueryTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_queries(request_id: Optional[str] = None) -> Iterator[QueryTrace]:
+    """
+    Collect the statements run in this context. Worker threads only see the trace if the
+    context is propagated to them (asyncio.to_thread does, bare run_in_executor does not).
+    """
+    trace = QueryTrace(request_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def record_query(table: str, sql_statement: str, duration_ms: float, rows: int, wait_ms: float = 0.0):
+    """Add a statement to the current trace; a no-op outside a traced context."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(table, sql_statement, duration_ms, rows, wait_ms)
@@ -0,0 +1,60 @@
+"""Feed and saved-post pages fetch their authors and posts in one query, whatever the page size."""
+
+import uuid
+
+import pytest
+
+from core import social_services
+from solar import table
+
+
+def _user(user_id):
+    return {"id": user_id, "username": f"user-{user_id.hex[:6]}", "email": "traveler@example.com", "display_name": "Traveler"}
+
+
+def _post(post_id, user_id):
+    return {
+        "id": post_id, "user_id": user_id, "caption": "Sunset", "images": [], "location_name": "Kyoto",
+        "country": "Japan", "post_type": "experience", "category": "adventure", "tags": ["sunset", "hiking"],
+    }
+
+
+@pytest.fixture
+def database(monkeypatch):
+    authors = [uuid.uuid4() for _ in range(3)]
+    posts = [_post(uuid.uuid4(), authors[number % 3]) for number in range(10)]
+    statements = []
+
+    def sql(cls, statement, params=None, **kwargs):
+        statements.append(statement)
+        if statement.startswith("SELECT following_id"):
+            return [{"following_id": author} for author in authors]
+        if statement.startswith("SELECT * FROM travel_posts WHERE user_id = ANY"):
+            return [dict(post) for post in posts if post["user_id"] in params["following_ids"]]
+        if statement.startswith("SELECT * FROM travel_posts WHERE id = ANY"):
+            return [dict(post) for post in posts if post["id"] in params["post_ids"]]
+        if statement.startswith("SELECT * FROM travel_users WHERE id = ANY"):
+            return [_user(author) for author in authors if author in params["user_ids"]]
+        if statement.startswith("SELECT * FROM saved_posts"):
+            return [{"id": uuid.uuid4(), "user_id": params["user_id"], "post_id": post["id"]} for post in posts]
+        return []
+
+    monkeypatch.setattr(table.Table, "sql", classmethod(sql))
+    monkeypatch.setattr(social_services, "scatter_gather", lambda *args, **kwargs: [])
+    return statements
+
+
+def test_social_feed_fetches_the_page_authors_at_once(database):
+    feed = social_services.get_social_feed(uuid.uuid4())
+
+    assert len(feed) == 10
+    assert all(entry["author"]["id"] == entry["post"]["user_id"] for entry in feed)
+    assert sum("FROM travel_users" in statement for statement in database) == 1
+
+
+def test_saved_posts_fetches_the_posts_at_once(database):
+    saves = social_services.get_user_saved_posts(uuid.uuid4())
+
+    assert len(saves) == 10
+    assert all(entry["post"]["id"] == entry["saved_post"]["post_id"] for entry in saves)
+    assert sum("FROM travel_posts" in statement for statement in database) == 1
@@ -0,0 +1,94 @@
+"""Geohash cell covers of solar.geo, and the keyset page cursors of core.social_services."""
+
+import math
+import random
+import uuid
+
+import pytest
+
+from core import social_services
+from solar import geo
+
+
+def _destination(lat, lng, bearing, distance_km):
+    """The point `distance_km` from (lat, lng) along `bearing` (radians), on the sphere."""
+    angle = distance_km / geo.EARTH_RADIUS_KM
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2 = math.asin(math.sin(lat1) * math.cos(angle) + math.cos(lat1) * math.sin(angle) * math.cos(bearing))
+    lng2 = lng1 + math.atan2(
+        math.sin(bearing) * math.sin(angle) * math.cos(lat1), math.cos(angle) - math.sin(lat1) * math.sin(lat2)
+    )
+    return math.degrees(lat2), (math.degrees(lng2) + 180.0) % 360.0 - 180.0
+
+
+def _assert_covered(lat, lng, radius_km, cells, rng, samples=300):
+    for _ in range(samples):
+        # Mostly points on or near the circle, where a too-small cover fails first
+        distance = radius_km * (1 - rng.random() ** 4)
+        point = _destination(lat, lng, rng.uniform(0, 2 * math.pi), distance)
+        assert geo.haversine_km(lat, lng, *point) <= radius_km + 1e-6
+        assert geo.encode(*point).startswith(tuple(cells)), (lat, lng, radius_km, point)
+
+
+def test_bounding_box_wraps_across_the_antimeridian():
+    south, north, (west, east) = geo.bounding_box(0.0, 179.9, 50)
+
+    assert south < 0 < north
+    assert west > east
+    assert west < 179.9 and east > -180.0
+
+    cells = geo.covering_cells(0.0, 179.9, 50)
+    assert any(cell.startswith(("x", "z", "r")) for cell in cells)
+    assert any(cell.startswith(("8", "b", "2")) for cell in cells)
+    _assert_covered(0.0, 179.9, 50, cells, random.Random(1))
+
+
+@pytest.mark.parametrize("lat", [89.9, -89.9, 90.0, -90.0])
+def test_bounding_box_spans_every_longitude_at_the_poles(lat):
+    south, north, longitudes = geo.bounding_box(lat, 12.0, 30)
+
+    assert longitudes is None
+    assert -90.0 <= south <= north <= 90.0
+    _assert_covered(lat, 12.0, 30, geo.covering_cells(lat, 12.0, 30), random.Random(2))
+
+
+@pytest.mark.parametrize("max_cells", [1, 4, 16, 64])
+def test_covering_cells_stays_within_max_cells(max_cells):
+    rng = random.Random(max_cells)
+    for _ in range(50):
+        lat, lng, radius_km = rng.uniform(-90, 90), rng.uniform(-180, 180), rng.uniform(0.1, 500)
+        cells = geo.covering_cells(lat, lng, radius_km, max_cells=max_cells)
+        assert 1 <= len(cells) <= max_cells
+        # With a larger budget, the cells only get finer
+        if max_cells > 1:
+            coarser = geo.covering_cells(lat, lng, radius_km, max_cells=max_cells // 4 or 1)
+            assert all(any(cell.startswith(prefix) for prefix in coarser) for cell in cells)
+
+
+def test_every_point_within_the_radius_has_a_covering_prefix():
+    rng = random.Random(42)
+    for _ in range(200):
+        lat = rng.choice([rng.uniform(-90, 90), rng.uniform(80, 90), rng.uniform(-90, -80)])
+        lng = rng.choice([rng.uniform(-180, 180), rng.uniform(175, 180), rng.uniform(-180, -175)])
+        radius_km = rng.choice([rng.uniform(0.01, 1), rng.uniform(1, 50), rng.uniform(50, 2000)])
+        _assert_covered(lat, lng, radius_km, geo.covering_cells(lat, lng, radius_km), rng, samples=100)
+
+
+@pytest.mark.parametrize("sort_value", [0.0, 0.0607927, -3.5, 1e-12, 12345.678])
+def test_page_cursor_round_trip(sort_value):
+    post_id = uuid.uuid4()
+
+    cursor = social_services._encode_page_cursor(sort_value, post_id)
+
+    assert "=" not in cursor
+    assert social_services._decode_page_cursor(cursor) == {"value": sort_value, "id": post_id}
+
+
+@pytest.mark.parametrize("cursor", [
+    "", "not base64!", "bm90IGpzb24", "e30",  # "not json", "{}"
+    social_services._encode_page_cursor(1.0, uuid.uuid4())[:-6],
+    "eyJ2YWx1ZSI6ICJ4IiwgImlkIjogIjEifQ",  # {"value": "x", "id": "1"}
+])
+def test_invalid_page_cursor_is_a_value_error(cursor):
+    with pytest.raises(ValueError, match="Invalid page cursor"):
+        social_services._decode_page_cursor(cursor)
@@ -0,0 +1,60 @@
+"""Background rendition scheduling and the remembered manifest misses of solar.renditions."""
+
+import asyncio
+import json
+import os
+
+from solar import renditions
+
+
+def test_uploads_schedule_one_generation_per_url_and_shutdown_drains_them(monkeypatch):
+    started, finished = [], []
+
+    async def generate(url):
+        started.append(url)
+        await asyncio.sleep(0.01 if url == "/media/fast.jpg" else 60)
+        finished.append(url)
+
+    monkeypatch.setattr(renditions, "generate_renditions", generate)
+    monkeypatch.setattr(renditions, "_pending", {})
+
+    async def upload_then_shut_down():
+        for url in ("/media/fast.jpg", "/media/fast.jpg", "/media/huge.jpg"):
+            renditions.schedule_renditions(url)
+        await asyncio.sleep(0)
+        assert started == ["/media/fast.jpg", "/media/huge.jpg"]
+        await renditions.drain_pending(timeout=0.1)
+        await asyncio.sleep(0)
+
+    asyncio.run(upload_then_shut_down())
+
+    # The slow one was cancelled rather than holding up shutdown
+    assert finished == ["/media/fast.jpg"]
+    assert renditions._pending == {}
+
+
+def test_a_manifest_written_by_another_worker_replaces_a_remembered_miss(monkeypatch, tmp_path):
+    now = [1000.0]
+    monkeypatch.setattr(renditions.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(renditions.media, "MEDIA_DIR", str(tmp_path))
+    monkeypatch.setattr(renditions, "_manifest_cache", renditions.LRUCache(maxsize=10))
+    monkeypatch.setattr(renditions, "_manifest_dir_checked", (float("-inf"), None))
+    url = "/media/photo.jpg"
+    manifest_dir = tmp_path / renditions.MANIFEST_DIR_NAME
+    manifest_dir.mkdir()
+
+    lookups = []
+    exists = os.path.exists
+    monkeypatch.setattr(renditions.os.path, "exists", lambda path: lookups.append(path) or exists(path))
+
+    assert renditions.get_renditions(url) is None
+    # Misses are remembered while the directory is unchanged
+    now[0] += 5
+    assert renditions.get_renditions(url) is None
+    assert len(lookups) == 1
+
+    (manifest_dir / "photo.jpg.json").write_text(json.dumps({"renditions": []}))
+    os.utime(manifest_dir, ns=(0, 1))  # Another worker's write, whatever the mtime granularity
+    now[0] += renditions.MANIFEST_DIR_CHECK_SECONDS
+
+    assert renditions.get_renditions(url) == {"renditions": []}
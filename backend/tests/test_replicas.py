@@ -0,0 +1,152 @@
+"""Read-your-writes pinning of solar.replicas, against a fake solar_recent_writers table."""
+
+from contextlib import contextmanager
+
+import pytest
+
+from solar import replicas, resilience
+
+
+class FakeRecentWriters:
+    def __init__(self, now):
+        self.now = now
+        self.rows = {}  # session key -> primary_until
+        self.loads = 0
+
+    def execute(self, statement, params=None):
+        if statement.lstrip().startswith("INSERT"):
+            self.rows[params["key"]] = self.now[0] + params["seconds"]
+            return self
+        self.loads += 1
+        self._result = [
+            {"session_key": key, "remaining": until - self.now[0]}
+            for key, until in self.rows.items() if until > self.now[0]
+        ]
+        return self
+
+    def fetchall(self):
+        return self._result
+
+
+@pytest.fixture
+def recent_writers(monkeypatch):
+    now = [1000.0]
+    table = FakeRecentWriters(now)
+
+    @contextmanager
+    def primary_connection(pg_key):
+        yield table
+
+    monkeypatch.setattr(replicas.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(replicas, "_primary_connection", primary_connection)
+    monkeypatch.setattr(replicas, "_replicas", {"PRIMARY": []})
+    monkeypatch.setattr(replicas, "_recent_writers", {})
+    monkeypatch.setattr(replicas, "_recent_writers_loaded_at", {})
+    monkeypatch.setattr(resilience, "_breakers", {})
+    return table
+
+
+def _pinned(key):
+    with replicas.session(key):
+        return replicas.pinned_to_primary("PRIMARY")
+
+
+def test_sessions_share_one_lookup_per_refresh_interval(recent_writers):
+    for user in range(50):
+        assert not _pinned(f"user-{user}")
+    assert recent_writers.loads == 1
+
+    recent_writers.now[0] += 1
+    assert not _pinned("user-0")
+    assert recent_writers.loads == 2
+
+
+def test_a_write_pins_the_writer_on_this_process_right_away(recent_writers):
+    assert not _pinned("user-1")
+    with replicas.session("user-1"):
+        replicas.note_write()
+
+    assert _pinned("user-1")
+    assert not _pinned("user-2")
+    assert recent_writers.loads == 1
+
+    # Until PG_READ_YOUR_WRITES_SECONDS have passed
+    recent_writers.now[0] += 11
+    assert not _pinned("user-1")
+
+
+def test_a_write_on_another_process_is_seen_at_the_next_refresh(recent_writers):
+    assert not _pinned("user-1")
+    recent_writers.rows["user-1"] = recent_writers.now[0] + 10  # Recorded by another worker
+
+    assert not _pinned("user-1")
+    recent_writers.now[0] += 1
+    assert _pinned("user-1")
+
+
+class FakeReplicaPool:
+    def __init__(self, lag):
+        self.lag = lag
+        self.statements = []
+
+    @contextmanager
+    def connection(self, timeout=None):
+        yield self
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        return self
+
+    def fetchone(self):
+        return {"lag": self.lag}
+
+
+def test_replica_lag_check(monkeypatch):
+    caught_up, behind, unknown = FakeReplicaPool(0), FakeReplicaPool(120.0), FakeReplicaPool(None)
+    monkeypatch.setattr(replicas, "_replicas", {
+        "PRIMARY": [replicas.ReplicaState("PRIMARY", index, pool) for index, pool in enumerate((caught_up, behind, unknown))]
+    })
+
+    replicas.check_replicas()
+
+    # NULL: nothing replayed since the WAL receiver stopped streaming, so the lag is unknown
+    assert [replica.lag for replica in replicas._replicas["PRIMARY"]] == [0.0, 120.0, None]
+    assert [replica.usable for replica in replicas._replicas["PRIMARY"]] == [True, False, False]
+    assert replicas.choose_replica("PRIMARY").pool is caught_up
+
+
+@pytest.mark.parametrize("statement", [
+    "SELECT * FROM travel_posts WHERE id = %(post_id)s",
+    "  select count(*) from post_likes",
+    "(SELECT 1) UNION (SELECT 2)",
+    "WITH recent AS (SELECT * FROM travel_posts) SELECT * FROM recent",
+    "VALUES (1), (2)",
+    "TABLE travel_posts",
+    "SHOW server_version",
+    # Keywords inside literals, quoted identifiers and comments don't make a read a write
+    "SELECT * FROM travel_posts WHERE caption = 'UPDATE your plans' -- DELETE later",
+    'SELECT "into" FROM travel_posts /* FOR UPDATE */',
+    "SELECT updated_at, inserted FROM travel_posts",
+])
+def test_reads_go_to_replicas(statement):
+    assert replicas.is_read_only_statement(statement)
+
+
+@pytest.mark.parametrize("statement", [
+    "UPDATE travel_posts SET likes_count = likes_count + 1",
+    "INSERT INTO post_likes (id) VALUES (%(id)s)",
+    "DELETE FROM saved_posts",
+    "WITH moved AS (DELETE FROM saved_posts RETURNING *) SELECT * FROM moved",
+    "SELECT * INTO archive FROM travel_posts",
+    "SELECT * FROM post_likes WHERE id = %(id)s FOR UPDATE",
+    "SELECT * FROM post_likes FOR NO KEY UPDATE",
+    "SELECT * FROM post_likes FOR SHARE",
+    "SELECT * FROM post_likes FOR KEY SHARE",
+    "SELECT nextval('posts_id_seq')",
+    "SELECT pg_advisory_xact_lock(hashtext(%(lock_key)s))",
+    "CREATE TABLE t (id INT)",
+    "SET search_path TO public",
+    "EXPLAIN ANALYZE UPDATE travel_posts SET likes_count = 0",
+])
+def test_writes_and_locks_stay_on_the_primary(statement):
+    assert not replicas.is_read_only_statement(statement)
@@ -0,0 +1,201 @@
+"""Error classification, circuit breaker transitions and write-retry safety of Table.sql and pipelines."""
+
+import psycopg
+import pytest
+from psycopg import errors
+from psycopg_pool import PoolTimeout
+
+from core.travel_post import TravelPost
+from solar import metrics, resilience, table
+
+
+def test_error_classification():
+    dropped = psycopg.OperationalError("server closed the connection unexpectedly")
+    assert resilience.is_transient(dropped) and resilience.is_outage(dropped)
+
+    shutdown = errors.AdminShutdown()
+    assert resilience.is_transient(shutdown) and resilience.is_outage(shutdown)
+
+    for rolled_back in (errors.SerializationFailure(), errors.DeadlockDetected()):
+        assert resilience.is_transient(rolled_back) and not resilience.is_outage(rolled_back)
+
+    # A pool timeout has already waited: an outage, but not worth retrying
+    timeout = PoolTimeout("couldn't get a connection")
+    assert resilience.is_outage(timeout) and not resilience.is_transient(timeout)
+
+    for permanent in (errors.UniqueViolation(), errors.SyntaxError(), ValueError("bad")):
+        assert not resilience.is_transient(permanent) and not resilience.is_outage(permanent)
+
+    circuit_open = resilience.CircuitOpenError("SHARD_0", 5)
+    assert not resilience.is_transient(circuit_open) and not resilience.is_outage(circuit_open)
+
+
+def test_writes_are_only_retried_when_nothing_can_have_committed():
+    dropped = psycopg.OperationalError("server closed the connection unexpectedly")
+    assert resilience.may_retry(dropped, read_only=True, sent=True)
+    assert resilience.may_retry(dropped, read_only=False, sent=False)
+    assert not resilience.may_retry(dropped, read_only=False, sent=True)
+    assert resilience.may_retry(errors.SerializationFailure(), read_only=False, sent=True)
+    assert resilience.may_retry(errors.DeadlockDetected(), read_only=False, sent=True)
+    assert not resilience.may_retry(errors.UniqueViolation(), read_only=False, sent=False)
+
+
+def test_circuit_breaker_opens_probes_and_closes(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = resilience.CircuitBreaker("TEST_BREAKER", failure_threshold=2, reset_seconds=10)
+    outage = psycopg.OperationalError("connection refused")
+
+    breaker.before_call()
+    breaker.record_failure(outage)
+    assert breaker.state == resilience.CLOSED
+    # Errors that aren't outages don't count towards opening it
+    breaker.record_failure(errors.UniqueViolation())
+    breaker.record_failure(outage)
+    assert breaker.state == resilience.CLOSED
+    breaker.record_failure(outage)
+    assert breaker.state == resilience.OPEN
+    with pytest.raises(resilience.CircuitOpenError):
+        breaker.before_call()
+
+    # After the reset delay one trial statement goes through; the others keep failing fast
+    now[0] += 10
+    breaker.before_call()
+    assert breaker.state == resilience.HALF_OPEN
+    with pytest.raises(resilience.CircuitOpenError):
+        breaker.before_call()
+
+    # A failed trial re-opens it, a successful one closes it
+    breaker.record_failure(outage)
+    assert breaker.state == resilience.OPEN
+    now[0] += 10
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == resilience.CLOSED
+    breaker.before_call()
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.rowcount = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, params=None):
+        self.conn.pool.executed.append(statement)
+        if self.conn.pool.execute_errors:
+            raise self.conn.pool.execute_errors.pop(0)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        if self.pool.commit_errors:
+            raise self.pool.commit_errors.pop(0)
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    def __init__(self, execute_errors=(), commit_errors=()):
+        self.execute_errors = list(execute_errors)
+        self.commit_errors = list(commit_errors)
+        self.executed = []
+
+    def getconn(self):
+        return FakeConnection(self)
+
+    def putconn(self, conn):
+        pass
+
+
+class FakePools(dict):
+    """Every database name maps to the same fake pool."""
+
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+
+    def __contains__(self, pg_key):
+        return True
+
+    def __getitem__(self, pg_key):
+        return self.pool
+
+
+@pytest.fixture
+def install(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "backoff_seconds", lambda attempt: 0)
+    monkeypatch.setattr(table, "get_replica_pools", lambda: {})
+    monkeypatch.setattr(table.psycopg.Pipeline, "is_supported", staticmethod(lambda: False))
+
+    def install(pool):
+        monkeypatch.setattr(table, "get_pool", lambda reset=False: FakePools(pool))
+        return pool
+
+    return install
+
+
+def _retries(table_name):
+    return metrics.DB_QUERY_RETRIES.labels(table_name)._value.get()
+
+
+def test_write_is_not_retried_when_the_connection_drops_during_commit(install):
+    pool = install(FakePool(commit_errors=[psycopg.OperationalError("server closed the connection unexpectedly")]))
+
+    with pytest.raises(psycopg.OperationalError):
+        TravelPost.sql("UPDATE travel_posts SET likes_count = likes_count + 1 WHERE id = %(post_id)s", {"post_id": 1})
+
+    assert len(pool.executed) == 1
+
+
+def test_read_is_retried_when_the_connection_drops(install):
+    pool = install(FakePool(execute_errors=[psycopg.OperationalError("server closed the connection unexpectedly")]))
+
+    TravelPost.sql("SELECT * FROM travel_posts WHERE id = %(post_id)s", {"post_id": 1})
+
+    assert len(pool.executed) == 2
+
+
+def test_write_is_retried_after_a_serialization_failure(install):
+    pool = install(FakePool(execute_errors=[errors.SerializationFailure()]))
+    retries = _retries("TravelPost")
+
+    TravelPost.sql("UPDATE travel_posts SET likes_count = likes_count + 1 WHERE id = %(post_id)s", {"post_id": 1})
+
+    assert len(pool.executed) == 2
+    assert _retries("TravelPost") == retries + 1
+
+
+def test_pipeline_retries_follow_the_same_rules_and_are_counted(install):
+    pool = install(FakePool(commit_errors=[psycopg.OperationalError("server closed the connection unexpectedly")]))
+    with pytest.raises(psycopg.OperationalError):
+        with table.Table.pipeline() as pipe:
+            pipe.sql(TravelPost, "UPDATE travel_posts SET saves_count = saves_count + 1 WHERE id = %(post_id)s", {"post_id": 1})
+    assert len(pool.executed) == 1
+
+    pool = install(FakePool(execute_errors=[errors.DeadlockDetected()]))
+    retries = _retries("TravelPost")
+    with table.Table.pipeline() as pipe:
+        pipe.sql(TravelPost, "UPDATE travel_posts SET saves_count = saves_count + 1 WHERE id = %(post_id)s", {"post_id": 1})
+    assert len(pool.executed) == 2
+    assert _retries("TravelPost") == retries + 1
@@ -0,0 +1,80 @@
+"""Bucket hashing, shard ranges and Table routing of solar.sharding, with shards set on the module."""
+
+import uuid
+
+import pytest
+
+from core.post_like import PostLike
+from core.travel_post import TravelPost
+from solar import sharding
+from solar.config import config
+
+
+def _use_shards(monkeypatch, count):
+    keys = [f"PG_SHARD_{number}" for number in range(count)]
+    monkeypatch.setattr(sharding, "_shard_keys", keys)
+    return keys
+
+
+def test_uuid_and_its_string_form_hash_to_the_same_bucket():
+    for _ in range(100):
+        value = uuid.uuid4()
+        assert sharding.bucket_for(value) == sharding.bucket_for(str(value))
+        assert 0 <= sharding.bucket_for(value) < sharding.SHARD_BUCKETS
+
+
+def test_doubling_the_shards_splits_each_range_in_two(monkeypatch):
+    values = [uuid.uuid4() for _ in range(2000)]
+    before_keys = _use_shards(monkeypatch, 4)
+    before = {value: before_keys.index(sharding.shard_for(value)) for value in values}
+    after_keys = _use_shards(monkeypatch, 8)
+    after = {value: after_keys.index(sharding.shard_for(value)) for value in values}
+
+    # Shard n's rows move only to shard 2n or 2n + 1: nothing is reshuffled between old shards
+    for value in values:
+        assert after[value] // 2 == before[value]
+    assert set(after.values()) == set(range(8))
+
+
+def test_group_by_shard_puts_each_value_on_its_shard(monkeypatch):
+    _use_shards(monkeypatch, 4)
+    values = [uuid.uuid4() for _ in range(200)]
+
+    groups = sharding.group_by_shard(PostLike, values)
+
+    assert sorted(value for group in groups.values() for value in group) == sorted(values)
+    for shard, group in groups.items():
+        assert all(sharding.shard_for(value) == shard for value in group)
+
+
+def test_group_by_shard_is_one_group_without_shards(monkeypatch):
+    _use_shards(monkeypatch, 0)
+    values = [uuid.uuid4() for _ in range(3)]
+
+    assert sharding.group_by_shard(PostLike, values) == {None: values}
+    assert sharding.group_by_shard(PostLike, []) == {}
+
+
+def test_sharded_table_routes_by_shard_key(monkeypatch):
+    _use_shards(monkeypatch, 4)
+    post_id = uuid.uuid4()
+
+    assert PostLike._get_pg_key({"post_id": post_id}) == sharding.shard_for(post_id)
+    assert PostLike._get_pg_key({"post_id": post_id}, shard="PG_SHARD_3") == "PG_SHARD_3"
+    # Tables without a shard key stay on their database
+    assert TravelPost._get_pg_key({"post_id": post_id}) == config.get_pg_key_for_table("TravelPost")
+
+
+def test_sharded_table_without_shard_key_in_params_is_an_error(monkeypatch):
+    _use_shards(monkeypatch, 4)
+
+    with pytest.raises(ValueError, match="post_id"):
+        PostLike._get_pg_key({"user_id": uuid.uuid4()})
+    with pytest.raises(ValueError):
+        PostLike._get_pg_key(None)
+
+
+def test_sharded_table_falls_back_to_its_database_without_shards(monkeypatch):
+    _use_shards(monkeypatch, 0)
+
+    assert PostLike._get_pg_key({"user_id": uuid.uuid4()}) == config.get_pg_key_for_table("PostLike")
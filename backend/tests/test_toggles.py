@@ -0,0 +1,157 @@
+"""Concurrent like toggles against an in-memory fake of the statements like_post sends."""
+
+import re
+import threading
+import time
+import uuid
+
+from core import social_services
+from core.post_like import PostLike
+from solar import table
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.post_likes = {}  # id -> row
+        self.likes_count = {}  # post id -> count
+        self.advisory_locks = {}
+        self.guard = threading.Lock()
+
+    def advisory_lock(self, key):
+        with self.guard:
+            lock = self.advisory_locks.setdefault(key, threading.Lock())
+        lock.acquire()
+        return lock
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.rowcount = 0
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, params=None):
+        db = self.conn.db
+        self.description, self._rows = None, []
+        if "pg_advisory_xact_lock" in statement:
+            self.conn.held_locks.append(db.advisory_lock(params["lock_key"]))
+            self._result([{"pg_advisory_xact_lock": None}])
+        elif statement.startswith("SELECT * FROM post_likes"):
+            rows = [
+                dict(row) for row in db.post_likes.values()
+                if str(row["user_id"]) == str(params["user_id"]) and str(row["post_id"]) == str(params["post_id"])
+            ]
+            # Widen the window between the existence check and the write
+            time.sleep(0.05)
+            self._result(rows)
+        elif "INSERT INTO post_likes" in statement:
+            columns = [c.strip() for c in re.search(r"\(([^)]*)\)", statement).group(1).split(",")]
+            row = dict(zip(columns, params))
+            db.post_likes[str(row["id"])] = row
+        elif statement.startswith("UPDATE travel_posts SET likes_count = GREATEST(likes_count + %(delta)s, 0)"):
+            with db.guard:
+                post_id = str(params["post_id"])
+                db.likes_count[post_id] = max(db.likes_count.get(post_id, 0) + params["delta"], 0)
+                self._result([{"likes_count": db.likes_count[post_id]}])
+        else:
+            raise AssertionError(f"Unexpected statement: {statement}")
+
+    def _result(self, rows):
+        self.description = [("column",)]
+        self._rows = rows
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.held_locks = []
+        self.isolation_level = None
+        self.read_only = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def execute(self, statement):
+        pass
+
+    def commit(self):
+        self._release_locks()
+
+    def rollback(self):
+        self._release_locks()
+
+    def _release_locks(self):
+        while self.held_locks:
+            self.held_locks.pop().release()
+
+
+class FakePool:
+    def __init__(self, db):
+        self.db = db
+
+    def getconn(self):
+        return FakeConnection(self.db)
+
+    def putconn(self, conn):
+        pass
+
+
+class FakePools(dict):
+    """Every database name maps to the same fake pool."""
+
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+
+    def __contains__(self, pg_key):
+        return True
+
+    def __getitem__(self, pg_key):
+        return self.pool
+
+
+def _run_concurrently(*calls):
+    threads = [threading.Thread(target=fn, args=args) for fn, *args in calls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _install(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(table, "get_pool", lambda reset=False: FakePools(FakePool(db)))
+    return db
+
+
+def test_double_tap_on_a_new_like_creates_one_row(monkeypatch):
+    db = _install(monkeypatch)
+    user_id, post_id = uuid.uuid4(), uuid.uuid4()
+
+    _run_concurrently((social_services.like_post, user_id, post_id), (social_services.like_post, user_id, post_id))
+
+    # The second tap sees the first one's row and toggles it off instead of inserting again
+    (like,) = db.post_likes.values()
+    assert PostLike(**like).is_active is False
+    assert db.likes_count[str(post_id)] == 0
+
+
+def test_concurrent_likes_by_different_users_are_all_counted(monkeypatch):
+    db = _install(monkeypatch)
+    post_id = uuid.uuid4()
+    users = [uuid.uuid4() for _ in range(4)]
+
+    _run_concurrently(*[(social_services.like_post, user_id, post_id) for user_id in users])
+
+    assert len(db.post_likes) == len(users)
+    assert db.likes_count[str(post_id)] == len(users)
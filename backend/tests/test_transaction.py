@@ -0,0 +1,59 @@
+"""Savepoint semantics of Table.transaction across several databases, against fake pools."""
+
+from solar import table
+
+
+class FakeConnection:
+    def __init__(self, pg_key):
+        self.pg_key = pg_key
+        self.statements = []
+        self.committed = False
+        self.rolled_back = False
+        self.isolation_level = None
+        self.read_only = None
+
+    def execute(self, statement):
+        self.statements.append(statement)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+class FakePool:
+    def __init__(self, pg_key):
+        self.pg_key = pg_key
+        self.connections = []
+
+    def getconn(self):
+        conn = FakeConnection(self.pg_key)
+        self.connections.append(conn)
+        return conn
+
+    def putconn(self, conn):
+        pass
+
+
+def test_failed_sibling_savepoint_keeps_earlier_sibling_work(monkeypatch):
+    pools = {"SHARD_0": FakePool("SHARD_0"), "SHARD_1": FakePool("SHARD_1")}
+    monkeypatch.setattr(table, "get_pool", lambda reset=False: pools)
+
+    with table.Table.transaction() as transaction:
+        with table.Table.transaction():
+            # First opened inside this savepoint, which then succeeds
+            shard_0, _ = transaction.connection("SHARD_0")
+        try:
+            with table.Table.transaction():
+                transaction.connection("SHARD_1")
+                raise RuntimeError("second savepoint fails")
+        except RuntimeError:
+            pass
+
+    # The shard-0 work survives the failed sibling and is committed with the outer block
+    assert shard_0.committed and not shard_0.rolled_back
+    assert shard_0.statements == ["SAVEPOINT solar_sp1", "ROLLBACK TO SAVEPOINT solar_sp1"]
+    # The connection opened by the failing block is discarded
+    (shard_1,) = pools["SHARD_1"].connections
+    assert shard_1.rolled_back and not shard_1.committed
@@ -0,0 +1,45 @@
+"""Isolating failing Clerk events when a claimed batch can't be applied as a whole."""
+
+from datetime import datetime
+
+from core import webhook_inbox
+from core.webhook_event import WebhookEvent
+
+
+def _event(svix_id, event_type, clerk_user_id):
+    return WebhookEvent(
+        svix_id=svix_id,
+        event_type=event_type,
+        payload={"type": event_type, "data": {"id": clerk_user_id}},
+        received_at=datetime.now(),
+    )
+
+
+def test_one_bad_user_only_holds_back_its_own_events(monkeypatch):
+    events = [
+        _event("a1", "user.created", "user_a"),
+        _event("b1", "user.created", "user_b"),
+        _event("a2", "user.updated", "user_a"),
+        _event("c1", "user.deleted", "user_c"),
+    ]
+    batches = []
+
+    def apply(user_events):
+        batches.append([event.svix_id for event in user_events])
+        if webhook_inbox._clerk_user_id(user_events[0]) == "user_b":
+            raise ValueError("bad payload")
+        return {
+            "created": sum(event.event_type == "user.created" for event in user_events),
+            "updated": 0,
+            "deleted": sum(event.event_type == "user.deleted" for event in user_events),
+        }
+
+    monkeypatch.setattr(webhook_inbox, "apply_clerk_events", apply)
+
+    summary, applied, failed = webhook_inbox.apply_clerk_events_per_user(events)
+
+    # Each user's events stay together and in order
+    assert batches == [["a1", "a2"], ["b1"], ["c1"]]
+    assert applied == ["a1", "a2", "c1"]
+    assert failed == [(["b1"], "bad payload")]
+    assert summary == {"created": 1, "updated": 0, "deleted": 1}